@@ -0,0 +1,32 @@
+"""add search_vector column to media
+
+Revision ID: 3f8a61c2d9e7
+Revises: e9b27c4d1a35
+Create Date: 2026-10-18 15:40:22.618204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a61c2d9e7'
+down_revision = 'e9b27c4d1a35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a stored generated column, so postgres keeps it up to date on every INSERT and UPDATE
+    op.execute('''
+        ALTER TABLE media ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(medianame, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        ) STORED
+    ''')
+    op.create_index('ix_media_search_vector', 'media', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_media_search_vector', 'media')
+    op.drop_column('media', 'search_vector')
@@ -0,0 +1,27 @@
+"""add medianame trigram index to media
+
+Revision ID: 4b7d2e90c5a1
+Revises: 3f8a61c2d9e7
+Create Date: 2026-10-18 17:12:05.904318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7d2e90c5a1'
+down_revision = '3f8a61c2d9e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm ships with postgres' contrib package, creating it needs a role allowed to create extensions
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX ix_media_medianame_trgm ON media USING gin (medianame gin_trgm_ops)')
+
+
+def downgrade():
+    op.drop_index('ix_media_medianame_trgm', 'media')
+    # the extension is left installed, other database objects may have come to use it
@@ -0,0 +1,29 @@
+"""scope the medianame trigram index to the user
+
+Revision ID: 6d3b9f1e2a47
+Revises: e4a7c9d25f16
+Create Date: 2026-10-18 21:04:37.218664
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d3b9f1e2a47'
+down_revision = 'e4a7c9d25f16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # btree_gist gives gist an operator class for the integer "user" key, it ships with postgres' contrib package too
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('CREATE INDEX ix_media_user_medianame_trgm ON media USING gist ("user", medianame gist_trgm_ops)')
+    op.drop_index('ix_media_medianame_trgm', 'media')
+
+
+def downgrade():
+    op.execute('CREATE INDEX ix_media_medianame_trgm ON media USING gin (medianame gin_trgm_ops)')
+    op.drop_index('ix_media_user_medianame_trgm', 'media')
+    # the extension is left installed, other database objects may have come to use it
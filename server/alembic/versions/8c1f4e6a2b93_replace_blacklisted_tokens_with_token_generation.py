@@ -0,0 +1,61 @@
+"""replace blacklisted_tokens with token_generation column in users
+
+Revision ID: 8c1f4e6a2b93
+Revises: 4b7d2e90c5a1
+Create Date: 2026-10-18 21:04:17.532806
+
+"""
+import base64
+import binascii
+import time
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1f4e6a2b93'
+down_revision = '4b7d2e90c5a1'
+branch_labels = None
+depends_on = None
+
+
+def token_claims(token):
+    # the payload of a JWT, without checking its signature (every row was a valid token when it was blacklisted)
+    try:
+        payload = token.split('.')[1]
+        return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)).decode('utf-8'))
+    except (IndexError, ValueError, binascii.Error):
+        return None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('token_generation', sa.Integer, nullable=False, server_default='0'))
+
+    # tokens issued before this migration have no 'gen' claim, which counts as generation 0, so they keep working.
+    # Users with a blacklisted token that hasn't expired yet start at generation 1 instead, which logs out every token
+    # issued to them before the migration (including the blacklisted one)
+    connection = op.get_bind()
+    now = time.time()
+    user_ids = set()
+    for row in connection.execute(sa.text('SELECT token FROM blacklisted_tokens')):
+        claims = token_claims(row.token)
+        if claims is not None and claims.get('exp', 0) > now and 'sub' in claims:
+            user_ids.add(claims['sub'])
+
+    if user_ids:
+        connection.execute(sa.text('UPDATE users SET token_generation = 1 WHERE id = ANY(:user_ids)'),
+                           user_ids=sorted(user_ids))
+
+    op.drop_table('blacklisted_tokens')
+
+
+def downgrade():
+    op.create_table(
+        'blacklisted_tokens',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('token', sa.String(500), unique=True, nullable=False),
+        sa.Column('blacklisted_on', sa.DateTime, nullable=False)
+    )
+    op.drop_column('users', 'token_generation')
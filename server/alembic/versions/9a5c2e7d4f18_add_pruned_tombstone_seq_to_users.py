@@ -0,0 +1,27 @@
+"""add pruned_tombstone_seq column to users, and deleted_at index to media_tombstones
+
+Revision ID: 9a5c2e7d4f18
+Revises: 6d3b9f1e2a47
+Create Date: 2026-10-18 22:15:42.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a5c2e7d4f18'
+down_revision = '6d3b9f1e2a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # no tombstone has been pruned yet, so every earlier seq can still be synced from
+    op.add_column('users', sa.Column('pruned_tombstone_seq', sa.BigInteger, nullable=False, server_default='0'))
+    op.create_index('ix_media_tombstones_deleted_at', 'media_tombstones', ['deleted_at'])
+
+
+def downgrade():
+    op.drop_index('ix_media_tombstones_deleted_at', 'media_tombstones')
+    op.drop_column('users', 'pruned_tombstone_seq')
@@ -0,0 +1,25 @@
+"""add user/medium/consumed_state/order index to media
+
+Revision ID: a1c3e5f70b21
+Revises: bdc68ba685c5
+Create Date: 2026-10-18 09:12:40.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f70b21'
+down_revision = 'bdc68ba685c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_media_user_medium_consumed_state_order', 'media',
+                    ['user', 'medium', 'consumed_state', 'order'])
+
+
+def downgrade():
+    op.drop_index('ix_media_user_medium_consumed_state_order', 'media')
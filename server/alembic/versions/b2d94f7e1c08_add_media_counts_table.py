@@ -0,0 +1,40 @@
+"""add media_counts table
+
+Revision ID: b2d94f7e1c08
+Revises: 8c1f4e6a2b93
+Create Date: 2026-10-18 22:37:51.104688
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d94f7e1c08'
+down_revision = '8c1f4e6a2b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'media_counts',
+        sa.Column('user', sa.Integer, sa.ForeignKey('users.id'), primary_key=True),
+        sa.Column('medium', postgresql.ENUM(name='medium_type', create_type=False), primary_key=True),
+        sa.Column('consumed_state', postgresql.ENUM(name='consumed_state_type', create_type=False), primary_key=True),
+        sa.Column('count', sa.Integer, nullable=False)
+    )
+
+    # the same as logic.media_count.rebuild_media_counts
+    op.execute('LOCK TABLE media IN SHARE MODE')
+    op.execute('''
+        INSERT INTO media_counts ("user", medium, consumed_state, count)
+        SELECT "user", medium, consumed_state, count(*) FROM media
+        WHERE "user" IS NOT NULL
+        GROUP BY "user", medium, consumed_state
+    ''')
+
+
+def downgrade():
+    op.drop_table('media_counts')
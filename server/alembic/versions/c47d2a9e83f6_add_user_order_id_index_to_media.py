@@ -0,0 +1,24 @@
+"""add user/order/id index to media
+
+Revision ID: c47d2a9e83f6
+Revises: a1c3e5f70b21
+Create Date: 2026-10-18 10:03:17.552904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47d2a9e83f6'
+down_revision = 'a1c3e5f70b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_media_user_order_id', 'media', ['user', 'order', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_media_user_order_id', 'media')
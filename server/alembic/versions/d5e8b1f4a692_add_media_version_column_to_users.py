@@ -0,0 +1,24 @@
+"""add media_version column to users
+
+Revision ID: d5e8b1f4a692
+Revises: c47d2a9e83f6
+Create Date: 2026-10-18 11:26:05.803114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e8b1f4a692'
+down_revision = 'c47d2a9e83f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('media_version', sa.Integer, nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('users', 'media_version')
@@ -0,0 +1,50 @@
+"""add seq and updated_at columns to media, and media_tombstones table
+
+Revision ID: e4a7c9d25f16
+Revises: b2d94f7e1c08
+Create Date: 2026-10-18 23:48:09.661420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c9d25f16'
+down_revision = 'b2d94f7e1c08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(sa.schema.CreateSequence(sa.Sequence('media_seq')))
+
+    # existing media get seqs in id order, so a client's first delta sync (since=0) gets every one of them
+    op.add_column('media', sa.Column('seq', sa.BigInteger))
+    op.add_column('media', sa.Column('updated_at', sa.DateTime(timezone=True)))
+    op.execute('''
+        UPDATE media SET seq = ordered.seq, updated_at = now()
+        FROM (SELECT id, nextval('media_seq') AS seq FROM (SELECT id FROM media ORDER BY id) AS ids) AS ordered
+        WHERE media.id = ordered.id
+    ''')
+    op.alter_column('media', 'seq', nullable=False, server_default=sa.text('nextval(\'media_seq\')'))
+    op.alter_column('media', 'updated_at', nullable=False, server_default=sa.func.now())
+    op.create_index('ix_media_user_seq', 'media', ['user', 'seq'])
+
+    op.create_table(
+        'media_tombstones',
+        sa.Column('id', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('user', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('seq', sa.BigInteger, nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=False)
+    )
+    op.create_index('ix_media_tombstones_user_seq', 'media_tombstones', ['user', 'seq'])
+
+
+def downgrade():
+    op.drop_index('ix_media_tombstones_user_seq', 'media_tombstones')
+    op.drop_table('media_tombstones')
+    op.drop_index('ix_media_user_seq', 'media')
+    op.drop_column('media', 'updated_at')
+    op.drop_column('media', 'seq')
+    op.execute(sa.schema.DropSequence(sa.Sequence('media_seq')))
@@ -0,0 +1,53 @@
+"""add rank column to media
+
+Revision ID: e9b27c4d1a35
+Revises: d5e8b1f4a692
+Create Date: 2026-10-18 14:12:41.290317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9b27c4d1a35'
+down_revision = 'd5e8b1f4a692'
+branch_labels = None
+depends_on = None
+
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+
+def rank_for_order_sql(column):
+    """
+    rank_for_order_sql returns a SQL expression computing fractional_rank.rank_for_order (as it was when this migration
+    was written) of an order column: its value shifted up by 2 ** 31, as 6 base 62 digits, and a middle digit
+    """
+    digits = ['substr(\'{}\', (({} + 2147483648) / {} % {})::integer + 1, 1)'.format(
+        ALPHABET, column, len(ALPHABET) ** power, len(ALPHABET)) for power in reversed(range(6))]
+    return ' || '.join(digits + ['\'{}\''.format(ALPHABET[len(ALPHABET) // 2])])
+
+
+def upgrade():
+    op.add_column('media', sa.Column('rank', sa.String(collation='C')))
+
+    # media keep their place in each list, since rank_for_order sorts the same as order. One UPDATE computes every
+    # rank, so the table is scanned once
+    op.execute('UPDATE media SET "order" = 0 WHERE "order" IS NULL')
+    op.execute('UPDATE media SET rank = {}'.format(rank_for_order_sql('"order"::bigint')))
+
+    op.alter_column('media', 'rank', nullable=False)
+
+    op.create_index('ix_media_user_rank_id', 'media', ['user', 'rank', 'id'])
+    op.create_index('ix_media_user_medium_consumed_state_rank', 'media', ['user', 'medium', 'consumed_state', 'rank'])
+    op.drop_index('ix_media_user_order_id', 'media')
+    op.drop_index('ix_media_user_medium_consumed_state_order', 'media')
+
+
+def downgrade():
+    op.create_index('ix_media_user_medium_consumed_state_order', 'media',
+                    ['user', 'medium', 'consumed_state', 'order'])
+    op.create_index('ix_media_user_order_id', 'media', ['user', 'order', 'id'])
+    op.drop_index('ix_media_user_medium_consumed_state_rank', 'media')
+    op.drop_index('ix_media_user_rank_id', 'media')
+    op.drop_column('media', 'rank')
@@ -1,9 +1,17 @@
 import os
 from flask import Flask
 from flask_cors import CORS
-from database import db
+from database import db, engine_options, warm_pool
 
 from routes import add_routes
+from logic.token_cache import token_cache, token_generations
+from password_hashing import password_hasher
+from query_stats import init_query_stats
+from metrics import init_metrics
+from logic.media_cache import media_cache, LRUCacheBackend, SharedCacheBackend, parse_media_cache_address
+from logic.media_rank import rank_renormalizer
+from logic.autocomplete_cache import autocomplete_cache
+from models.media import create_trigram_index
 
 
 ENVIRONMENT = os.environ.get('ENVIRONMENT', 'local')
@@ -19,6 +27,85 @@ DB_USER = os.environ.get('DB_USER')
 DB_PASS = os.environ.get('DB_PASS')
 DB_NAME = os.environ.get('DB_NAME')
 
+# each worker has a pool of DB_POOL_SIZE connections (one per gunicorn thread by default) and opens at most
+# DB_MAX_OVERFLOW more under load, so postgres needs WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+# A request waits at most DB_POOL_TIMEOUT seconds for a connection, and then gets a 503
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', os.environ.get('GUNICORN_THREADS', 8)))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+
+# in milliseconds, 0 turns the timeout off
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+DB_IDLE_IN_TRANSACTION_TIMEOUT = int(os.environ.get('DB_IDLE_IN_TRANSACTION_TIMEOUT', 60000))
+
+# production schemas are managed by alembic, set DB_CREATE_ALL to have create_app create missing tables instead (and
+# the autocomplete trigram index, if pg_trgm and btree_gist are available)
+DB_CREATE_ALL = os.environ.get('DB_CREATE_ALL', 'false').lower() in ('1', 'true', 'yes')
+# each worker opens DB_POOL_WARM connections before it takes its first request
+DB_POOL_WARM = int(os.environ.get('DB_POOL_WARM', 0))
+
+# set when DB_HOST is a transaction pooling proxy (like pgbouncer in transaction mode), see database.engine_options
+DB_TRANSACTION_POOLING = os.environ.get('DB_TRANSACTION_POOLING', 'false').lower() in ('1', 'true', 'yes')
+
+# verified auth tokens are cached per worker for at most AUTH_TOKEN_CACHE_TTL seconds
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 30))
+
+# users' token generations are cached per worker for AUTH_TOKEN_GENERATION_TTL seconds, so a logout through another
+# worker is seen by this worker within that many seconds
+AUTH_TOKEN_GENERATION_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_GENERATION_CACHE_SIZE', 100000))
+AUTH_TOKEN_GENERATION_TTL = float(os.environ.get('AUTH_TOKEN_GENERATION_TTL', 5))
+
+# bcrypt runs in a pool of PASSWORD_HASHING_WORKERS processes per worker, with at most PASSWORD_HASHING_QUEUE hashes
+# waiting, after that /login and /register respond with 503. 0 workers runs bcrypt on the request thread
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', 2))
+PASSWORD_HASHING_QUEUE = int(os.environ.get('PASSWORD_HASHING_QUEUE', 4))
+
+# send the query count, total db time and slowest query of each request back in a Server-Timing header
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+
+# media list GET responses are cached 'local'ly in each worker, in a 'shared' cache process (media_cache_server.py) at
+# MEDIA_CACHE_ADDRESS, or not at all ('none')
+MEDIA_CACHE = os.environ.get('MEDIA_CACHE', 'local')
+MEDIA_CACHE_MAX_BYTES = int(os.environ.get('MEDIA_CACHE_MAX_BYTES', 64 * 2 ** 20))
+MEDIA_CACHE_ADDRESS = os.environ.get('MEDIA_CACHE_ADDRESS', '127.0.0.1:11311')
+MEDIA_CACHE_AUTHKEY = os.environ.get('MEDIA_CACHE_AUTHKEY')
+MEDIA_CACHE_STALE_WHILE_REVALIDATE = os.environ.get('MEDIA_CACHE_STALE_WHILE_REVALIDATE', 'false').lower() in \
+    ('1', 'true', 'yes')
+
+# after a move leaves a media element with the same order as a neighbour, or a rank longer than MEDIA_RANK_MAX_LENGTH,
+# the user's media list is renormalized MEDIA_RANK_RENORMALIZE_DELAY seconds later (0 renormalizes during the move)
+MEDIA_RANK_MAX_LENGTH = int(os.environ.get('MEDIA_RANK_MAX_LENGTH', 24))
+MEDIA_RANK_RENORMALIZE_DELAY = float(os.environ.get('MEDIA_RANK_RENORMALIZE_DELAY', 5))
+
+# media searches return MEDIA_SEARCH_LIMIT matches per page unless they ask for another limit
+MEDIA_SEARCH_LIMIT = int(os.environ.get('MEDIA_SEARCH_LIMIT', 20))
+MEDIA_SEARCH_MAX_LENGTH = int(os.environ.get('MEDIA_SEARCH_MAX_LENGTH', 200))
+
+# media event streams (only served by the ASGI app) send a comment every MEDIA_EVENTS_KEEPALIVE seconds, so proxies
+# don't close them, and end after MEDIA_EVENTS_MAX_AGE seconds, so clients reconnect (and send their auth token again)
+MEDIA_EVENTS_KEEPALIVE = float(os.environ.get('MEDIA_EVENTS_KEEPALIVE', 15))
+MEDIA_EVENTS_MAX_AGE = float(os.environ.get('MEDIA_EVENTS_MAX_AGE', 300))
+# each ASGI worker LISTENs for media changes on a connection to MEDIA_EVENTS_DATABASE_URI (default the database). LISTEN
+# doesn't work through a transaction pooling proxy, so with DB_TRANSACTION_POOLING point it at postgres itself
+MEDIA_EVENTS_DATABASE_URI = os.environ.get('MEDIA_EVENTS_DATABASE_URI')
+
+# prune_media_tombstones.py deletes the tombstones of media deleted more than MEDIA_TOMBSTONE_RETENTION_DAYS ago, delta
+# syncs from before them get the whole list again
+MEDIA_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('MEDIA_TOMBSTONE_RETENTION_DAYS', 30))
+
+# autocomplete returns AUTOCOMPLETE_LIMIT suggestions unless it's asked for another limit (up to
+# AUTOCOMPLETE_MAX_LIMIT), and none for a q shorter than AUTOCOMPLETE_MIN_LENGTH. Each worker caches the suggestions
+# for the last AUTOCOMPLETE_CACHE_PREFIXES prefixes of AUTOCOMPLETE_CACHE_USERS users (0 users turns the cache off)
+AUTOCOMPLETE_LIMIT = int(os.environ.get('AUTOCOMPLETE_LIMIT', 10))
+AUTOCOMPLETE_MAX_LIMIT = int(os.environ.get('AUTOCOMPLETE_MAX_LIMIT', 50))
+AUTOCOMPLETE_MIN_LENGTH = int(os.environ.get('AUTOCOMPLETE_MIN_LENGTH', 2))
+AUTOCOMPLETE_MAX_LENGTH = int(os.environ.get('AUTOCOMPLETE_MAX_LENGTH', 80))
+AUTOCOMPLETE_CACHE_USERS = int(os.environ.get('AUTOCOMPLETE_CACHE_USERS', 1000))
+AUTOCOMPLETE_CACHE_PREFIXES = int(os.environ.get('AUTOCOMPLETE_CACHE_PREFIXES', 64))
+
 
 def create_app(test=False):
     app = Flask(__name__)
@@ -34,18 +121,110 @@ def create_app(test=False):
 
     app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['DB_POOL_SIZE'] = DB_POOL_SIZE
+    app.config['DB_MAX_OVERFLOW'] = DB_MAX_OVERFLOW
+    app.config['DB_POOL_TIMEOUT'] = DB_POOL_TIMEOUT
+    app.config['DB_POOL_RECYCLE'] = DB_POOL_RECYCLE
+    app.config['DB_POOL_PRE_PING'] = DB_POOL_PRE_PING
+    app.config['DB_STATEMENT_TIMEOUT'] = DB_STATEMENT_TIMEOUT
+    app.config['DB_IDLE_IN_TRANSACTION_TIMEOUT'] = DB_IDLE_IN_TRANSACTION_TIMEOUT
+    app.config['DB_TRANSACTION_POOLING'] = DB_TRANSACTION_POOLING
+    # tests create their tables in setUp
+    app.config['DB_CREATE_ALL'] = False if test else DB_CREATE_ALL
+    app.config['DB_POOL_WARM'] = DB_POOL_WARM
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     app.config['TESTING'] = test
     app.config['LOGIN_DISABLED'] = test
     app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+    app.config['AUTH_TOKEN_CACHE_SIZE'] = AUTH_TOKEN_CACHE_SIZE
+    app.config['AUTH_TOKEN_CACHE_TTL'] = AUTH_TOKEN_CACHE_TTL
+    app.config['AUTH_TOKEN_GENERATION_CACHE_SIZE'] = AUTH_TOKEN_GENERATION_CACHE_SIZE
+    app.config['AUTH_TOKEN_GENERATION_TTL'] = AUTH_TOKEN_GENERATION_TTL
+    app.config['PASSWORD_HASHING_WORKERS'] = 0 if test else PASSWORD_HASHING_WORKERS
+    app.config['PASSWORD_HASHING_QUEUE'] = PASSWORD_HASHING_QUEUE
+    app.config['SERVER_TIMING'] = SERVER_TIMING
+    # tests add media straight through the session, which doesn't bump media_version, so don't cache for them
+    app.config['MEDIA_CACHE'] = 'none' if test else MEDIA_CACHE
+    app.config['MEDIA_CACHE_MAX_BYTES'] = MEDIA_CACHE_MAX_BYTES
+    app.config['MEDIA_CACHE_ADDRESS'] = MEDIA_CACHE_ADDRESS
+    app.config['MEDIA_CACHE_AUTHKEY'] = MEDIA_CACHE_AUTHKEY
+    app.config['MEDIA_CACHE_STALE_WHILE_REVALIDATE'] = MEDIA_CACHE_STALE_WHILE_REVALIDATE
+    app.config['MEDIA_RANK_MAX_LENGTH'] = MEDIA_RANK_MAX_LENGTH
+    # tests check the renormalized list right after a move
+    app.config['MEDIA_RANK_RENORMALIZE_DELAY'] = 0 if test else MEDIA_RANK_RENORMALIZE_DELAY
+    app.config['MEDIA_SEARCH_LIMIT'] = MEDIA_SEARCH_LIMIT
+    app.config['MEDIA_SEARCH_MAX_LENGTH'] = MEDIA_SEARCH_MAX_LENGTH
+    app.config['MEDIA_EVENTS_KEEPALIVE'] = MEDIA_EVENTS_KEEPALIVE
+    app.config['MEDIA_EVENTS_MAX_AGE'] = MEDIA_EVENTS_MAX_AGE
+    app.config['MEDIA_EVENTS_DATABASE_URI'] = database_uri if test else MEDIA_EVENTS_DATABASE_URI or database_uri
+    app.config['MEDIA_TOMBSTONE_RETENTION_DAYS'] = MEDIA_TOMBSTONE_RETENTION_DAYS
+    app.config['AUTOCOMPLETE_LIMIT'] = AUTOCOMPLETE_LIMIT
+    app.config['AUTOCOMPLETE_MAX_LIMIT'] = AUTOCOMPLETE_MAX_LIMIT
+    app.config['AUTOCOMPLETE_MIN_LENGTH'] = AUTOCOMPLETE_MIN_LENGTH
+    app.config['AUTOCOMPLETE_MAX_LENGTH'] = AUTOCOMPLETE_MAX_LENGTH
+    # like the media cache, tests add media without bumping media_version
+    app.config['AUTOCOMPLETE_CACHE_USERS'] = 0 if test else AUTOCOMPLETE_CACHE_USERS
+    app.config['AUTOCOMPLETE_CACHE_PREFIXES'] = AUTOCOMPLETE_CACHE_PREFIXES
+
+    token_cache.configure(app.config['AUTH_TOKEN_CACHE_SIZE'], app.config['AUTH_TOKEN_CACHE_TTL'])
+    token_generations.configure(app.config['AUTH_TOKEN_GENERATION_CACHE_SIZE'],
+                                app.config['AUTH_TOKEN_GENERATION_TTL'])
+    password_hasher.configure(app.config['PASSWORD_HASHING_WORKERS'], app.config['PASSWORD_HASHING_QUEUE'])
+    media_cache.configure(create_media_cache_backend(app.config), app.config['MEDIA_CACHE_STALE_WHILE_REVALIDATE'])
+    rank_renormalizer.configure(app.config['MEDIA_RANK_RENORMALIZE_DELAY'])
+    autocomplete_cache.configure(app.config['AUTOCOMPLETE_CACHE_USERS'], app.config['AUTOCOMPLETE_CACHE_PREFIXES'])
 
     add_routes(app)
+    init_query_stats(app)
+    init_metrics(app)
 
+    # nothing here touches the database, so importing the app (in every gunicorn worker, test module and alembic run)
+    # is cheap
     db.init_app(app)
-    db.create_all(app=app)
+    if app.config['DB_CREATE_ALL']:
+        db.create_all(app=app)
+        with app.app_context():
+            create_trigram_index(db.engine)
 
     return app
 
 
+def warm_up(app):
+    """
+    warm_up opens DB_POOL_WARM pooled connections, and creates the password hashing pool, so the first requests a worker
+    takes don't wait on them. Called by gunicorn.conf.py after each worker loads the app, before its request threads
+    start
+    """
+    with app.app_context():
+        warm_pool(db.engine, app.config['DB_POOL_WARM'])
+        db.session.remove()
+    password_hasher.start()
+
+
+def dispose_engine(app):
+    """
+    dispose_engine closes every pooled connection. With gunicorn --preload it's called in the master process before
+    forking, so no worker shares a connection (socket) with the master or another worker
+    """
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def create_media_cache_backend(config):
+    if config['MEDIA_CACHE'] == 'local':
+        return LRUCacheBackend(config['MEDIA_CACHE_MAX_BYTES'])
+    elif config['MEDIA_CACHE'] == 'shared':
+        # the cache process exchanges pickles with the workers, so it only talks to clients that know this key
+        if not config['MEDIA_CACHE_AUTHKEY']:
+            raise ValueError('MEDIA_CACHE_AUTHKEY has to be set when MEDIA_CACHE is \'shared\'')
+        return SharedCacheBackend(parse_media_cache_address(config['MEDIA_CACHE_ADDRESS']),
+                                  config['MEDIA_CACHE_AUTHKEY'].encode('utf-8'))
+    elif config['MEDIA_CACHE'] == 'none':
+        return None
+    raise ValueError('MEDIA_CACHE must be \'local\', \'shared\', or \'none\'')
+
+
 app = create_app()
 
 if __name__ == '__main__':
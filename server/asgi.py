@@ -0,0 +1,337 @@
+"""
+asgi is the async entry point of the server, run it with an ASGI server, e.g. `uvicorn asgi:app --workers 4`.
+
+It serves the same routes as the Flask app (see routes.add_routes). Requests for a view with an async version in
+routes.ASYNC_VIEWS are handled on the event loop, with asyncpg (see async_database.py) and bcrypt in an executor, so a
+request waiting on postgres or bcrypt doesn't hold a thread. Every other request (and any request an async view hands
+back by returning None) is run by the Flask app on a pool of ASGI_WSGI_THREADS threads.
+
+An async view can also return a response whose body is an async iterator (like the media event streams, see
+views.media.media_events_async), which is sent as it's produced until it ends or the client disconnects, and then
+closed.
+"""
+import asyncio
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+from flask import json
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import HTTPException, InternalServerError
+from werkzeug.http import parse_etags
+from werkzeug.urls import url_decode
+
+from app import create_app
+from async_database import async_db
+from database import db
+from logic.media_events import media_event_broker
+from metrics import REQUESTS_IN_FLIGHT, observe_request
+from password_hashing import password_hasher
+from routes import ASYNC_VIEWS
+from views.errors import database_busy
+
+# Flask views (the ones without an async version) run on this many threads per worker
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 8))
+
+
+class AsyncRequest:
+    """
+    AsyncRequest is the request passed to async views, with the parts of flask.request they use
+    """
+    def __init__(self, app, scope, body, executor):
+        self.app = app
+        self.scope = scope
+        self.body = body
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = url_decode(scope.get('query_string', b''))
+        self.headers = Headers([(name.decode('latin-1'), value.decode('latin-1'))
+                                for name, value in scope.get('headers', [])])
+        self.if_none_match = parse_etags(self.headers.get('If-None-Match'))
+        self._executor = executor
+        self._environ = None
+
+    @property
+    def environ(self):
+        """
+        environ is the WSGI environ of this request, for handing it to the Flask app
+        """
+        if self._environ is None:
+            self._environ = wsgi_environ(self.scope, self.body)
+        return self._environ
+
+    def get_json(self):
+        """
+        get_json returns the parsed JSON body, or None if the body isn't JSON
+        """
+        if self.headers.get('Content-Type', '').split(';')[0].strip() != 'application/json':
+            return None
+
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+    async def run_sync(self, f, *args):
+        """
+        run_sync runs a blocking function that uses the Flask app (and maybe db.session) on a worker thread
+        """
+        def run():
+            with self.app.app_context():
+                try:
+                    return f(*args)
+                finally:
+                    db.session.remove()
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, run)
+
+
+class GoGoMediaASGI:
+    """
+    GoGoMediaASGI is the ASGI app, wrapping the Flask app app
+    """
+    def __init__(self, app, wsgi_threads=ASGI_WSGI_THREADS):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix='wsgi')
+        async_db.configure(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+        media_event_broker.configure(app.config['MEDIA_EVENTS_DATABASE_URI'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        if scope['type'] != 'http':
+            raise ValueError('unsupported ASGI scope type {}'.format(scope['type']))
+
+        body = await read_body(receive)
+        request = AsyncRequest(self.app, scope, body, self.executor)
+
+        view, rule, view_args = self.match(request)
+        if view is not None:
+            response = await self.dispatch(view, rule, request, view_args)
+            if response is not None:
+                if hasattr(response.response, '__aiter__'):
+                    await self.stream_response(receive, send, response)
+                else:
+                    await send_response(send, response)
+                return
+
+        await self.run_wsgi(request, send)
+
+    def match(self, request):
+        """
+        match finds the async view for this request using the Flask app's url map
+        @return: (async view, url rule, view arguments), or (None, None, None) if there is no async view for it
+        """
+        adapter = self.app.url_map.bind(request.headers.get('Host', 'localhost'))
+        try:
+            rule, view_args = adapter.match(request.path, request.method, return_rule=True)
+        except HTTPException:
+            # not found, method not allowed and redirects are all left to the Flask app
+            return None, None, None
+
+        view = ASYNC_VIEWS.get(rule.endpoint)
+        if view is None:
+            return None, None, None
+
+        return view, rule, view_args
+
+    async def dispatch(self, view, rule, request, view_args):
+        """
+        dispatch calls an async view, and turns what it returns into a response the same way Flask does (including
+        the Flask app's after_request handlers, like CORS)
+        @return: a response, or None if the view handed the request back
+        """
+        start_time = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            try:
+                rv = await view(request, **view_args)
+            except asyncio.TimeoutError as e:
+                # no database connection freed up within DB_POOL_TIMEOUT
+                with self.app.app_context():
+                    rv = database_busy(e)
+            except Exception:
+                self.app.logger.exception('Exception on {} [{}]'.format(request.path, request.method))
+                rv = InternalServerError()
+
+            if rv is None:
+                return None
+
+            with self.app.request_context(request.environ):
+                return self.app.process_response(self.app.make_response(rv))
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            observe_request(rule.rule, request.method, start_time)
+
+    async def stream_response(self, receive, send, response):
+        """
+        stream_response sends a response whose body is an async iterator, a chunk at a time as it's produced. The
+        iterator is cancelled if the client disconnects first, and the response is closed either way
+        """
+        async def stream():
+            async for chunk in response.response:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+        async def wait_for_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.to_wsgi_list()]
+        })
+
+        streaming = asyncio.ensure_future(stream())
+        disconnected = asyncio.ensure_future(wait_for_disconnect())
+        try:
+            done, _ = await asyncio.wait([streaming, disconnected], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (streaming, disconnected):
+                task.cancel()
+            await asyncio.gather(streaming, disconnected, return_exceptions=True)
+            response.close()
+
+        if streaming in done and streaming.exception() is not None:
+            # the response has already started, so all that can be done is to end it early
+            self.app.logger.error('Exception while streaming a {} response'.format(response.mimetype),
+                                  exc_info=streaming.exception())
+
+    async def run_wsgi(self, request, send):
+        """
+        run_wsgi runs the Flask app for this request on one of the worker threads. The response is sent as the app
+        produces it, so streamed responses stay streamed
+        """
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            # blocks the worker thread until the message is sent, so a slow client slows down the app, not memory
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            started = []
+            sent_start = False
+
+            def start_response(status, headers, exc_info=None):
+                started.append((int(status.split(' ', 1)[0]), headers))
+
+            def send_start():
+                status, headers = started[-1]
+                send_from_thread({
+                    'type': 'http.response.start',
+                    'status': status,
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                for name, value in headers]
+                })
+
+            iterable = self.app.wsgi_app(request.environ, start_response)
+            try:
+                for chunk in iterable:
+                    if chunk:
+                        if not sent_start:
+                            send_start()
+                            sent_start = True
+                        send_from_thread({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+
+            if not sent_start:
+                send_start()
+            send_from_thread({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+        await loop.run_in_executor(self.executor, run)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await async_db.connect()
+                    password_hasher.start()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await media_event_broker.close()
+                await async_db.close()
+                self.executor.shutdown(wait=False)
+                password_hasher.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+async def read_body(receive):
+    body = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        body.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+
+    return b''.join(body)
+
+
+async def send_response(send, response):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.headers.to_wsgi_list()]
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+def wsgi_environ(scope, body):
+    """
+    wsgi_environ builds the WSGI environ for an ASGI http scope and its body
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': unquote(scope['path']).encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name != 'CONTENT_TYPE':
+            name = 'HTTP_' + name
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+
+    return environ
+
+
+def create_asgi_app(test=False):
+    return GoGoMediaASGI(create_app(test))
+
+
+app = create_asgi_app()
@@ -0,0 +1,134 @@
+import asyncio
+import itertools
+import re
+from contextlib import asynccontextmanager
+
+import asyncpg
+from sqlalchemy.dialects import postgresql
+
+# statements are compiled with the psycopg2 dialect's %s placeholders, which are then renumbered to asyncpg's $1, $2..
+_DIALECT = postgresql.dialect(paramstyle='format')
+_PLACEHOLDER = re.compile(r'%%|%s')
+
+
+def compile_statement(statement):
+    """
+    compile_statement compiles a sqlalchemy core statement into SQL and positional parameters for asyncpg.
+    Python side column defaults are applied by sqlalchemy when it executes a statement, not when it compiles it, so
+    inserts have to give every value themselves
+    @return: a (sql string, list of parameters) tuple
+    """
+    compiled = statement.compile(dialect=_DIALECT)
+    params = [compiled.params[name] for name in compiled.positiontup]
+
+    numbers = itertools.count(1)
+    sql = _PLACEHOLDER.sub(lambda match: '%' if match.group() == '%%' else '${}'.format(next(numbers)),
+                           compiled.string)
+
+    return sql, params
+
+
+class AsyncSession:
+    """
+    AsyncSession runs sqlalchemy core statements on one asyncpg connection, inside one transaction
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def fetch(self, statement):
+        sql, params = compile_statement(statement)
+        return await self.connection.fetch(sql, *params)
+
+    async def fetchrow(self, statement):
+        sql, params = compile_statement(statement)
+        return await self.connection.fetchrow(sql, *params)
+
+    async def fetchval(self, statement):
+        sql, params = compile_statement(statement)
+        return await self.connection.fetchval(sql, *params)
+
+    async def execute(self, statement):
+        sql, params = compile_statement(statement)
+        return await self.connection.execute(sql, *params)
+
+
+class AsyncDatabase:
+    """
+    AsyncDatabase is the async counterpart of db, for the ASGI endpoints (see asgi.py). It keeps an asyncpg pool with
+    the same DB_* pool and session settings as the sqlalchemy engine, and runs sqlalchemy core statements on it
+    """
+    def __init__(self):
+        self.dsn = None
+        self.pool_options = {}
+        self.acquire_timeout = None
+        self.pool = None
+        self._connect_lock = None
+
+    def configure(self, dsn, config):
+        """
+        configure sets the database url and the DB_* settings (see database.engine_options) used by connect
+        """
+        server_settings = {}
+        if config['DB_STATEMENT_TIMEOUT'] and not config['DB_TRANSACTION_POOLING']:
+            server_settings['statement_timeout'] = str(config['DB_STATEMENT_TIMEOUT'])
+        if config['DB_IDLE_IN_TRANSACTION_TIMEOUT'] and not config['DB_TRANSACTION_POOLING']:
+            server_settings['idle_in_transaction_session_timeout'] = str(config['DB_IDLE_IN_TRANSACTION_TIMEOUT'])
+
+        max_size = config['DB_POOL_SIZE'] + config['DB_MAX_OVERFLOW']
+        self.dsn = dsn
+        self.acquire_timeout = config['DB_POOL_TIMEOUT']
+        self.pool_options = {
+            'min_size': min(config['DB_POOL_WARM'], max_size),
+            'max_size': max_size,
+            'max_inactive_connection_lifetime': config['DB_POOL_RECYCLE'],
+            'server_settings': server_settings,
+            # a transaction pooling proxy can hand each transaction to a different server connection, so statements
+            # prepared on one connection can't be reused
+            'statement_cache_size': 0 if config['DB_TRANSACTION_POOLING'] else 100
+        }
+
+    async def connect(self):
+        """
+        connect creates the pool, it has to be called from the event loop that will use it
+        """
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(self.dsn, **self.pool_options)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+        self._connect_lock = None
+
+    @asynccontextmanager
+    async def session(self):
+        """
+        session checks a connection out of the pool for the with block, and runs the block in a transaction that is
+        committed at the end (or rolled back if it raises).
+        Raises asyncio.TimeoutError if no connection frees up within DB_POOL_TIMEOUT seconds
+        """
+        if self.pool is None:
+            await self.connect()
+
+        async with self.pool.acquire(timeout=self.acquire_timeout) as connection:
+            async with connection.transaction():
+                yield AsyncSession(connection)
+
+    async def fetch(self, statement):
+        async with self.session() as session:
+            return await session.fetch(statement)
+
+    async def fetchrow(self, statement):
+        async with self.session() as session:
+            return await session.fetchrow(statement)
+
+    async def fetchval(self, statement):
+        async with self.session() as session:
+            return await session.fetchval(statement)
+
+
+async_db = AsyncDatabase()
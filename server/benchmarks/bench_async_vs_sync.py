@@ -0,0 +1,46 @@
+"""
+bench_async_vs_sync compares requests per second and p99 latency of the sync server (gunicorn with gthread workers,
+see gunicorn.conf.py) and the async server (uvicorn running asgi.py) with 1000 concurrent keep-alive connections, both
+with the same number of worker processes.
+
+usage: python -m benchmarks.bench_async_vs_sync [connections] [seconds per run] [worker processes]
+"""
+import sys
+
+from benchmarks.load import load, raw_request
+from benchmarks.utils import benchmark_app, seed_user, seed_media, run_server, summarize, print_row
+
+PORT = 8198
+
+SERVERS = [
+    ('sync', ['gunicorn', '-c', 'gunicorn.conf.py', '-b', '127.0.0.1:{}'.format(PORT), 'app:app']),
+    ('async', ['uvicorn', 'asgi:app', '--port', str(PORT), '--no-access-log', '--log-level', 'warning'])
+]
+
+PATHS = [
+    # (label, path)
+    ('media GET (cached)', '/user/benchuser/media'),
+    ('media GET page of 20', '/user/benchuser/media?limit=20')
+]
+
+
+def main(connections=1000, duration=10, workers=2):
+    with benchmark_app():
+        user = seed_user('benchuser')
+        seed_media(user.id, 100)
+        headers = {'Authorization': 'Bearer ' + user.encode_auth_token()}
+
+        for server, command in SERVERS:
+            if server == 'async':
+                command = command + ['--workers', str(workers)]
+            with run_server(command, PORT, workers, '/tmp/gogomedia_bench_async_metrics'):
+                for label, path in PATHS:
+                    timings, statuses, elapsed = load('127.0.0.1', PORT, raw_request('GET', path, headers),
+                                                      connections, duration)
+                    print_row('{}: {}'.format(server, label), summarize(timings))
+                    print('  {:.0f} requests/s, responses by status: {}'.format(len(timings) / elapsed,
+                                                                                 dict(statuses)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,34 @@
+"""
+bench_auth measures the checks login_required does on every authenticated request: decoding the auth token (skipped
+when it's in token_cache), and looking up its user's token generation, both with the generation cached and with a
+query (once per user every AUTH_TOKEN_GENERATION_TTL seconds). These replace the blacklist lookup that used to be done
+for every request.
+
+usage: python -m benchmarks.bench_auth [iterations]
+"""
+import sys
+
+from models.user import User
+from logic.token_cache import token_generations
+from logic.user import get_token_generation
+
+from benchmarks.utils import benchmark_app, seed_user, time_calls, print_row
+
+
+def uncached_token_generation(user_id):
+    token_generations.clear()
+    return get_token_generation(user_id)
+
+
+def main(iterations=2000):
+    with benchmark_app():
+        user = seed_user('benchuser')
+        auth_token = user.encode_auth_token()
+
+        print_row('decode auth token', time_calls(lambda: User.decode_auth_token_payload(auth_token), iterations))
+        print_row('token generation, query', time_calls(lambda: uncached_token_generation(user.id), iterations))
+        print_row('token generation, cached', time_calls(lambda: get_token_generation(user.id), iterations))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,67 @@
+"""
+bench_autocomplete measures GET /user/<username>/media/autocomplete on a media table with total_media rows spread over
+users (1M rows over 1000 users by default), typing a few names one character at a time. Each keystroke is timed with
+an empty autocomplete cache (every request queries the trigram index), and again once the cache has seen it (typing,
+deleting and retyping). It prints the plan of one lookup. The target is a p99 under 10ms.
+Needs a test database with the pg_trgm and btree_gist extensions available.
+
+usage: python -m benchmarks.bench_autocomplete [iterations] [total_media] [users]
+"""
+import sys
+
+from database import db
+from models.media import create_trigram_index
+from logic.autocomplete_cache import autocomplete_cache
+
+from benchmarks.bench_search import seed
+from benchmarks.utils import benchmark_app, seed_user, time_calls, print_row
+
+TYPED = ['star', 'golden', 'shadow', 'xylo']
+
+
+def main(iterations=200, total_media=1000000, users=1000):
+    with benchmark_app() as app:
+        if not create_trigram_index(db.engine):
+            print('pg_trgm or btree_gist is not available on the test database')
+            return
+
+        client = app.test_client()
+        user = seed_user('benchuser')
+        seed(total_media, users, user.id)
+        print('{} media over {} users, {} media for benchuser'.format(
+            total_media // users * users, users, total_media // users))
+
+        # every keystroke of every typed name, from the configured minimum length
+        min_length = app.config['AUTOCOMPLETE_MIN_LENGTH']
+        paths = ['/user/benchuser/media/autocomplete?q={}'.format(typed[:length])
+                 for typed in TYPED for length in range(min_length, len(typed) + 1)]
+        keystrokes = iter([])
+
+        def keystroke():
+            nonlocal keystrokes
+            path = next(keystrokes, None)
+            if path is None:
+                keystrokes = iter(paths)
+                path = next(keystrokes)
+            return client.get(path)
+
+        # the test app doesn't cache suggestions
+        print_row('keystroke, no cache', time_calls(keystroke, iterations))
+
+        autocomplete_cache.configure(1000, 64)
+        print_row('keystroke, cached prefix', time_calls(keystroke, iterations, warmup=len(paths)))
+        print(autocomplete_cache.stats())
+
+        # the same query logic.media.autocomplete_media runs
+        plan = db.session.execute('''
+            EXPLAIN ANALYZE
+            SELECT media.id, media.medianame FROM media
+            WHERE media."user" = :user AND :prefix <% media.medianame
+            ORDER BY word_similarity(:prefix, media.medianame) DESC, media.medianame, media.id
+            LIMIT 10
+        ''', {'user': user.id, 'prefix': TYPED[0][:3]})
+        print('\n'.join(row[0] for row in plan))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
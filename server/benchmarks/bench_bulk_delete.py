@@ -0,0 +1,53 @@
+"""
+bench_bulk_delete compares clearing out a user's finished media with one filtered DELETE to /user/<username>/media
+(one statement, one commit) against deleting the same media elements one request at a time, for a range of counts.
+
+usage: python -m benchmarks.bench_bulk_delete [iterations]
+"""
+import json
+import sys
+
+from database import db
+
+from benchmarks.utils import benchmark_app, seed_user, seed_media, time_calls, print_row
+from models.media import Media
+
+COUNTS = [10, 100, 300]
+
+
+def main(iterations=5):
+    with benchmark_app() as app:
+        client = app.test_client()
+        user = seed_user('benchuser')
+
+        def reseed(count):
+            Media.query.delete()
+            db.session.commit()
+            seed_media(user.id, count, consumed_state='finished')
+            seed_media(user.id, count, consumed_state='started', start_order=count)
+            return [row.id for row in Media.query.with_entities(Media.id).filter(Media.consumed_state == 'finished')]
+
+        for count in COUNTS:
+            def filtered_delete():
+                reseed(count)
+                client.delete('/user/benchuser/media',
+                              data=json.dumps({'consumed_state': 'finished'}),
+                              content_type='application/json')
+
+            def id_list_delete():
+                ids = reseed(count)
+                client.delete('/user/benchuser/media', data=json.dumps({'id': ids}), content_type='application/json')
+
+            def one_at_a_time():
+                for id in reseed(count):
+                    client.delete('/user/benchuser/media', data=json.dumps({'id': id}),
+                                  content_type='application/json')
+
+            # every timing includes reseeding the list, which costs the same for each of them
+            print_row('filtered DELETE, {} media'.format(count), time_calls(filtered_delete, iterations, warmup=1))
+            print_row('id list DELETE, {} media'.format(count), time_calls(id_list_delete, iterations, warmup=1))
+            print_row('one at a time, {} media'.format(count), time_calls(one_at_a_time, iterations, warmup=0))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
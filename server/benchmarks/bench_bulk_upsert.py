@@ -0,0 +1,58 @@
+"""
+bench_bulk_upsert compares an array PUT to /user/<username>/media (one ownership query, one INSERT, one UPDATE and
+one commit) against upserting the same elements one at a time, for a range of batch sizes.
+Each batch reorders batch_size existing media elements and adds batch_size new ones.
+
+usage: python -m benchmarks.bench_bulk_upsert [iterations]
+"""
+import itertools
+import json
+import sys
+
+from database import db
+
+from logic.user import get_user
+from views.media import upsert_media_from_body
+from benchmarks.utils import benchmark_app, seed_user, seed_media, time_calls, print_row
+from models.media import Media
+
+BATCH_SIZES = [1, 10, 100, 1000]
+
+
+def make_batch(media_ids, iteration):
+    batch = [{'id': id, 'order': (order + iteration) % len(media_ids)} for order, id in enumerate(media_ids)]
+    batch += [{'name': 'new media {}'.format(i), 'medium': 'film'} for i in range(len(media_ids))]
+    return batch
+
+
+def main(iterations=20):
+    with benchmark_app() as app:
+        client = app.test_client()
+        user = seed_user('benchuser')
+
+        for batch_size in BATCH_SIZES:
+            Media.query.delete()
+            db.session.commit()
+            seed_media(user.id, batch_size)
+            media_ids = [row.id for row in Media.query.with_entities(Media.id).order_by(Media.id)]
+
+            counter = itertools.count()
+
+            def bulk_put():
+                client.put('/user/benchuser/media',
+                           data=json.dumps(make_batch(media_ids, next(counter))),
+                           content_type='application/json')
+
+            def one_at_a_time():
+                user = get_user('benchuser')
+                for body in make_batch(media_ids, next(counter)):
+                    upsert_media_from_body(body, user)
+
+            # the one at a time path gets slow quickly, so run it fewer times for big batches
+            print_row('bulk array PUT, batch {}'.format(batch_size), time_calls(bulk_put, iterations, warmup=1))
+            print_row('one at a time, batch {}'.format(batch_size),
+                      time_calls(one_at_a_time, max(1, int(iterations / batch_size ** 0.5)), warmup=0))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
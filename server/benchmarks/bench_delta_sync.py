@@ -0,0 +1,54 @@
+"""
+bench_delta_sync measures a mobile client's sync after CHANGES media were changed, as the user's media list grows: a
+whole list GET (what clients did before) against a GET with since set to the seq from before the changes. Both the
+latency and the response size are printed, the delta's should stay flat as the list grows.
+The media cache is off (as in every benchmark using the test app), so the whole list is read every time.
+
+usage: python -m benchmarks.bench_delta_sync [iterations]
+"""
+import json
+import sys
+
+from sqlalchemy import func
+
+from database import db
+from models.media import Media
+from logic.media import upsert_media_list, remove_media_list
+
+from benchmarks.utils import benchmark_app, seed_user, seed_media, time_calls, print_row
+
+LIST_SIZES = [100, 1000, 10000, 100000]
+CHANGES = 10
+
+
+def main(iterations=50):
+    with benchmark_app() as app:
+        client = app.test_client()
+        user = seed_user('benchuser')
+
+        seeded = 0
+        for list_size in LIST_SIZES:
+            seed_media(user.id, list_size - seeded, start_order=seeded)
+            seeded = list_size
+            db.session.execute('ANALYZE media')
+            db.session.commit()
+
+            # update CHANGES - 2 media, add one and delete one
+            since = json.loads(client.get('/user/benchuser/media?since=0').get_data(as_text=True))['seq']
+            last_id = db.session.query(func.max(Media.id)).scalar()
+            upsert_media_list(user.id, [{'id': id, 'consumed_state': 'started'} for id in range(1, CHANGES - 1)] +
+                              [{'name': 'added media', 'order': list_size}])
+            remove_media_list(user.id, [last_id])
+
+            full_size = len(client.get('/user/benchuser/media').get_data())
+            delta_size = len(client.get('/user/benchuser/media?since={}'.format(since)).get_data())
+
+            print('{} media, {} changed'.format(list_size, CHANGES))
+            print_row('  whole list GET, {} bytes'.format(full_size),
+                      time_calls(lambda: client.get('/user/benchuser/media'), iterations))
+            print_row('  since GET, {} bytes'.format(delta_size),
+                      time_calls(lambda: client.get('/user/benchuser/media?since={}'.format(since)), iterations))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
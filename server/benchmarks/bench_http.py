@@ -0,0 +1,221 @@
+"""
+bench_http load tests every endpoint of a local server over HTTP: /register, /login, /logout and each method on
+/user/<username>/media. It seeds users users with media_per_user media each, starts the sync (gunicorn) or async
+(uvicorn) server against the test database, and then runs each scenario at each concurrency level (the number of
+keep-alive connections sending requests back to back) for duration seconds. Requests are spread over the seeded users.
+Throughput, p50/p95/p99 latency and responses by status are printed, and written as JSON to output, so runs on two
+commits can be diffed.
+
+Scenarios run in the order below, since later ones change what earlier ones would measure:
+    - 'media DELETE' deletes each user's seeded media one at a time, once a user's media run out the deletes match
+      nothing (and are cheaper than the ones that did)
+    - 'logout' logs out a token issued for the request, in the user's next token generation since each logout
+      increments it. Requests for the same user in flight at once (more connections than users) can respond 401
+
+usage: python -m benchmarks.bench_http [--users N] [--media-per-user N] [--concurrency 1,10,50] [--duration SECONDS]
+    [--server sync|async] [--workers N] [--scenarios login,media GET,...] [--output FILE]
+"""
+import argparse
+import collections
+import datetime
+import itertools
+import json
+import subprocess
+
+from database import db
+from fractional_rank import rank_for_order
+from password_hashing import password_hasher
+from models.user import User
+
+from benchmarks.load import load, raw_request
+from benchmarks.utils import benchmark_app, run_server, summarize, print_row
+
+PORT = 8199
+PASSWORD = 'P@ssw0rd'
+
+SERVERS = {
+    'sync': ['gunicorn', '-c', 'gunicorn.conf.py', '-b', '127.0.0.1:{}'.format(PORT), 'app:app'],
+    'async': ['uvicorn', 'asgi:app', '--port', str(PORT), '--no-access-log', '--log-level', 'warning']
+}
+
+# usernames for the register scenario, never reused within a run
+new_usernames = ('newuser{}'.format(n) for n in itertools.count())
+
+
+def json_request(method, path, body, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token is not None:
+        headers['Authorization'] = 'Bearer ' + token
+    return raw_request(method, path, headers, json.dumps(body).encode('utf-8'))
+
+
+def register_request(user, n):
+    return json_request('POST', '/register', {'username': next(new_usernames), 'password': PASSWORD})
+
+
+def login_request(user, n):
+    return json_request('POST', '/login', {'username': user['username'], 'password': PASSWORD})
+
+
+def logout_request(user, n):
+    token = User.encode_auth_token_for(user['id'], user['token_generation'])
+    user['token_generation'] += 1
+    return raw_request('GET', '/logout', {'Authorization': 'Bearer ' + token})
+
+
+def media_get_request(user, n):
+    return raw_request('GET', '/user/{}/media'.format(user['username']), {'Authorization': 'Bearer ' + user['token']})
+
+
+def media_get_page_request(user, n):
+    return raw_request('GET', '/user/{}/media?limit=20'.format(user['username']),
+                       {'Authorization': 'Bearer ' + user['token']})
+
+
+def media_put_update_request(user, n):
+    media_id = user['media_ids'][n % len(user['media_ids'])] if user['media_ids'] else 0
+    return json_request('PUT', '/user/{}/media'.format(user['username']),
+                        {'id': media_id, 'name': 'renamed {}'.format(n)}, user['token'])
+
+
+def media_put_add_request(user, n):
+    return json_request('PUT', '/user/{}/media'.format(user['username']), {'name': 'added {}'.format(n)},
+                        user['token'])
+
+
+def media_delete_request(user, n):
+    media_id = user['media_ids'].popleft() if user['media_ids'] else 0
+    return json_request('DELETE', '/user/{}/media'.format(user['username']), {'id': media_id}, user['token'])
+
+
+SCENARIOS = [
+    # (name, method, route, function taking a seeded user and the request's number, returning the request's bytes)
+    ('register', 'POST', '/register', register_request),
+    ('login', 'POST', '/login', login_request),
+    ('media GET', 'GET', '/user/<username>/media', media_get_request),
+    ('media GET page', 'GET', '/user/<username>/media?limit=20', media_get_page_request),
+    ('media PUT update', 'PUT', '/user/<username>/media', media_put_update_request),
+    ('media PUT add', 'PUT', '/user/<username>/media', media_put_add_request),
+    ('media DELETE', 'DELETE', '/user/<username>/media', media_delete_request),
+    ('logout', 'GET', '/logout', logout_request)
+]
+
+
+def seed(users, media_per_user):
+    """
+    seed adds users users named benchuser1, benchuser2, ... (all with the password PASSWORD, hashed once) and
+    media_per_user media for each of them, with INSERT ... SELECT statements so there is no round trip per row
+    @return: a list of {'id', 'username', 'token', 'token_generation', 'media_ids'} dicts, one per user
+    """
+    db.session.execute('SET LOCAL statement_timeout = 0')
+    db.session.execute('''
+        INSERT INTO users (username, passhash, media_version)
+        SELECT 'benchuser' || g, :passhash, 0 FROM generate_series(1, :users) AS g
+    ''', {'users': users, 'passhash': password_hasher.hash_password(PASSWORD)})
+    db.session.execute('''
+        INSERT INTO media (medianame, "user", medium, consumed_state, description, "order", rank)
+        SELECT 'media ' || g, u.id, 'other', 'not started', '', 0, :rank
+        FROM users AS u, generate_series(1, :media_per_user) AS g
+    ''', {'media_per_user': media_per_user, 'rank': rank_for_order(0)})
+    db.session.commit()
+
+    db.session.execute('ANALYZE users')
+    db.session.execute('ANALYZE media')
+    db.session.commit()
+
+    media_ids = collections.defaultdict(collections.deque)
+    for row in db.session.execute('SELECT id, "user" FROM media ORDER BY id'):
+        media_ids[row.user].append(row.id)
+
+    return [{
+        'id': row.id,
+        'username': row.username,
+        'token': User.encode_auth_token_for(row.id, 0),
+        'token_generation': 0,
+        'media_ids': media_ids[row.id]
+    } for row in db.session.execute('SELECT id, username FROM users ORDER BY id')]
+
+
+def request_source(make_request, users):
+    """
+    request_source returns a function that makes the next request of a scenario, for the next user in turn
+    """
+    users = itertools.cycle(users)
+    numbers = itertools.count()
+    return lambda: make_request(next(users), next(numbers))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(users, media_per_user, concurrency, duration, server, workers, scenarios, output):
+    results = []
+
+    with benchmark_app():
+        seeded_users = seed(users, media_per_user)
+        print('{} users with {} media each, {} server with {} workers'.format(users, media_per_user, server, workers))
+
+        command = SERVERS[server] + (['--workers', str(workers)] if server == 'async' else [])
+        with run_server(command, PORT, workers, '/tmp/gogomedia_bench_http_metrics'):
+            for name, method, route, make_request in SCENARIOS:
+                if name not in scenarios:
+                    continue
+
+                for connections in concurrency:
+                    timings, statuses, elapsed = load('127.0.0.1', PORT, request_source(make_request, seeded_users),
+                                                      connections, duration)
+                    stats = summarize(timings)
+                    throughput = len(timings) / elapsed
+
+                    print_row('{} c={}'.format(name, connections), stats)
+                    print('  {:.0f} requests/s, responses by status: {}'.format(throughput, dict(statuses)))
+
+                    results.append(dict(stats, scenario=name, method=method, route=route, concurrency=connections,
+                                        throughput=throughput,
+                                        statuses={str(status): count for status, count in statuses.items()}))
+
+    with open(output, 'w') as f:
+        json.dump({
+            'commit': git_commit(),
+            'date': datetime.datetime.utcnow().isoformat() + 'Z',
+            'server': server,
+            'workers': workers,
+            'users': users,
+            'media_per_user': media_per_user,
+            'duration': duration,
+            'results': results
+        }, f, indent=2)
+    print('results written to {}'.format(output))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='load test every endpoint of a local server')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--media-per-user', type=int, default=100)
+    parser.add_argument('--concurrency', default='1,10,50',
+                        help='comma separated numbers of connections to run each scenario with')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to run each scenario at each concurrency')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='sync')
+    parser.add_argument('--workers', type=int, default=2, help='server worker processes')
+    parser.add_argument('--scenarios', default=','.join(name for name, _, _, _ in SCENARIOS),
+                        help='comma separated scenarios to run')
+    parser.add_argument('--output', default='bench_http.json')
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',')
+    unknown = set(scenarios) - {name for name, _, _, _ in SCENARIOS}
+    if unknown:
+        parser.error('unknown scenarios: {}'.format(', '.join(sorted(unknown))))
+
+    return dict(users=args.users, media_per_user=args.media_per_user,
+                concurrency=[int(connections) for connections in args.concurrency.split(',')],
+                duration=args.duration, server=args.server, workers=args.workers, scenarios=scenarios,
+                output=args.output)
+
+
+if __name__ == '__main__':
+    main(**parse_args())
@@ -0,0 +1,61 @@
+"""
+bench_login_storm measures the p99 latency of GET /user/<username>/media on a threaded local server while a storm of
+concurrent logins runs against the same server, with bcrypt run on the request threads and in a bounded process pool.
+
+usage: python -m benchmarks.bench_login_storm [login threads] [media GET count]
+"""
+import json
+import sys
+import threading
+from collections import Counter
+
+from benchmarks.utils import benchmark_app, seed_user, seed_media, serve, http_request, time_calls, print_row
+from password_hashing import password_hasher
+
+LOGIN_BODY = json.dumps({'username': 'benchuser', 'password': 'P@ssw0rd'}).encode('utf-8')
+
+
+def login_storm(base_url, stop, statuses):
+    while not stop.is_set():
+        status, _ = http_request(base_url + '/login', 'POST', LOGIN_BODY, {'Content-Type': 'application/json'})
+        statuses[status] += 1
+
+
+def run(base_url, login_threads, iterations):
+    stop = threading.Event()
+    statuses = Counter()
+    threads = [threading.Thread(target=login_storm, args=(base_url, stop, statuses)) for _ in range(login_threads)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        stats = time_calls(lambda: http_request(base_url + '/user/benchuser/media'), iterations)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    return stats, statuses
+
+
+def main(login_threads=16, iterations=500):
+    with benchmark_app() as app:
+        user = seed_user('benchuser')
+        seed_media(user.id, 100)
+
+        with serve(app) as base_url:
+            print_row('media GET, no logins', time_calls(lambda: http_request(base_url + '/user/benchuser/media'),
+                                                         iterations))
+
+            for label, workers, max_queue in [('bcrypt on request threads', 0, 0),
+                                              ('bcrypt in pool of 2, queue 4', 2, 4)]:
+                password_hasher.configure(workers, max_queue)
+                stats, statuses = run(base_url, login_threads, iterations)
+                print_row('media GET, {}'.format(label), stats)
+                print('  login responses by status: {}'.format(dict(statuses)))
+
+            password_hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,61 @@
+"""
+bench_media_events measures how long a media change takes to reach the media event streams of its user, from before
+add_media is called until every one of the user's subscriptions has woken up, as the number of streams open in the
+worker grows. Every stream shares the broker's one listening connection, so the latency should stay flat.
+
+usage: python -m benchmarks.bench_media_events [iterations]
+"""
+import asyncio
+import sys
+import time
+
+from logic.media import add_media
+from logic.media_events import MediaEventBroker
+
+from benchmarks.utils import benchmark_app, seed_user, summarize, print_row
+
+STREAM_COUNTS = [10, 100, 1000, 10000]
+# how many streams (tabs and devices) each user has open
+STREAMS_PER_USER = 2
+
+
+async def measure(broker, user_ids, stream_count, iterations):
+    subscriptions = [await broker.subscribe(user_ids[i // STREAMS_PER_USER % len(user_ids)])
+                     for i in range(stream_count)]
+    changed = [subscription for subscription in subscriptions if subscription.user_id == user_ids[0]]
+
+    timings = []
+    try:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            add_media(user_ids[0], 'bench media')
+            await asyncio.gather(*[subscription.wait(5) for subscription in changed])
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        for subscription in subscriptions:
+            subscription.close()
+
+    return summarize(timings)
+
+
+def main(iterations=200):
+    with benchmark_app() as app:
+        user = seed_user('benchuser')
+        # the broker doesn't look users up, so only the user whose media change has to exist
+        user_ids = [user.id + i for i in range(max(STREAM_COUNTS) // STREAMS_PER_USER)]
+        broker = MediaEventBroker()
+        broker.configure(app.config['MEDIA_EVENTS_DATABASE_URI'])
+
+        async def run():
+            try:
+                for stream_count in STREAM_COUNTS:
+                    print_row('{} streams, change to delivery'.format(stream_count),
+                              await measure(broker, user_ids, stream_count, iterations))
+            finally:
+                await broker.close()
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,38 @@
+"""
+bench_media_filter measures the latency of a filtered GET /user/<username>/media as the user's unfiltered list grows.
+The filtered result is always the same 20 films, so latency should stay flat as the number of other media grows.
+
+usage: python -m benchmarks.bench_media_filter [iterations]
+"""
+import sys
+
+from database import db
+
+from benchmarks.utils import benchmark_app, seed_user, seed_media, time_calls, print_row
+
+LIST_SIZES = [100, 1000, 10000, 100000]
+FILTERED_SIZE = 20
+
+
+def main(iterations=200):
+    with benchmark_app() as app:
+        client = app.test_client()
+        user = seed_user('benchuser')
+        seed_media(user.id, FILTERED_SIZE, medium='film', consumed_state='started')
+        db.session.execute('ANALYZE media')
+        db.session.commit()
+
+        seeded = FILTERED_SIZE
+        for list_size in LIST_SIZES:
+            seed_media(user.id, list_size - seeded, start_order=seeded)
+            seeded = list_size
+            db.session.execute('ANALYZE media')
+            db.session.commit()
+
+            stats = time_calls(lambda: client.get('/user/benchuser/media?medium=film&consumed-state=started'),
+                               iterations)
+            print_row('filtered GET, {} total media'.format(list_size), stats)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
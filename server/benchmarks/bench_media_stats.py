@@ -0,0 +1,51 @@
+"""
+bench_media_stats measures reading a user's media counts (what GET /user/<username>/media/stats serves) as their media
+list grows, against the GROUP BY over the user's media it replaces, and the whole stats GET. seed_media inserts
+straight into the media table, so the counts are rebuilt after seeding, which also times rebuild_media_counts.
+
+usage: python -m benchmarks.bench_media_stats [iterations]
+"""
+import sys
+import time
+
+from sqlalchemy import select, func
+
+from database import db
+from models.media import Media
+from logic.media_count import get_media_counts, rebuild_media_counts
+
+from benchmarks.utils import benchmark_app, seed_user, seed_media, time_calls, print_row
+
+LIST_SIZES = [100, 1000, 10000, 100000]
+
+
+def count_with_group_by(userid):
+    return db.session.execute(select([Media.medium, Media.consumed_state, func.count()])
+                              .where(Media.user == userid)
+                              .group_by(Media.medium, Media.consumed_state)).fetchall()
+
+
+def main(iterations=200):
+    with benchmark_app() as app:
+        client = app.test_client()
+        user = seed_user('benchuser')
+
+        seeded = 0
+        for list_size in LIST_SIZES:
+            seed_media(user.id, list_size - seeded, start_order=seeded)
+            seeded = list_size
+            db.session.execute('ANALYZE media')
+            db.session.commit()
+
+            start = time.perf_counter()
+            rebuild_media_counts()
+            print('{} media, rebuilding the counts took {:.1f}ms'.format(
+                list_size, (time.perf_counter() - start) * 1000))
+
+            print_row('  media counts', time_calls(lambda: get_media_counts(user.id), iterations))
+            print_row('  GROUP BY', time_calls(lambda: count_with_group_by(user.id), iterations))
+            print_row('  stats GET', time_calls(lambda: client.get('/user/benchuser/media/stats'), iterations))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
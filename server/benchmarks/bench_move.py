@@ -0,0 +1,64 @@
+"""
+bench_move compares moving one media element with a POST to /user/<username>/media/move (one row updated) against
+the legacy way of reordering, an array PUT that sends the new order of every media element, for a range of list sizes.
+It also times renormalize_media_ranks, which runs in the background after moves, and shows how long ranks get.
+
+usage: python -m benchmarks.bench_move [iterations]
+"""
+import json
+import random
+import sys
+
+from database import db
+
+from logic.media import renormalize_media_ranks
+from logic.media_rank import rank_renormalizer
+from benchmarks.utils import benchmark_app, seed_user, seed_media, time_calls, print_row
+from models.media import Media
+
+LIST_SIZES = [100, 1000, 10000]
+
+
+def main(iterations=50):
+    with benchmark_app() as app:
+        client = app.test_client()
+        user = seed_user('benchuser')
+        rng = random.Random(0)
+
+        # leave renormalization to the end, like the background renormalizer would
+        rank_renormalizer.configure(3600)
+
+        for list_size in LIST_SIZES:
+            Media.query.delete()
+            db.session.commit()
+            seed_media(user.id, list_size)
+            media_ids = [row.id for row in Media.query.with_entities(Media.id).order_by(Media.id)]
+
+            def move():
+                id, after = rng.sample(media_ids, 2)
+                client.post('/user/benchuser/media/move',
+                            data=json.dumps({'id': id, 'after': after}),
+                            content_type='application/json')
+
+            def reorder_put():
+                # move the last media element to the front by renumbering the whole list
+                media_ids.insert(0, media_ids.pop())
+                client.put('/user/benchuser/media',
+                           data=json.dumps([{'id': id, 'order': order} for order, id in enumerate(media_ids)]),
+                           content_type='application/json')
+
+            print_row('move, list {}'.format(list_size), time_calls(move, iterations))
+            longest_rank = db.session.query(db.func.max(db.func.length(Media.rank))).scalar()
+            print('{:<40} {}'.format('longest rank after moves', longest_rank))
+
+            print_row('renormalize, list {}'.format(list_size),
+                      time_calls(lambda: renormalize_media_ranks(user.id), 1, warmup=0))
+            print_row('reorder array PUT, list {}'.format(list_size),
+                      time_calls(reorder_put, max(1, iterations * 100 // list_size), warmup=1))
+
+        rank_renormalizer.clear()
+        rank_renormalizer.configure(0)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,69 @@
+"""
+bench_pool_exhaustion measures GET /user/<username>/media on a threaded local server with more concurrent clients than
+pooled database connections. Requests queue for a connection, so latency grows with the queue, and once a request
+waits longer than DB_POOL_TIMEOUT it gets a 503.
+
+usage: python -m benchmarks.bench_pool_exhaustion [concurrent clients] [requests per client]
+"""
+import sys
+import threading
+import time
+from collections import Counter
+
+import app as app_module
+from benchmarks.utils import benchmark_app, seed_user, seed_media, serve, http_request, summarize, print_row
+from database import db
+
+POOL_CONFIGS = [
+    # (label, pool size, max overflow, pool timeout)
+    ('pool 2, no overflow, 0.05s timeout', 2, 0, 0.05),
+    ('pool 2, no overflow, 5s timeout', 2, 0, 5),
+    ('pool 8, overflow 2, 5s timeout', 8, 2, 5),
+    ('pool 32, no overflow, 5s timeout', 32, 0, 5)
+]
+
+
+def client(base_url, requests, timings, statuses):
+    for _ in range(requests):
+        start = time.perf_counter()
+        status, _ = http_request(base_url + '/user/benchuser/media')
+        timings.append((time.perf_counter() - start) * 1000)
+        statuses[status] += 1
+
+
+def run(base_url, clients, requests):
+    timings = []
+    statuses = Counter()
+    threads = [threading.Thread(target=client, args=(base_url, requests, timings, statuses)) for _ in range(clients)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return summarize(timings), statuses, clients * requests / (time.perf_counter() - start)
+
+
+def main(clients=32, requests=50):
+    for label, pool_size, max_overflow, pool_timeout in POOL_CONFIGS:
+        app_module.DB_POOL_SIZE = pool_size
+        app_module.DB_MAX_OVERFLOW = max_overflow
+        app_module.DB_POOL_TIMEOUT = pool_timeout
+
+        with benchmark_app() as app:
+            user = seed_user('benchuser')
+            seed_media(user.id, 200)
+            db.session.remove()
+
+            with serve(app) as base_url:
+                stats, statuses, throughput = run(base_url, clients, requests)
+
+            print_row(label, stats)
+            print('  {:.0f} requests/s, responses by status: {}'.format(throughput, dict(statuses)))
+
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
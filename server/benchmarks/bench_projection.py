@@ -0,0 +1,41 @@
+"""
+bench_projection compares how many media rows per second can be read and serialized with as_dict, loading full Media
+ORM instances (get_media) against selecting only the needed columns into MediaRecords (get_media_records).
+
+usage: python -m benchmarks.bench_projection [list size] [iterations]
+"""
+import sys
+import time
+
+from database import db
+
+from logic.media import get_media, get_media_records
+from benchmarks.utils import benchmark_app, seed_user, seed_media
+
+
+def rows_per_second(f, list_size, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        [media.as_dict() for media in f('benchuser')]
+        # start each iteration with an empty identity map, like a new request would
+        db.session.remove()
+    return list_size * iterations / (time.perf_counter() - start)
+
+
+def main(list_size=100000, iterations=5):
+    with benchmark_app():
+        user = seed_user('benchuser')
+        seed_media(user.id, list_size)
+
+        # warm up the connection and the database's buffer cache
+        get_media_records('benchuser')
+
+        orm = rows_per_second(get_media, list_size, iterations)
+        projected = rows_per_second(get_media_records, list_size, iterations)
+
+        print('ORM Media instances: {:10.0f} rows/s'.format(orm))
+        print('projected records:   {:10.0f} rows/s ({:.1f}x)'.format(projected, projected / orm))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,89 @@
+"""
+bench_search measures GET /user/<username>/media/search on a media table with total_media rows spread over users
+(1M rows over 1000 users by default), for a few kinds of search, and prints the plan of one of them. For comparison it
+times what
+clients did before there was a search: download the user's whole list and filter it on the device.
+
+usage: python -m benchmarks.bench_search [iterations] [total_media] [users]
+"""
+import sys
+
+from database import db
+from fractional_rank import rank_for_order
+
+from benchmarks.utils import benchmark_app, seed_user, time_calls, print_row
+
+WORDS = ['star', 'wars', 'matrix', 'dune', 'ring', 'lord', 'king', 'night', 'dark', 'light', 'empire', 'return',
+         'hope', 'last', 'first', 'blue', 'red', 'green', 'black', 'white', 'river', 'ocean', 'city', 'storm', 'fire',
+         'ice', 'song', 'dance', 'dream', 'ghost', 'shadow', 'garden', 'winter', 'summer', 'road', 'house', 'game',
+         'heart', 'moon', 'sun', 'silver', 'golden', 'iron', 'glass', 'paper', 'stone', 'wind', 'wolf', 'bird', 'zebra']
+
+SEARCHES = [('one word', 'star'), ('two words', 'star wars'), ('excluded word', 'star -wars'),
+            ('no match', 'xylophone')]
+
+
+def seed(total_media, users, bench_user_id):
+    """
+    seed adds users - 1 other users, and total_media media spread evenly over every user, with a few INSERT ... SELECT
+    statements so even a million rows are added in postgres without a round trip per row
+    """
+    # a million rows (and their search_vector index entries) take longer than DB_STATEMENT_TIMEOUT to add
+    db.session.execute('SET LOCAL statement_timeout = 0')
+    db.session.execute('''
+        INSERT INTO users (username, passhash, media_version)
+        SELECT 'otheruser' || g, 'x', 0 FROM generate_series(1, :count) AS g
+    ''', {'count': users - 1})
+
+    user_ids = [row.id for row in db.session.execute('SELECT id FROM users ORDER BY id')]
+    assert bench_user_id in user_ids
+
+    per_user = total_media // users
+    db.session.execute('''
+        INSERT INTO media (medianame, "user", medium, consumed_state, description, "order", rank)
+        SELECT
+            (:words)[1 + (n * 7919) % cardinality(:words)] || ' ' || (:words)[1 + (n * 104729) % cardinality(:words)],
+            u.id, 'other', 'not started',
+            'about ' || (:words)[1 + (n * 15485863) % cardinality(:words)], 0, :rank
+        FROM users AS u, generate_series(1, :per_user) AS g, LATERAL (SELECT u.id::bigint * :per_user + g AS n) AS n
+    ''', {'words': WORDS, 'per_user': per_user, 'rank': rank_for_order(0)})
+    db.session.commit()
+
+    db.session.execute('ANALYZE media')
+    db.session.execute('ANALYZE users')
+    db.session.commit()
+
+
+def main(iterations=200, total_media=1000000, users=1000):
+    with benchmark_app() as app:
+        client = app.test_client()
+        user = seed_user('benchuser')
+        seed(total_media, users, user.id)
+        print('{} media over {} users, {} media for benchuser'.format(
+            total_media // users * users, users, total_media // users))
+
+        for label, query in SEARCHES:
+            path = '/user/benchuser/media/search?q={}&limit=20'.format(query)
+            matches = len(client.get(path).get_json()['data'])
+            print_row('search, {} ({} on first page)'.format(label, matches),
+                      time_calls(lambda: client.get(path), iterations))
+
+        def filter_on_client():
+            media_list = client.get('/user/benchuser/media').get_json()['data']
+            return [media for media in media_list if 'star' in media['name'] or 'star' in media['description']]
+
+        print_row('whole list GET + filter on client', time_calls(filter_on_client, iterations))
+
+        # the same query logic.media.search_media runs for the first search
+        plan = db.session.execute('''
+            EXPLAIN ANALYZE
+            SELECT media.id, ts_rank(media.search_vector, websearch_to_tsquery('english', :query)) AS search_rank
+            FROM media JOIN users ON media."user" = users.id
+            WHERE users.username = 'benchuser' AND media.search_vector @@ websearch_to_tsquery('english', :query)
+            ORDER BY search_rank DESC, media.id DESC
+            LIMIT 21
+        ''', {'query': SEARCHES[0][1]})
+        print('\n'.join(row[0] for row in plan))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
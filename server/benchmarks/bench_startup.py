@@ -0,0 +1,75 @@
+"""
+bench_startup measures how long gunicorn takes to get ready: the time from starting gunicorn until GET / answers, and
+the latency of the first media GET after that (which pays for connecting to postgres unless the pool was warmed).
+It compares the old boot (create_all when the app is imported), the alembic-trusting boot, --preload and pool warming.
+
+usage: python -m benchmarks.bench_startup [runs per configuration]
+"""
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.utils import benchmark_app, seed_user, seed_media, http_request, summarize, print_row
+
+PORT = 8199
+BASE_URL = 'http://127.0.0.1:{}'.format(PORT)
+
+CONFIGS = [
+    # (label, extra environment)
+    ('create_all at import', {'DB_CREATE_ALL': 'true', 'GUNICORN_PRELOAD': 'false'}),
+    ('no create_all', {'GUNICORN_PRELOAD': 'false'}),
+    ('no create_all, preload', {'GUNICORN_PRELOAD': 'true'}),
+    ('no create_all, preload, warm pool', {'GUNICORN_PRELOAD': 'true', 'DB_POOL_WARM': '4'})
+]
+
+
+def gunicorn_env(extra):
+    env = dict(os.environ, WEB_CONCURRENCY='1', PROMETHEUS_MULTIPROC_DIR='/tmp/gogomedia_bench_startup_metrics')
+    # point the app at the test database the benchmark seeded
+    for name in ('HOST', 'PORT', 'USER', 'PASS', 'NAME'):
+        env['DB_' + name] = os.environ['TEST_DB_' + name]
+    env.update(extra)
+    return env
+
+
+def start_once(env, auth_token):
+    """
+    start_once starts gunicorn, and returns the milliseconds until it was ready and the first media GET latency
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', '-b', '127.0.0.1:{}'.format(PORT), 'app:app'],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                if http_request(BASE_URL + '/')[0] == 200:
+                    break
+            except OSError:
+                time.sleep(0.005)
+        ready = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        http_request(BASE_URL + '/user/benchuser/media', headers={'Authorization': 'Bearer ' + auth_token})
+        first_request = (time.perf_counter() - start) * 1000
+
+        return ready, first_request
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(runs=5):
+    with benchmark_app():
+        user = seed_user('benchuser')
+        seed_media(user.id, 100)
+        auth_token = user.encode_auth_token()
+
+        for label, extra in CONFIGS:
+            timings = [start_once(gunicorn_env(extra), auth_token) for _ in range(runs)]
+            print_row('{}: ready'.format(label), summarize([ready for ready, _ in timings]))
+            print_row('{}: first GET'.format(label), summarize([first for _, first in timings]))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
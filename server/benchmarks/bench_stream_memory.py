@@ -0,0 +1,53 @@
+"""
+bench_stream_memory compares the peak python memory used by GET /user/<username>/media for growing lists, built in
+memory and sent with jsonify, and streamed with ?stream=true. The streamed peak should stay flat as the list grows.
+
+usage: python -m benchmarks.bench_stream_memory
+"""
+import time
+import tracemalloc
+
+from benchmarks.utils import benchmark_app, seed_user, seed_media
+
+LIST_SIZES = [1000, 10000, 100000]
+
+
+def measure(client, url):
+    """
+    measure reads the whole response of a GET to url chunk by chunk, and returns (peak memory in MB, seconds)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    response = client.get(url, buffered=False)
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak / 2 ** 20, elapsed, size
+
+
+def main():
+    with benchmark_app() as app:
+        client = app.test_client()
+        user = seed_user('benchuser')
+
+        seeded = 0
+        for list_size in LIST_SIZES:
+            seed_media(user.id, list_size - seeded, start_order=seeded)
+            seeded = list_size
+
+            for label, url in [('jsonify', '/user/benchuser/media'),
+                               ('stream', '/user/benchuser/media?stream=true')]:
+                peak, elapsed, size = measure(client, url)
+                print('{:<8} {:>7} media: peak {:8.2f}MB, {:6.2f}s, {:6.2f}MB response'.format(
+                    label, list_size, peak, elapsed, size / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
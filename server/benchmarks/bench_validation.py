@@ -0,0 +1,70 @@
+"""
+bench_validation measures how fast media PUT bodies of size elements (10k by default) are validated with
+views.media.MEDIA_PUT_SCHEMA, against the chain of if checks it replaced (which stopped at the first error). Valid
+bodies have every field set, invalid ones have a bad medium in every tenth element.
+No database is needed.
+
+usage: python -m benchmarks.bench_validation [iterations] [size]
+"""
+import sys
+
+from fractional_rank import MIN_ORDER, MAX_ORDER
+from models.media import mediums, consumed_states
+from views.media import MEDIA_PUT_SCHEMA
+
+from benchmarks.utils import time_calls, print_row
+
+
+def validate_put_body_parameters(body):
+    """
+    validate_put_body_parameters is the validation media PUTs used before MEDIA_PUT_SCHEMA, for comparison
+    """
+    if 'id' not in body and 'name' not in body:
+        return 'missing parameter \'name\' or parameter \'id\''
+    if 'id' in body and not isinstance(body['id'], int):
+        return 'id parameter must be type integer'
+    if 'name' in body and not isinstance(body['name'], str):
+        return 'name parameter must be type string'
+    if 'medium' in body and body['medium'] not in mediums:
+        return 'medium parameter must be \'film\', \'audio\', \'literature\', or \'other\''
+    if 'consumed_state' in body and body['consumed_state'] not in consumed_states:
+        return 'consumed_state parameter must be \'not started\', \'started\', or \'finished\''
+    if 'description' in body and not isinstance(body['description'], str):
+        return 'description parameter must be type string'
+    if 'order' in body and not isinstance(body['order'], int):
+        return 'order parameter must be type integer'
+    if 'order' in body and not MIN_ORDER <= body['order'] <= MAX_ORDER:
+        return 'order parameter must be a 32 bit integer'
+
+
+def validate_with_chain(body):
+    for body_segment in body:
+        validation_result = validate_put_body_parameters(body_segment)
+        if validation_result is not None:
+            return validation_result
+
+
+def make_body(size, invalid=False):
+    return [{
+        'id': i,
+        'name': 'media{}'.format(i),
+        'medium': 'book' if invalid and i % 10 == 9 else 'film',
+        'consumed_state': 'started',
+        'description': 'description of media{}'.format(i),
+        'order': i
+    } for i in range(size)]
+
+
+def main(iterations=50, size=10000):
+    for label, body in [('valid', make_body(size)), ('invalid', make_body(size, invalid=True))]:
+        chain_stats = time_calls(lambda: validate_with_chain(body), iterations)
+        schema_stats = time_calls(lambda: MEDIA_PUT_SCHEMA.batch_errors(body), iterations)
+
+        print_row('{} {}, if chain'.format(size, label), chain_stats)
+        print_row('{} {}, schema'.format(size, label), schema_stats)
+        print('  {:.0f} vs {:.0f} elements/ms, schema reports {} errors'.format(
+            size / chain_stats['mean'], size / schema_stats['mean'], len(MEDIA_PUT_SCHEMA.batch_errors(body))))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,83 @@
+"""
+load is a small asyncio HTTP/1.1 load generator for the benchmarks, that keeps many keep-alive connections busy at
+once (more than a thread per connection would allow)
+"""
+import asyncio
+import time
+from collections import Counter
+
+
+def raw_request(method, path, headers=None, body=b''):
+    """
+    raw_request builds the bytes of an HTTP/1.1 keep-alive request
+    """
+    lines = ['{} {} HTTP/1.1'.format(method, path), 'Host: localhost', 'Content-Length: {}'.format(len(body))]
+    lines.extend('{}: {}'.format(name, value) for name, value in (headers or {}).items())
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+async def read_response(reader):
+    """
+    read_response reads one response with a Content-Length or chunked body
+    @return: the status code
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    headers = {}
+    for line in header_lines:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+
+    return int(status_line.split(' ')[1])
+
+
+async def connection_loop(host, port, request, deadline, timings, statuses):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        statuses['connect error'] += 1
+        return
+
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(request() if callable(request) else request)
+            status = await read_response(reader)
+            timings.append((time.perf_counter() - start) * 1000)
+            statuses[status] += 1
+    except (OSError, asyncio.IncompleteReadError):
+        statuses['connection error'] += 1
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, request, connections, duration):
+    """
+    run_load sends request over connections keep-alive connections at once for duration seconds
+    @param request: the bytes of a request (see raw_request), or a function with no arguments that returns the bytes of
+        the next request to send, for requests that change every time
+    @return: (list of latencies in milliseconds, Counter of responses by status, elapsed seconds)
+    """
+    timings = []
+    statuses = Counter()
+    start = time.perf_counter()
+    deadline = start + duration
+
+    await asyncio.gather(*[connection_loop(host, port, request, deadline, timings, statuses)
+                           for _ in range(connections)])
+
+    return timings, statuses, time.perf_counter() - start
+
+
+def load(host, port, request, connections, duration):
+    return asyncio.run(run_load(host, port, request, connections, duration))
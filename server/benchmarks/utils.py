@@ -0,0 +1,185 @@
+"""
+helpers shared by the benchmark scripts
+
+Benchmarks run against the test database (the TEST_DB_* environment variables), and drop every table when they
+finish, so never point them at a database with data you care about.
+Run them from the server directory, e.g. `python -m benchmarks.bench_media_filter`
+"""
+import os
+import subprocess
+import time
+import statistics
+import threading
+import urllib.request
+import urllib.error
+from contextlib import contextmanager
+
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from app import create_app
+from database import db
+from fractional_rank import rank_for_order
+
+from models.user import User
+from models.media import Media
+
+
+@contextmanager
+def benchmark_app():
+    """
+    benchmark_app yields a test app with a fresh schema inside an app context, and drops the schema afterwards
+    """
+    app = create_app(test=True)
+    with app.app_context():
+        db.create_all()
+        try:
+            yield app
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+@contextmanager
+def serve(app):
+    """
+    serve runs app on a local threaded http server in a background thread, and yields its base url
+    """
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{}'.format(server.server_port)
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def http_request(url, method='GET', body=None, headers=None):
+    """
+    http_request sends a request and returns (status code, response body bytes), without raising on error statuses
+    """
+    request = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def server_env(workers, metrics_dir):
+    """
+    server_env returns the environment to run a gunicorn or uvicorn server with, pointed at the test database the
+    benchmark seeded
+    """
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PROMETHEUS_MULTIPROC_DIR=metrics_dir)
+    for name in ('HOST', 'PORT', 'USER', 'PASS', 'NAME'):
+        env['DB_' + name] = os.environ['TEST_DB_' + name]
+    return env
+
+
+def wait_until_ready(port):
+    """
+    wait_until_ready blocks until a server started on port answers its index route
+    """
+    while True:
+        try:
+            if http_request('http://127.0.0.1:{}/'.format(port))[0] == 200:
+                return
+        except OSError:
+            time.sleep(0.05)
+
+
+@contextmanager
+def run_server(command, port, workers, metrics_dir):
+    """
+    run_server starts a server process with command, waits until it's ready on port, and stops it afterwards
+    """
+    process = subprocess.Popen(command, env=server_env(workers, metrics_dir))
+    try:
+        wait_until_ready(port)
+        yield process
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def seed_user(username, password='P@ssw0rd'):
+    """
+    seed_user adds a user to the database and returns it
+    """
+    user = User(username, password)
+    db.session.add(user)
+    db.session.commit()
+
+    return user
+
+
+def seed_media(userid, count, medium='other', consumed_state='not started', start_order=0):
+    """
+    seed_media inserts count media rows for the given user with a single multi-row INSERT
+    """
+    if count == 0:
+        return
+
+    db.session.execute(Media.__table__.insert(), [{
+        'medianame': 'media{}'.format(start_order + i),
+        'user': userid,
+        'medium': medium,
+        'consumed_state': consumed_state,
+        'description': '',
+        'order': start_order + i,
+        'rank': rank_for_order(start_order + i)
+    } for i in range(count)])
+    db.session.commit()
+
+
+def time_calls(f, iterations, warmup=5):
+    """
+    time_calls calls f iterations times (after some untimed warmup calls)
+    @return: a dict of latency stats in milliseconds (see summarize)
+    """
+    for _ in range(warmup):
+        f()
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        f()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return summarize(timings)
+
+
+def summarize(timings):
+    """
+    summarize takes a list of latencies in milliseconds and returns count, mean, p50, p95 and p99
+    """
+    timings = sorted(timings)
+    if not timings:
+        return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+
+    return {
+        'count': len(timings),
+        'mean': statistics.mean(timings),
+        'p50': percentile(timings, 50),
+        'p95': percentile(timings, 95),
+        'p99': percentile(timings, 99)
+    }
+
+
+def percentile(sorted_timings, p):
+    """
+    percentile returns the nearest-rank p-th percentile of an already sorted list
+    """
+    index = int(round(p / 100 * (len(sorted_timings) - 1)))
+    return sorted_timings[min(index, len(sorted_timings) - 1)]
+
+
+def print_row(label, stats):
+    print('{:<40} n={:<6} mean={:8.2f}ms p50={:8.2f}ms p95={:8.2f}ms p99={:8.2f}ms'.format(
+        label, stats['count'], stats['mean'], stats['p50'], stats['p95'], stats['p99']))
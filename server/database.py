@@ -1,3 +1,46 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.pool import NullPool
 
 db = SQLAlchemy()
+
+
+def engine_options(config):
+    """
+    engine_options builds the SQLALCHEMY_ENGINE_OPTIONS for the DB_* pool and session settings in config
+    @return: a dict of keyword arguments for sqlalchemy.create_engine
+    """
+    if config['DB_TRANSACTION_POOLING']:
+        # a transaction pooling proxy (like pgbouncer) already pools connections, and hands each transaction to
+        # whichever server connection is free. So don't hold connections open here, and don't set session options at
+        # connect time (the proxy rejects them), set statement_timeout and idle_in_transaction_session_timeout on the
+        # database role instead
+        return {'poolclass': NullPool}
+
+    options = []
+    if config['DB_STATEMENT_TIMEOUT']:
+        options.append('-c statement_timeout={}'.format(config['DB_STATEMENT_TIMEOUT']))
+    if config['DB_IDLE_IN_TRANSACTION_TIMEOUT']:
+        options.append('-c idle_in_transaction_session_timeout={}'.format(config['DB_IDLE_IN_TRANSACTION_TIMEOUT']))
+
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'connect_args': {'options': ' '.join(options)} if options else {}
+    }
+
+
+def warm_pool(engine, connections):
+    """
+    warm_pool opens up to connections connections at once and returns them to the pool, so later requests don't pay
+    for connecting
+    """
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(engine.connect())
+    finally:
+        for connection in opened:
+            connection.close()
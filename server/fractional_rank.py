@@ -0,0 +1,76 @@
+"""
+fractional_rank makes rank keys, strings that sort media elements when compared byte by byte (so the rank column is
+collated "C"). There is always a key between two different keys, so an element can be moved between two others by
+changing only its own key.
+"""
+
+# in ASCII order, so keys compare the same as the numbers they spell
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(ALPHABET)
+_DIGITS = {character: digit for digit, character in enumerate(ALPHABET)}
+
+# the range of the media order column. Every order value fits in ORDER_DIGITS digits once it's shifted to be positive
+MIN_ORDER = -2 ** 31
+MAX_ORDER = 2 ** 31 - 1
+ORDER_DIGITS = 6
+
+
+def rank_for_order(order):
+    """
+    rank_for_order returns the rank key of an order value, keys made by this sort the same as their order values.
+    The keys end with a middle digit, so there is room before and after each of them
+    """
+    if not MIN_ORDER <= order <= MAX_ORDER:
+        raise ValueError('order must be a 32 bit integer')
+
+    value = order - MIN_ORDER
+
+    digits = []
+    for _ in range(ORDER_DIGITS):
+        value, digit = divmod(value, BASE)
+        digits.append(ALPHABET[digit])
+
+    return ''.join(reversed(digits)) + ALPHABET[BASE // 2]
+
+
+def rank_between(before, after):
+    """
+    rank_between returns the shortest rank key that sorts after before and before after
+    @param before: a rank key, or None for no lower bound
+    @param after: a rank key, or None for no upper bound
+    @return: a rank key that never ends with the lowest digit, so there is always room after it
+    @raise ValueError: if before doesn't sort before after, or there is no key between them
+    """
+    if before is not None and after is not None and before >= after:
+        raise ValueError('{!r} does not sort before {!r}'.format(before, after))
+
+    before = before or ''
+    key = []
+    i = 0
+    while True:
+        low = _DIGITS[before[i]] if i < len(before) else 0
+
+        if after is None:
+            high = BASE
+        elif i < len(after):
+            high = _DIGITS[after[i]]
+        else:
+            # after is before followed only by lowest digits, nothing sorts between them
+            raise ValueError('there is no rank between {!r} and {!r}'.format(before, after))
+
+        if high - low > 1:
+            key.append(ALPHABET[(low + high) // 2])
+            return ''.join(key)
+
+        key.append(ALPHABET[low])
+        if high > low:
+            # any key starting with this prefix sorts before after, so only before bounds the rest of the digits
+            after = None
+        i += 1
+
+
+def is_rank(key):
+    """
+    is_rank returns True if key is a string made only of rank digits
+    """
+    return isinstance(key, str) and len(key) > 0 and all(character in _DIGITS for character in key)
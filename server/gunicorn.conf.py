@@ -0,0 +1,34 @@
+import os
+import shutil
+
+# every worker writes its metrics to this directory, so /metrics can add up the metrics of all the workers.
+# This has to be set before prometheus_client is imported
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/gogomedia_metrics')
+
+from prometheus_client import multiprocess  # noqa: E402
+
+# metrics left over from a previous run would be added to this run's. This runs when gunicorn loads its config, before
+# the app is preloaded (on_starting runs after that)
+shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# load the app once in the master process and fork the workers from it, so each worker starts without importing
+# anything
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def pre_fork(server, worker):
+    if server.cfg.preload_app:
+        from app import dispose_engine
+        dispose_engine(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    from app import warm_up
+    warm_up(worker.wsgi)
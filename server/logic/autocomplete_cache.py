@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+
+from metrics import observe_autocomplete_cache
+
+
+class AutocompleteCache:
+    """
+    AutocompleteCache caches the autocomplete suggestions of the max_users users who asked for them most recently, and
+    for each of them the suggestions for their max_prefixes most recently typed prefixes. Typing, deleting and retyping
+    a name asks for the same prefixes again, and those are answered without a query.
+    A user's prefixes are kept with the user's media_version when they were looked up, and all dropped together once it
+    changes, so suggestions are never older than the user's last change. Each worker has its own cache
+    """
+    def __init__(self, max_users=1000, max_prefixes=64):
+        self.max_users = max_users
+        self.max_prefixes = max_prefixes
+        self.hits = 0
+        self.misses = 0
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_users, max_prefixes):
+        """
+        configure changes the size of this cache, dropping every entry. A max_users of 0 disables caching
+        """
+        with self._lock:
+            self.max_users = max_users
+            self.max_prefixes = max_prefixes
+            self._users.clear()
+
+    def get_or_build(self, user_id, version, prefix, limit, build):
+        """
+        get_or_build returns the cached suggestions for this prefix of the user's if they were looked up at the given
+        version with at least limit suggestions (or there were fewer than asked for, so there are no more), otherwise it
+        calls build to look them up and caches them
+        @param version: the user's current media_version
+        @param build: a function that takes limit and returns a list of at most that many suggestions
+        @return: a list of at most limit suggestions
+        """
+        if self.max_users <= 0:
+            return build(limit)
+
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._users.move_to_end(user_id)
+                cached = entry[1].get(prefix)
+                if cached is not None and (cached[0] >= limit or len(cached[1]) < cached[0]):
+                    entry[1].move_to_end(prefix)
+                    self.hits += 1
+                    observe_autocomplete_cache('hit')
+                    return cached[1][:limit]
+
+            self.misses += 1
+            observe_autocomplete_cache('miss')
+
+        suggestions = build(limit)
+        self._set(user_id, version, prefix, limit, suggestions)
+        return suggestions
+
+    def _set(self, user_id, version, prefix, limit, suggestions):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry[0] != version:
+                entry = self._users[user_id] = (version, OrderedDict())
+            self._users.move_to_end(user_id)
+
+            prefixes = entry[1]
+            prefixes[prefix] = (limit, suggestions)
+            prefixes.move_to_end(prefix)
+            while len(prefixes) > self.max_prefixes:
+                prefixes.popitem(last=False)
+
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """
+        invalidate drops every cached prefix of the user's
+        """
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        stats returns the hit and miss counters, and the number of users and prefixes cached
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'users': len(self._users),
+                'prefixes': sum(len(prefixes) for _, prefixes in self._users.values())
+            }
+
+
+autocomplete_cache = AutocompleteCache()
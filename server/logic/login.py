@@ -1,43 +1,107 @@
 from functools import wraps
-from flask import request, jsonify, session, current_app
+from flask import request, current_app
 
 from models.user import User
-from logic.user import get_user_by_id
+from logic.token_cache import token_cache
+from logic.user import get_token_generation, get_token_generation_async
+from metrics import observe_auth_token_cache
 
 
 def login_required(f):
+    """
+    login_required checks the auth token in the Authorization header, and calls the decorated view with the id of the
+    logged in user as its first argument (None if LOGIN_DISABLED is set).
+    The token is only accepted if it was issued in the user's current token generation, tokens issued before there were
+    token generations have no 'gen' claim and count as generation 0.
+    Verified auth tokens are cached in token_cache and token generations in token_generations, so a token that was
+    recently seen doesn't need any database queries
+    """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user = None
-
         if current_app.config['LOGIN_DISABLED']:
-            return f(user, *args, **kwargs)
-
-        auth_header = request.headers.get('Authorization')
-        if auth_header:
-            if len(auth_header.split(' ')) != 2:
-                return jsonify({
-                    'success': False,
-                    'message': 'authorization header malformed'
-                }), 422
-
-            auth_token = auth_header.split(' ')[1]
-            user_id = User.decode_auth_token(auth_token)
-
-            # decode_auth_token returns a string if there was an exception decoding the auth_token
-            if isinstance(user_id, str):
-                return jsonify({
-                    'success': False,
-                    'message': user_id
-                }), 401
-
-            user = get_user_by_id(user_id)
-
-            return f(user, *args, **kwargs)
-        else:
-            return jsonify({
-                'success': False,
-                'message': 'no authorization header'
-            }), 401
+            return f(None, *args, **kwargs)
+
+        claims, error_response = read_auth_header(request.headers.get('Authorization'))
+        if error_response is not None:
+            return error_response
+
+        user_id, token_generation = claims
+        if get_token_generation(user_id) != token_generation:
+            return revoked_auth_token_response()
+
+        return f(user_id, *args, **kwargs)
+
+    return decorated_function
+
+
+def login_required_async(f):
+    """
+    login_required_async is the same as login_required, for the async views of the ASGI app (see asgi.py). The
+    decorated view is called with the id of the logged in user, and then the request
+    """
+    @wraps(f)
+    async def decorated_function(request, *args, **kwargs):
+        if request.app.config['LOGIN_DISABLED']:
+            return await f(None, request, *args, **kwargs)
+
+        # only checks the signature, so there's no need for a worker thread
+        with request.app.app_context():
+            claims, error_response = read_auth_header(request.headers.get('Authorization'))
+        if error_response is not None:
+            return error_response
+
+        user_id, token_generation = claims
+        if await get_token_generation_async(user_id) != token_generation:
+            return revoked_auth_token_response()
+
+        return await f(user_id, request, *args, **kwargs)
 
     return decorated_function
+
+
+def read_auth_header(auth_header):
+    """
+    read_auth_header checks everything about the Authorization header that doesn't need the database: that it's there,
+    well formed, and has an auth token with a valid signature that hasn't expired. Verified tokens are cached in
+    token_cache. It's used by login_required and login_required_async, which then check the token generation.
+    Needs an app context
+    @return: a ((user id, token generation), None) tuple, or (None, response) if the header doesn't pass
+    """
+    if not auth_header:
+        return None, ({
+            'success': False,
+            'message': 'no authorization header'
+        }, 401)
+
+    if len(auth_header.split(' ')) != 2:
+        return None, ({
+            'success': False,
+            'message': 'authorization header malformed'
+        }, 422)
+
+    auth_token = auth_header.split(' ')[1]
+    claims = token_cache.get(auth_token)
+    observe_auth_token_cache(claims is not None)
+
+    if claims is None:
+        payload = User.decode_auth_token_payload(auth_token)
+
+        # decode_auth_token_payload returns a string if there was an exception decoding the auth_token
+        if isinstance(payload, str):
+            return None, ({
+                'success': False,
+                'message': payload
+            }, 401)
+
+        claims = (payload['sub'], payload.get('gen', 0))
+        token_cache.set(auth_token, claims, payload['exp'])
+
+    return claims, None
+
+
+def revoked_auth_token_response():
+    # the token was logged out (or its user deleted), the message is the one clients saw for blacklisted tokens
+    return {
+        'success': False,
+        'message': 'auth token blacklisted'
+    }, 401
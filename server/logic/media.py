@@ -1,8 +1,19 @@
+from flask import current_app
+from sqlalchemy import tuple_, text, select, and_, func, cast, case, null, union_all, literal_column, REAL, Text
+
 from database import db
+from async_database import async_db
+from fractional_rank import rank_for_order, rank_between, MIN_ORDER, MAX_ORDER
 
-from models.media import Media
+from models.media import Media, MediaRecord, SEARCH_CONFIG, media_seq
+from models.media_tombstone import MediaTombstone
 from models.user import User
 
+from logic.media_cache import media_cache
+from logic.media_count import change_media_counts, count_media_changes
+from logic.media_events import MEDIA_EVENTS_CHANNEL
+from logic.media_rank import rank_renormalizer
+
 
 def add_media(userid, medianame, medium='other', consumed_state='not started', description='', order=0):
     """
@@ -11,7 +22,12 @@ def add_media(userid, medianame, medium='other', consumed_state='not started', d
     """
     media = Media(medianame, userid, medium, consumed_state, description, order)
     db.session.add(media)
+    _bump_media_version(User.id == userid)
+    # media counts are always changed after media, so rebuild_media_counts (which locks media) can't deadlock with this
+    db.session.flush()
+    change_media_counts(userid, {(medium, consumed_state): 1})
     db.session.commit()
+    media_cache.invalidate(userid)
 
     return media
 
@@ -22,7 +38,11 @@ def update_media(id, medianame=None, medium=None, consumed_state=None, descripti
     @param id: id is required when updating
     @param: if the given parameter's are None or missing no change is made to that media property
     """
-    media = Media.query.filter_by(id=id).first()
+    # lock the user's row before reading the media element, so counted_as can't be changed by a concurrent update
+    # before this one commits. populate_existing rereads a media element already loaded in the session
+    _bump_media_version(User.id == select([Media.user]).where(Media.id == id).as_scalar())
+    media = Media.query.filter_by(id=id).populate_existing().first()
+    counted_as = (media.medium, media.consumed_state)
 
     if medianame is not None:
         media.medianame = medianame
@@ -34,38 +54,583 @@ def update_media(id, medianame=None, medium=None, consumed_state=None, descripti
         media.description = description
     if order is not None:
         media.order = order
+        media.rank = rank_for_order(order)
+    if (media.medium, media.consumed_state) != counted_as:
+        db.session.flush()
+        change_media_counts(media.user, {counted_as: -1, (media.medium, media.consumed_state): 1})
     db.session.commit()
+    media_cache.invalidate(media.user)
 
     return media
 
 
+def get_owned_media_ids(userid, ids):
+    """
+    get_owned_media_ids checks ownership for a whole batch of media ids with a single query
+    @param ids: a list of media ids
+    @return: the set of the given ids that belong to the user with the given userid
+    """
+    if not ids:
+        return set()
+
+    rows = Media.query.with_entities(Media.id).filter(Media.user == userid, Media.id.in_(set(ids))).all()
+
+    return {row.id for row in rows}
+
+
+def upsert_media_list(userid, media_list):
+    """
+    upsert_media_list adds/updates a list of media elements for the given user in a single transaction. New media
+    elements are added with one multi-row INSERT, and existing ones are updated with one UPDATE ... FROM VALUES.
+    Ownership of the existing media elements should be checked beforehand with get_owned_media_ids, media elements
+    that don't belong to the user are not updated.
+    @param media_list: a list of validated dicts in the same format as a media PUT body. Elements with an 'id' update
+        that media element, and elements without one add a new media element
+    @return: a list of dicts representing each media element (see Media.as_dict), in the same order as media_list.
+        If the same id is in media_list more than once, the updates are merged and every one of those elements gets
+        the final state of the media element
+    """
+    new_media = []
+    media_updates = {}
+
+    for body in media_list:
+        if 'id' in body:
+            # later updates to the same media element win, like they would if they were applied one by one
+            media_updates.setdefault(body['id'], {}).update(body)
+        else:
+            new_media.append({
+                'medianame': body['name'],
+                'user': userid,
+                'medium': body.get('medium', 'other'),
+                'consumed_state': body.get('consumed_state', 'not started'),
+                'description': body.get('description', ''),
+                'order': body.get('order', 0),
+                'rank': rank_for_order(body.get('order', 0))
+            })
+
+    _bump_media_version(User.id == userid)
+
+    added_media = []
+    if new_media:
+        # postgres returns the rows of a multi-row INSERT in the order of its VALUES
+        added_media = db.session.execute(
+            Media.__table__.insert().values(new_media).returning(*Media.__table__.columns)).fetchall()
+
+    updated_media = {}
+    if media_updates:
+        updated_media = {row.id: row for row in _update_media_from_values(userid, list(media_updates.values()))}
+
+    count_changes = count_media_changes(added_media)
+    for row in updated_media.values():
+        count_changes[(row.old_medium, row.old_consumed_state)] -= 1
+        count_changes[(row.medium, row.consumed_state)] += 1
+    change_media_counts(userid, count_changes)
+
+    db.session.commit()
+    media_cache.invalidate(userid)
+
+    added_media = iter(added_media)
+    return [Media.row_as_dict(updated_media[body['id']] if 'id' in body else next(added_media))
+            for body in media_list]
+
+
+def _update_media_from_values(userid, media_updates):
+    """
+    _update_media_from_values updates every media element in media_updates with a single UPDATE ... FROM VALUES
+    statement. Parameters that are missing from an update are left unchanged
+    @return: the updated media rows, with the medium and consumed_state they had before the update as old_medium and
+        old_consumed_state
+    """
+    values = []
+    params = {'userid': userid}
+    for i, update in enumerate(media_updates):
+        values.append('(CAST(:id_{0} AS INTEGER), CAST(:medianame_{0} AS VARCHAR), CAST(:medium_{0} AS medium_type), '
+                      'CAST(:consumed_state_{0} AS consumed_state_type), CAST(:description_{0} AS VARCHAR), '
+                      'CAST(:order_{0} AS INTEGER), CAST(:rank_{0} AS VARCHAR))'.format(i))
+        params['id_{}'.format(i)] = update['id']
+        params['medianame_{}'.format(i)] = update.get('name')
+        params['medium_{}'.format(i)] = update.get('medium')
+        params['consumed_state_{}'.format(i)] = update.get('consumed_state')
+        params['description_{}'.format(i)] = update.get('description')
+        params['order_{}'.format(i)] = update.get('order')
+        params['rank_{}'.format(i)] = rank_for_order(update['order']) if 'order' in update else None
+
+    statement = text('''
+        UPDATE media SET
+            medianame = COALESCE(v.medianame, media.medianame),
+            medium = COALESCE(v.medium, media.medium),
+            consumed_state = COALESCE(v.consumed_state, media.consumed_state),
+            description = COALESCE(v.description, media.description),
+            "order" = COALESCE(v."order", media."order"),
+            rank = COALESCE(v.rank, media.rank),
+            seq = nextval('media_seq'),
+            updated_at = now()
+        FROM (VALUES {}) AS v(id, medianame, medium, consumed_state, description, "order", rank), media AS old
+        WHERE media.id = v.id AND media."user" = :userid AND old.id = media.id
+        RETURNING media.id, media.medianame, media.medium, media.consumed_state, media.description, media."order",
+            old.medium AS old_medium, old.consumed_state AS old_consumed_state
+    '''.format(', '.join(values)))
+
+    return db.session.execute(statement, params).fetchall()
+
+
+def _bump_media_version(user_criterion):
+    """
+    _bump_media_version increments the media_version of the user matching user_criterion. It is called before
+    changing a user's media, so the new version is committed in the same transaction. Updating the user's row also
+    locks it until then, so changes to one user's media (like a move and a renormalization) are made one at a time.
+    The same statement notifies MEDIA_EVENTS_CHANNEL of the new version, which postgres only delivers (to the media
+    event streams, see logic.media_events) if the transaction commits
+    @return: the id of the user, or None if no user matched
+    """
+    payload = cast(User.id, Text) + ':' + cast(User.media_version, Text)
+    return db.session.execute(User.__table__.update()
+                              .where(user_criterion)
+                              .values(media_version=User.media_version + 1)
+                              .returning(User.id, func.pg_notify(MEDIA_EVENTS_CHANNEL, payload))).scalar()
+
+
+def move_media(userid, id, after=None, before=None):
+    """
+    move_media places the media element with the given id between two others in the user's media list, by giving it
+    a rank between theirs (see fractional_rank). Only the moved media element's row is changed.
+    Its order is set to a value between its neighbours' orders. When that ties with one of them (or its rank is getting
+    long) the user's media list is renormalized in the background, see renormalize_media_ranks.
+    Ownership of the media elements should be checked beforehand with get_owned_media_ids
+    @param after: the id of the media element to place it after, or None to place it just before before
+    @param before: the id of the media element to place it before, or None to place it just after after
+    @return: the moved media element
+    @raise ValueError: if the media element given as after doesn't come before the one given as before
+    """
+    _bump_media_version(User.id == userid)
+    media = Media.query.filter_by(id=id).first()
+
+    previous, next = _get_move_neighbours(userid, id, after, before)
+    if previous is not None and next is not None and (previous.rank, previous.id) > (next.rank, next.id):
+        db.session.rollback()
+        raise ValueError('media given as after must come before media given as before')
+
+    try:
+        rank = rank_between(previous.rank if previous else None, next.rank if next else None)
+    except ValueError:
+        # the neighbours have the same rank (two moves to the same place at once), give every media element its own
+        _renormalize_media_ranks(userid)
+        previous, next = _get_move_neighbours(userid, id, after, before)
+        rank = rank_between(previous.rank if previous else None, next.rank if next else None)
+
+    if previous is not None and next is not None:
+        order = (previous.order + next.order) // 2
+    elif previous is not None:
+        order = min(previous.order + 1, MAX_ORDER)
+    elif next is not None:
+        order = max(next.order - 1, MIN_ORDER)
+    else:
+        order = media.order
+
+    media.rank = rank
+    media.order = order
+    db.session.commit()
+    media_cache.invalidate(userid)
+
+    ties = (previous is not None and order == previous.order) or (next is not None and order == next.order)
+    if ties or len(rank) > current_app.config['MEDIA_RANK_MAX_LENGTH']:
+        rank_renormalizer.schedule(userid, renormalize_media_ranks)
+
+    return media
+
+
+def _get_move_neighbours(userid, id, after, before):
+    """
+    _get_move_neighbours finds the media elements a media element is moved between. If only one of after and before is
+    given, the other neighbour is the media element next to it in the user's list (not counting the one being moved)
+    @return: a (previous, next) tuple of rows with the id, rank and order of each neighbour, either can be None
+    """
+    neighbour_ids = [neighbour_id for neighbour_id in (after, before) if neighbour_id is not None]
+    rows = db.session.query(Media.id, Media.rank, Media.order) \
+        .filter(Media.user == userid, Media.id.in_(neighbour_ids)) \
+        .all()
+    rows = {row.id: row for row in rows}
+    previous = rows.get(after)
+    next = rows.get(before)
+
+    others = db.session.query(Media.id, Media.rank, Media.order).filter(Media.user == userid, Media.id != id)
+    if before is None and previous is not None:
+        next = others.filter(tuple_(Media.rank, Media.id) > tuple_(previous.rank, previous.id)) \
+            .order_by(Media.rank, Media.id) \
+            .first()
+    elif after is None and next is not None:
+        previous = others.filter(tuple_(Media.rank, Media.id) < tuple_(next.rank, next.id)) \
+            .order_by(Media.rank.desc(), Media.id.desc()) \
+            .first()
+
+    return previous, next
+
+
+def renormalize_media_ranks(userid):
+    """
+    renormalize_media_ranks gives each of the user's media elements the rank and order of its position in their media
+    list (rank_for_order(position) and position), so the ranks made by moves get short again, and clients that still
+    sort by order see the same list. The list itself doesn't change
+    """
+    _bump_media_version(User.id == userid)
+    _renormalize_media_ranks(userid)
+    db.session.commit()
+    media_cache.invalidate(userid)
+
+
+def _renormalize_media_ranks(userid, batch_size=1000):
+    """
+    _renormalize_media_ranks is renormalize_media_ranks without the commit. Only the rows that change are updated,
+    batch_size at a time with UPDATE ... FROM VALUES
+    """
+    rows = db.session.query(Media.id, Media.rank, Media.order) \
+        .filter(Media.user == userid) \
+        .order_by(Media.rank, Media.id) \
+        .all()
+
+    changes = []
+    for position, row in enumerate(rows):
+        rank = rank_for_order(position)
+        if row.order != position or row.rank != rank:
+            changes.append((row.id, position, rank))
+
+    for start in range(0, len(changes), batch_size):
+        values = []
+        params = {}
+        for i, (id, order, rank) in enumerate(changes[start:start + batch_size]):
+            values.append('(CAST(:id_{0} AS INTEGER), CAST(:order_{0} AS INTEGER), CAST(:rank_{0} AS VARCHAR))'
+                          .format(i))
+            params['id_{}'.format(i)] = id
+            params['order_{}'.format(i)] = order
+            params['rank_{}'.format(i)] = rank
+
+        db.session.execute(text('''
+            UPDATE media SET "order" = v."order", rank = v.rank, seq = nextval('media_seq'), updated_at = now()
+            FROM (VALUES {}) AS v(id, "order", rank)
+            WHERE media.id = v.id
+        '''.format(', '.join(values))), params)
+
+
 def remove_media(id):
     """
-    remove_media removes a Media record from the database
+    remove_media removes a Media record from the database, leaving a tombstone for delta syncs
     """
     # if there is no record for this medianame for this user, then filter returns nothing, and nothing is deleted
+    userid = _bump_media_version(User.id == select([Media.user]).where(Media.id == id).as_scalar())
+    removed = db.session.query(Media.medium, Media.consumed_state).filter_by(id=id).first()
+    db.session.execute(MediaTombstone.__table__.insert().from_select(
+        ['id', 'user', 'seq', 'deleted_at'],
+        select([Media.id, Media.user, func.nextval(media_seq.name), func.now()]).where(Media.id == id)))
     Media.query.filter_by(id=id).delete()
+    if removed is not None and userid is not None:
+        change_media_counts(userid, {(removed.medium, removed.consumed_state): -1})
+    db.session.commit()
+    if userid is not None:
+        media_cache.invalidate(userid)
+
+
+def remove_media_list(userid, ids=None, medium=None, consumed_state=None):
+    """
+    remove_media_list removes every media element of the given user that matches all the given criteria, with a
+    single DELETE in one transaction, leaving a tombstone for each of them for delta syncs. Media elements that belong
+    to other users are never removed, so no separate ownership check is needed
+    @param ids: a list of media ids, or None to match any id
+    @param medium: if set, only media with this medium are removed
+    @param consumed_state: if set, only media with this consumed_state are removed
+    @return: the number of media elements removed
+    """
+    if ids is not None and len(ids) == 0:
+        return 0
+
+    criteria = [Media.user == userid]
+    if ids is not None:
+        criteria.append(Media.id.in_(set(ids)))
+    if medium is not None:
+        criteria.append(Media.medium == medium)
+    if consumed_state is not None:
+        criteria.append(Media.consumed_state == consumed_state)
+
+    _bump_media_version(User.id == userid)
+    removed_counts = _delete_media(and_(*criteria))
+    removed = sum(removed_counts.values())
+
+    if removed == 0:
+        # nothing changed, so keep the old media_version (and the ETags and cached lists made with it)
+        db.session.rollback()
+        return 0
+
+    change_media_counts(userid, {key: -count for key, count in removed_counts.items()})
     db.session.commit()
+    media_cache.invalidate(userid)
+
+    return removed
 
 
-def get_media(username, medium=None, consumed_state=None):
+def _delete_media(criterion):
+    """
+    _delete_media deletes the media matching criterion and adds a tombstone for each of them, in one statement and
+    without committing
+    @return: a dict of how many media were deleted with each (medium, consumed_state), counted by postgres so the
+        deleted rows aren't sent back
+    """
+    removed = Media.__table__.delete() \
+        .where(criterion) \
+        .returning(Media.id, Media.user, Media.medium, Media.consumed_state) \
+        .cte('removed')
+    tombstones = MediaTombstone.__table__.insert() \
+        .from_select(['id', 'user', 'seq', 'deleted_at'],
+                     select([removed.c.id, removed.c.user, func.nextval(media_seq.name), func.now()])) \
+        .returning(MediaTombstone.id) \
+        .cte('tombstones')
+    # every removed row has a tombstone, joining them just makes the statement insert the tombstones
+    rows = db.session.execute(select([removed.c.medium, removed.c.consumed_state, func.count().label('count')])
+                              .select_from(removed.join(tombstones, removed.c.id == tombstones.c.id))
+                              .group_by(removed.c.medium, removed.c.consumed_state))
+
+    return {(row.medium, row.consumed_state): row.count for row in rows}
+
+
+def get_media(username, medium=None, consumed_state=None, limit=None, after=None):
     """
     get_media returns all the media associated with the given username.
     If medium is set to a medium type, then only the media with the same medium type will be returned.
     If consumed_state is set to a consumed_state, then only the media with the same consumed_state will be returned.
-    @return: a list of media elements
+    The filtering is done in a single query, so only the matching media are loaded from the database.
+    @param limit: if set, at most this many media elements are returned
+    @param after: if set to a (rank, id) pair, only media that come after that pair are returned. This is a keyset
+        seek rather than an OFFSET, so a page deep into the list costs the same as the first page
+    @return: a list of media elements ordered by their rank (and then id)
+    """
+    query = _media_query(username, medium, consumed_state, after)
+
+    if limit is not None:
+        query = query.limit(limit)
+
+    return query.all()
+
+
+def iter_media(username, medium=None, consumed_state=None, after=None, batch_size=1000):
+    """
+    iter_media is the same as get_media, but returns an iterator over the media elements instead of a list. The rows
+    are read from a server side cursor batch_size at a time, so the whole list is never in memory at once
+    """
+    return _media_query(username, medium, consumed_state, after).yield_per(batch_size)
+
+
+def get_media_records(username, medium=None, consumed_state=None, limit=None, after=None):
+    """
+    get_media_records is the same as get_media, but only selects the columns needed to serialize each media element,
+    and returns MediaRecords made straight from the rows instead of Media instances. Use it for read only lists
+    @return: a list of MediaRecords ordered by their rank (and then id)
     """
-    media_list = User.query.filter_by(username=username).first().media
+    query = _media_select(username, medium, consumed_state, after)
+
+    if limit is not None:
+        query = query.limit(limit)
+
+    return [MediaRecord(*row) for row in db.session.execute(query)]
+
+
+async def get_media_records_async(username, medium=None, consumed_state=None, limit=None, after=None):
+    """
+    get_media_records_async is the same as get_media_records, for the async endpoints
+    """
+    query = _media_select(username, medium, consumed_state, after)
+
+    if limit is not None:
+        query = query.limit(limit)
+
+    return [MediaRecord(*row) for row in await async_db.fetch(query)]
+
+
+def iter_media_records(username, medium=None, consumed_state=None, after=None, batch_size=1000):
+    """
+    iter_media_records is the same as get_media_records, but returns a generator that reads the rows from a server side
+    cursor batch_size at a time, so the whole list is never in memory at once
+    """
+    result = db.session.execute(_media_select(username, medium, consumed_state, after)
+                                .execution_options(stream_results=True))
+
+    rows = result.fetchmany(batch_size)
+    while rows:
+        for row in rows:
+            yield MediaRecord(*row)
+        rows = result.fetchmany(batch_size)
+
+
+def get_media_changes(userid, since):
+    """
+    get_media_changes returns what changed in the user's media after since, for clients that already have their list
+    up to since (delta sync). The changed media, the tombstones and the user's pruned_tombstone_seq are read in one
+    statement, so in one snapshot: a change committed while it runs is either in the response, or after its seq. Both
+    sides use a (user, seq) index, so it costs about as much as the number of changes
+    @param since: a seq returned by an earlier call, 0 for the whole list
+    @return: a (changed, deleted, seq, reset) tuple. changed is a list of (MediaRecord, updated_at) tuples of the media
+        added or updated after since, ordered by seq. deleted is a list of the ids of media deleted after since. seq is
+        the largest seq of any of them (since if nothing changed), to pass as since next time. reset is True if
+        tombstones after since were pruned, then changed is the whole list and deleted is empty, and the client has to
+        replace its list rather than update it
+    """
+    # the whole list is sent instead if tombstones after since were pruned
+    changed_after = select([case([(User.pruned_tombstone_seq > since, 0)], else_=since)]) \
+        .where(User.id == userid) \
+        .as_scalar()
+    # tombstones and the user's pruned_tombstone_seq only fill in id and seq
+    blank = [null().label(name) for name in ['medianame', 'medium', 'consumed_state', 'description', 'order', 'rank']]
+    statements = [
+        select([literal_column('\'changed\'').label('kind'), Media.id, Media.medianame, Media.medium,
+                Media.consumed_state, Media.description, Media.order, Media.rank, Media.seq, Media.updated_at])
+        .where(and_(Media.user == userid, Media.seq > changed_after)),
+        select([literal_column('\'pruned\''), User.id] + blank + [User.pruned_tombstone_seq,
+                                                                   null().label('updated_at')])
+        .where(User.id == userid)
+    ]
+    # a client syncing from nothing has nothing to delete
+    if since > 0:
+        statements.append(
+            select([literal_column('\'deleted\''), MediaTombstone.id] + blank + [MediaTombstone.seq,
+                                                                           null().label('updated_at')])
+            .where(and_(MediaTombstone.user == userid, MediaTombstone.seq > since)))
+
+    changed, tombstones, pruned_seq = [], [], 0
+    for row in db.session.execute(union_all(*statements).order_by(literal_column('seq'))):
+        if row.kind == 'changed':
+            changed.append(row)
+        elif row.kind == 'deleted':
+            tombstones.append(row)
+        else:
+            pruned_seq = row.seq
+
+    reset = 0 < since < pruned_seq
+    # the next sync has to be from after the pruned tombstones, or it would start over again
+    seq = max([since, pruned_seq] + [row.seq for row in changed] + [tombstone.seq for tombstone in tombstones])
+    # the whole list leaves out every deleted media element, so a reset has nothing to delete
+    deleted = [] if reset else [tombstone.id for tombstone in tombstones]
+
+    return [(MediaRecord(*row[1:8]), row.updated_at) for row in changed], deleted, seq, reset
+
+
+def prune_media_tombstones(retention):
+    """
+    prune_media_tombstones deletes the tombstones of media deleted more than retention ago, and raises each affected
+    user's pruned_tombstone_seq to the largest seq pruned, so their delta syncs from before it start over. It's one
+    statement that uses the deleted_at index
+    @param retention: a timedelta
+    @return: the number of tombstones deleted
+    """
+    pruned = db.session.execute(text('''
+        WITH pruned AS (
+            DELETE FROM media_tombstones WHERE deleted_at < now() - :retention RETURNING "user", seq
+        ), raised AS (
+            UPDATE users SET pruned_tombstone_seq = greatest(users.pruned_tombstone_seq, users_pruned.seq)
+            FROM (SELECT "user", max(seq) AS seq FROM pruned GROUP BY "user") AS users_pruned
+            WHERE users.id = users_pruned."user"
+        )
+        SELECT count(*) FROM pruned
+    '''), {'retention': retention}).scalar()
+    db.session.commit()
+
+    return pruned
+
+
+def _media_query(username, medium=None, consumed_state=None, after=None):
+    """
+    _media_query builds the ORM query used by get_media and iter_media
+    """
+    return Media.query \
+        .join(User, Media.user == User.id) \
+        .filter(*_media_criteria(username, medium, consumed_state, after)) \
+        .order_by(Media.rank, Media.id)
+
+
+def _media_select(username, medium=None, consumed_state=None, after=None):
+    """
+    _media_select builds the core select used by get_media_records and iter_media_records. The columns are in the order
+    of MediaRecord's arguments
+    """
+    return select([Media.id, Media.medianame, Media.medium, Media.consumed_state, Media.description, Media.order,
+                   Media.rank]) \
+        .select_from(Media.__table__.join(User.__table__, Media.user == User.id)) \
+        .where(and_(*_media_criteria(username, medium, consumed_state, after))) \
+        .order_by(Media.rank, Media.id)
+
+
+def _media_criteria(username, medium=None, consumed_state=None, after=None):
+    """
+    _media_criteria returns the WHERE clause criteria for a user's media list
+    """
+    criteria = [User.username == username]
 
     # if medium is set then only return the media items that have the same medium type
     if medium is not None:
-        media_list = [media for media in media_list if media.medium == medium]
+        criteria.append(Media.medium == medium)
 
     # if consumed is set then only return the media items that have the same consumed value
     if consumed_state is not None:
-        media_list = [media for media in media_list if media.consumed_state == consumed_state]
+        criteria.append(Media.consumed_state == consumed_state)
+
+    if after is not None:
+        criteria.append(tuple_(Media.rank, Media.id) > tuple_(*after))
+
+    return criteria
+
+
+def search_media(username, query, medium=None, consumed_state=None, limit=None, after=None):
+    """
+    search_media returns the media of the given user whose name or description match a full text search, best match
+    first. Matches are found with the search_vector GIN index, and only the matching media are ranked
+    @param query: a search in web search syntax (see postgres' websearch_to_tsquery), e.g. 'star -trek' or
+        '"the matrix" or inception'
+    @param after: if set to a (search rank, id) pair, only matches that come after that pair are returned
+    @return: a list of (MediaRecord, search rank) pairs, ordered by search rank (and then id) from highest to lowest
+    """
+    tsquery = func.websearch_to_tsquery(literal_column("'{}'".format(SEARCH_CONFIG)), query)
+    search_rank = func.ts_rank(Media.search_vector, tsquery)
+
+    criteria = _media_criteria(username, medium, consumed_state)
+    criteria.append(Media.search_vector.op('@@')(tsquery))
+    if after is not None:
+        # ts_rank returns a real, so the cursor's rank is compared as one
+        criteria.append(tuple_(search_rank, Media.id) < tuple_(cast(after[0], REAL), after[1]))
+
+    statement = select([Media.id, Media.medianame, Media.medium, Media.consumed_state, Media.description, Media.order,
+                        Media.rank, search_rank.label('search_rank')]) \
+        .select_from(Media.__table__.join(User.__table__, Media.user == User.id)) \
+        .where(and_(*criteria)) \
+        .order_by(search_rank.desc(), Media.id.desc())
+
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    return [(MediaRecord(*row[:-1]), row.search_rank) for row in db.session.execute(statement)]
+
+
+def autocomplete_media(userid, prefix, limit):
+    """
+    autocomplete_media returns the names of the given user's media that best complete prefix, for suggesting as they
+    type. Names match if prefix is similar to a part of them (pg_trgm's word similarity, so the match is case
+    insensitive and forgives a typo), found with the ("user", medianame) trigram index, which only walks this user's
+    names. The query is ordered by distance alone, so a KNN scan of the index hands the names over best match first
+    and stops after limit of them. Names that match as well are put in order here (which of them make the cut when
+    they straddle limit is up to the index)
+    @param prefix: what the user has typed so far
+    @param limit: at most this many suggestions are returned
+    @return: a list of {'id', 'name'} dicts, best match first, then by name
+    """
+    # medianame %> prefix is the indexable form of word_similarity(prefix, medianame) >= the
+    # pg_trgm.word_similarity_threshold setting. The % is doubled since psycopg2 reads a single one as a parameter
+    matches = Media.medianame.op('%%>')(prefix)
+    # medianame <->> prefix is 1 - word_similarity(prefix, medianame), which the gist index can order by. Any other
+    # ORDER BY key would need a sort of every match instead
+    distance = Media.medianame.op('<->>')(prefix)
+
+    statement = select([Media.id, Media.medianame, distance.label('distance')]) \
+        .where(and_(Media.user == userid, matches)) \
+        .order_by(distance) \
+        .limit(limit)
+    rows = sorted(db.session.execute(statement), key=lambda row: (row.distance, row.medianame, row.id))
 
-    return media_list
+    return [{'id': row.id, 'name': row.medianame} for row in rows]
 
 
 def get_media_by_id(id):
@@ -0,0 +1,346 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import AuthenticationError
+from multiprocessing.managers import BaseManager
+
+from flask import current_app
+
+from database import db
+from metrics import observe_media_cache, observe_media_cache_evictions
+
+logger = logging.getLogger(__name__)
+
+# what talking to an unreachable (or restarted) cache process raises: refused or reset connections, a connection closed
+# in the middle of a call, and a cache process started with another MEDIA_CACHE_AUTHKEY
+CACHE_CONNECTION_ERRORS = (OSError, EOFError, AuthenticationError)
+
+
+class LRUCacheBackend:
+    """
+    LRUCacheBackend keeps cached media list responses in this process, grouped by user so every variant of a user's
+    media list can be dropped at once. When the cached bodies take up more than max_bytes, the least recently used
+    users are evicted
+    """
+    # its methods only take an uncontended lock, so the async endpoints call them on the event loop
+    blocking = False
+
+    def __init__(self, max_bytes=64 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._users = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id, variant):
+        """
+        get returns the (version, body) entry cached for this variant of the user's media list, or None
+        """
+        with self._lock:
+            variants = self._users.get(user_id)
+            if variants is None or variant not in variants:
+                return None
+
+            self._users.move_to_end(user_id)
+            return variants[variant]
+
+    def set(self, user_id, variant, entry):
+        """
+        set caches a (version, body) entry
+        @return: the number of users evicted to make room for it
+        """
+        with self._lock:
+            variants = self._users.setdefault(user_id, {})
+            if variant in variants:
+                self._size -= len(variants[variant][1])
+            variants[variant] = entry
+            self._size += len(entry[1])
+            self._users.move_to_end(user_id)
+
+            evicted = 0
+            while self._size > self.max_bytes and len(self._users) > 1:
+                _, evicted_variants = self._users.popitem(last=False)
+                self._size -= sum(len(body) for _, body in evicted_variants.values())
+                evicted += 1
+
+            self.evictions += evicted
+            return evicted
+
+    def invalidate(self, user_id):
+        """
+        invalidate drops every cached variant of the user's media list
+        """
+        with self._lock:
+            variants = self._users.pop(user_id, None)
+            if variants is not None:
+                self._size -= sum(len(body) for _, body in variants.values())
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'evictions': self.evictions,
+                'users': len(self._users),
+                'bytes': self._size
+            }
+
+
+class MediaCacheManager(BaseManager):
+    pass
+
+
+def parse_media_cache_address(address):
+    """
+    parse_media_cache_address turns 'host:port' into a (host, port) tuple, anything else is used as a unix socket path
+    """
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def serve_media_cache(address, authkey, max_bytes):
+    """
+    serve_media_cache runs a process that holds one LRUCacheBackend shared by every worker that connects to it with
+    SharedCacheBackend. Blocks forever
+    """
+    backend = LRUCacheBackend(max_bytes)
+    MediaCacheManager.register('get_backend', callable=lambda: backend)
+    MediaCacheManager(address=address, authkey=authkey).get_server().serve_forever()
+
+
+class SharedCacheBackend:
+    """
+    SharedCacheBackend keeps cached media list responses in a separate cache process (see media_cache_server.py), so
+    every gunicorn worker shares one cache. It has the same methods as LRUCacheBackend, each one is a round trip to
+    the cache process.
+    While the cache process can't be reached (it's down, restarting, or refuses the connection) every method acts like
+    an empty cache instead of failing the request: get misses (so the body is built from the database), and set,
+    invalidate and clear do nothing. Entries are checked against media_version, so a missed invalidate can't make an
+    out of date entry look fresh. The connection is dropped on an error, and retried at most every retry_interval
+    seconds
+    """
+    # its methods wait on the cache process (or on connecting to it), so the async endpoints call them in a thread
+    blocking = True
+
+    def __init__(self, address, authkey, retry_interval=5):
+        self.address = address
+        self.authkey = authkey
+        self.retry_interval = retry_interval
+        self._backend = None
+        self._retry_at = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            if self._backend is None:
+                if time.monotonic() < self._retry_at:
+                    raise ConnectionError('media cache at {} is unavailable'.format(self.address))
+
+                # connect lazily, so each gunicorn worker opens its own connection after forking
+                MediaCacheManager.register('get_backend')
+                manager = MediaCacheManager(address=self.address, authkey=self.authkey)
+                try:
+                    manager.connect()
+                    self._backend = manager.get_backend()
+                except CACHE_CONNECTION_ERRORS:
+                    self._retry_at = time.monotonic() + self.retry_interval
+                    raise
+            return self._backend
+
+    def _call(self, method, *args, default=None):
+        """
+        _call calls a method of the cache process's backend, and returns default if the cache process can't be reached
+        """
+        try:
+            return getattr(self._connect(), method)(*args)
+        except CACHE_CONNECTION_ERRORS as e:
+            with self._lock:
+                if self._backend is not None:
+                    self._backend = None
+                    self._retry_at = time.monotonic() + self.retry_interval
+            logger.warning('media cache at %s unavailable, %s skipped: %r', self.address, method, e)
+            return default
+
+    def get(self, user_id, variant):
+        return self._call('get', user_id, variant)
+
+    def set(self, user_id, variant, entry):
+        return self._call('set', user_id, variant, entry, default=0)
+
+    def invalidate(self, user_id):
+        self._call('invalidate', user_id)
+
+    def clear(self):
+        self._call('clear')
+
+    def stats(self):
+        return self._call('stats', default={})
+
+
+class MediaCache:
+    """
+    MediaCache caches the serialized JSON body of media list GET responses, keyed by user id and the
+    (medium, consumed_state) filters.
+    Each entry is stored with the user's media_version when it was built, so an entry made before a change in another
+    worker is never served as fresh. Writes through logic.media also invalidate the user's entries right away.
+    With stale_while_revalidate, an out of date entry is served (with the version it was built at) on every request
+    until a background thread has rebuilt it.
+    """
+    def __init__(self, backend=None, stale_while_revalidate=False):
+        self.backend = backend
+        self.stale_while_revalidate = stale_while_revalidate
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._revalidating = set()
+        self._lock = threading.Lock()
+
+    def configure(self, backend, stale_while_revalidate=False):
+        """
+        configure changes the backend of this cache, a backend of None disables caching
+        """
+        with self._lock:
+            self.backend = backend
+            self.stale_while_revalidate = stale_while_revalidate
+            self.hits = 0
+            self.misses = 0
+            self.stale_hits = 0
+
+    def get_or_build(self, user_id, variant, version, build):
+        """
+        get_or_build returns the cached body for this variant of the user's media list if it was built at the given
+        version, otherwise it calls build to make the body and caches it
+        @param version: the user's current media_version
+        @param build: a function with no arguments that returns the body as bytes. It has to work without a request
+            context, since it may be called from a background thread
+        @return: a (version, body) tuple, with the media_version the body was built at. It's older than version when
+            stale_while_revalidate serves an out of date entry, so it's what an ETag for the body has to be made from
+        """
+        if self.backend is None:
+            return version, build()
+
+        entry = self.backend.get(user_id, variant)
+
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            observe_media_cache('hit')
+            return entry
+
+        if entry is not None and self.stale_while_revalidate:
+            self.stale_hits += 1
+            observe_media_cache('stale')
+            self._revalidate(user_id, variant, version, build)
+            return entry
+
+        self.misses += 1
+        observe_media_cache('miss')
+        body = build()
+        self._set(user_id, variant, (version, body))
+        return version, body
+
+    def get(self, user_id, variant, version):
+        """
+        get returns the cached body for this variant of the user's media list if it was built at the given version,
+        otherwise None. Used by the async endpoints, which build the body themselves and then set it. Unlike
+        get_or_build, an out of date entry is never served
+        """
+        if self.backend is None:
+            return None
+
+        entry = self.backend.get(user_id, variant)
+
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            observe_media_cache('hit')
+            return entry[1]
+
+        self.misses += 1
+        observe_media_cache('miss')
+        return None
+
+    def set(self, user_id, variant, version, body):
+        """
+        set caches the body of this variant of the user's media list, built at the given version
+        """
+        if self.backend is not None:
+            self._set(user_id, variant, (version, body))
+
+    async def get_async(self, user_id, variant, version):
+        """
+        get_async is get for the async endpoints. A blocking backend (the shared cache process) is called on the event
+        loop's default thread pool, so waiting on it doesn't hold up every other connection of the worker
+        """
+        return await self._run_async(self.get, user_id, variant, version)
+
+    async def set_async(self, user_id, variant, version, body):
+        """
+        set_async is set for the async endpoints, see get_async
+        """
+        await self._run_async(self.set, user_id, variant, version, body)
+
+    def invalidate(self, user_id):
+        """
+        invalidate drops every cached variant of the user's media list, called after every write to their media
+        """
+        if self.backend is not None:
+            self.backend.invalidate(user_id)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        """
+        stats returns the hit, miss and stale hit counters of this worker, and the backend's eviction count and size
+        """
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits
+        }
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        return stats
+
+    async def _run_async(self, f, *args):
+        if self.backend is None or not self.backend.blocking:
+            return f(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(None, f, *args)
+
+    def _set(self, user_id, variant, entry):
+        evicted = self.backend.set(user_id, variant, entry)
+        if evicted:
+            observe_media_cache_evictions(evicted)
+
+    def _revalidate(self, user_id, variant, version, build):
+        key = (user_id, variant)
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        app = current_app._get_current_object()
+
+        def revalidate():
+            try:
+                with app.app_context():
+                    try:
+                        self._set(user_id, variant, (version, build()))
+                    finally:
+                        db.session.remove()
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        threading.Thread(target=revalidate, daemon=True).start()
+
+
+media_cache = MediaCache()
@@ -0,0 +1,97 @@
+from collections import Counter
+
+from sqlalchemy import select, func, and_, text
+from sqlalchemy.dialects.postgresql import insert
+
+from database import db
+
+from models.media import Media, mediums, consumed_states
+from models.media_count import MediaCount
+
+
+def change_media_counts(userid, changes):
+    """
+    change_media_counts adds to the user's media counts with a single INSERT ... ON CONFLICT, without committing. It's
+    called by every function in logic.media that adds or removes media, or changes their medium or consumed_state, so
+    the counts are committed in the same transaction as the media
+    @param changes: a Counter (or dict) of how much to add to each (medium, consumed_state) count, negative to subtract
+    """
+    values = [{'user': userid, 'medium': medium, 'consumed_state': consumed_state, 'count': change}
+              for (medium, consumed_state), change in sorted(changes.items()) if change != 0]
+    if not values:
+        return
+
+    statement = insert(MediaCount.__table__).values(values)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[MediaCount.user, MediaCount.medium, MediaCount.consumed_state],
+        set_={'count': MediaCount.count + statement.excluded['count']}))
+
+
+def get_media_counts(userid):
+    """
+    get_media_counts returns how many of the user's media have each medium and consumed_state
+    @return: a dict of {medium: {consumed_state: count}}, with every medium and consumed_state (0 if the user has none)
+    """
+    counts = {medium: {consumed_state: 0 for consumed_state in consumed_states} for medium in mediums}
+    rows = db.session.query(MediaCount.medium, MediaCount.consumed_state, MediaCount.count) \
+        .filter(MediaCount.user == userid) \
+        .all()
+    for row in rows:
+        counts[row.medium][row.consumed_state] = row.count
+
+    return counts
+
+
+def count_media_changes(rows):
+    """
+    count_media_changes adds up rows with a medium and a consumed_state (like the rows of removed or added media)
+    @return: a Counter of how many rows there are with each (medium, consumed_state)
+    """
+    return Counter((row.medium, row.consumed_state) for row in rows)
+
+
+def _actual_media_counts():
+    # the counts media_counts should have, counted from the media table
+    return select([Media.user, Media.medium, Media.consumed_state, func.count().label('count')]) \
+        .where(Media.user.isnot(None)) \
+        .group_by(Media.user, Media.medium, Media.consumed_state)
+
+
+def check_media_counts():
+    """
+    check_media_counts compares every media count with a count of the media table
+    @return: a list of (user id, medium, consumed_state, stored count, actual count) tuples, one for each count that
+        drifted. A count with no row is 0
+    """
+    actual = _actual_media_counts().alias('actual')
+    stored = MediaCount.__table__
+    on = and_(stored.c.user == actual.c.user, stored.c.medium == actual.c.medium,
+              stored.c.consumed_state == actual.c.consumed_state)
+    stored_count = func.coalesce(stored.c.count, 0)
+    actual_count = func.coalesce(actual.c.count, 0)
+
+    user = func.coalesce(stored.c.user, actual.c.user)
+    medium = func.coalesce(stored.c.medium, actual.c.medium)
+    consumed_state = func.coalesce(stored.c.consumed_state, actual.c.consumed_state)
+
+    rows = db.session.execute(select([user, medium, consumed_state, stored_count, actual_count])
+                              .select_from(stored.join(actual, on, full=True))
+                              .where(stored_count != actual_count)
+                              .order_by(user, medium, consumed_state))
+
+    return [tuple(row) for row in rows]
+
+
+def rebuild_media_counts():
+    """
+    rebuild_media_counts replaces every media count with a count of the media table, in one transaction. The media
+    table is locked against changes until then, so no change is counted twice or missed
+    @return: the number of media counts written
+    """
+    db.session.execute(text('LOCK TABLE media IN SHARE MODE'))
+    db.session.execute(MediaCount.__table__.delete())
+    written = db.session.execute(MediaCount.__table__.insert().from_select(
+        ['user', 'medium', 'consumed_state', 'count'], _actual_media_counts())).rowcount
+    db.session.commit()
+
+    return written
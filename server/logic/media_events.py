@@ -0,0 +1,147 @@
+import asyncio
+
+import asyncpg
+
+from metrics import MEDIA_EVENT_STREAMS
+
+# logic.media notifies this postgres channel, with a '<user id>:<media_version>' payload, whenever a user's media change
+MEDIA_EVENTS_CHANNEL = 'media_changes'
+
+
+class MediaEventSubscription:
+    """
+    MediaEventSubscription is one /user/<username>/media/events stream's view of a user's notifications. It only holds
+    the newest media_version it hasn't handed out yet, so a stream that falls behind skips straight to the newest
+    version instead of piling up notifications
+    """
+    def __init__(self, broker, user_id):
+        self.user_id = user_id
+        self.closed = False
+        self._broker = broker
+        self._version = None
+        self._changed = asyncio.Event()
+
+    def notify(self, version):
+        if self._version is None or version > self._version:
+            self._version = version
+        self._changed.set()
+
+    async def wait(self, timeout):
+        """
+        wait waits up to timeout seconds for the user's media to change
+        @return: the newest media_version notified since the last wait, or None if there was none within timeout (or
+            the subscription was closed)
+        """
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        self._changed.clear()
+        version, self._version = self._version, None
+        return version
+
+    def close(self):
+        """
+        close unsubscribes, and wakes up a wait that's in progress
+        """
+        if not self.closed:
+            self.closed = True
+            self._broker.unsubscribe(self)
+        self._changed.set()
+
+
+class MediaEventBroker:
+    """
+    MediaEventBroker fans out the notifications logic.media sends on MEDIA_EVENTS_CHANNEL to every media event stream
+    of this worker. However many streams are open, it LISTENs on a single asyncpg connection (opened when the first
+    stream subscribes), and hands each notification to the subscriptions of its user only.
+    If that connection is lost every subscription is closed, so their clients reconnect and catch up on what they
+    missed, and the next subscription opens a new connection. It has to be used from a single event loop
+    """
+    def __init__(self):
+        self.dsn = None
+        self._connection = None
+        self._connect_lock = None
+        self._subscriptions = {}
+
+    def configure(self, dsn):
+        """
+        configure sets the database url to LISTEN on, it's used the next time a connection is opened
+        """
+        self.dsn = dsn
+
+    async def subscribe(self, user_id):
+        """
+        subscribe starts listening for changes to the user's media, the subscription gets every change committed after
+        this returns
+        @return: a MediaEventSubscription, which has to be closed when it's no longer used
+        """
+        await self.listen()
+
+        subscription = MediaEventSubscription(self, user_id)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        MEDIA_EVENT_STREAMS.inc()
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.user_id]
+        MEDIA_EVENT_STREAMS.dec()
+
+    def subscribers(self, user_id):
+        """
+        subscribers returns how many subscriptions the user has open in this worker
+        """
+        return len(self._subscriptions.get(user_id, ()))
+
+    async def listen(self):
+        """
+        listen opens the listening connection, unless it's already open
+        """
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            if self._connection is not None and not self._connection.is_closed():
+                return
+
+            connection = await asyncpg.connect(self.dsn)
+            connection.add_termination_listener(self._connection_lost)
+            await connection.add_listener(MEDIA_EVENTS_CHANNEL, self._notified)
+            self._connection = connection
+
+    async def close(self):
+        """
+        close closes the listening connection and every subscription
+        """
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            await connection.close()
+        self._close_subscriptions()
+        self._connect_lock = None
+
+    def _notified(self, connection, pid, channel, payload):
+        user_id, _, version = payload.partition(':')
+        for subscription in self._subscriptions.get(int(user_id), ()):
+            subscription.notify(int(version))
+
+    def _connection_lost(self, connection):
+        # close() forgets the connection before closing it, so this is only for connections lost while in use
+        if connection is self._connection:
+            self._connection = None
+            self._close_subscriptions()
+
+    def _close_subscriptions(self):
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in list(subscriptions):
+                subscription.close()
+
+
+media_event_broker = MediaEventBroker()
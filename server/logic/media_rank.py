@@ -0,0 +1,75 @@
+import threading
+
+from flask import current_app
+
+from database import db
+
+
+class RankRenormalizer:
+    """
+    RankRenormalizer runs logic.media.renormalize_media_ranks for users whose media list needs it after a move, on a
+    background thread delay seconds later. Moves made in the meantime are renormalized by the same run, so a user
+    moving many media elements costs one renormalization, not one per move
+    """
+    def __init__(self, delay=5):
+        self.delay = delay
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def configure(self, delay):
+        """
+        configure changes the delay of this renormalizer, a delay of 0 renormalizes right away on the calling thread
+        """
+        with self._lock:
+            self.delay = delay
+
+    def schedule(self, user_id, renormalize):
+        """
+        schedule renormalizes the user's media list later, unless a renormalization is already waiting for them
+        @param renormalize: a function that takes the user id and renormalizes their media list, it is called with an
+            app context and its session removed afterwards
+        """
+        if not self.delay:
+            renormalize(user_id)
+            return
+
+        app = current_app._get_current_object()
+
+        def run():
+            # a move made from here on schedules another run, since this one might not see it
+            with self._lock:
+                self._pending.pop(user_id, None)
+
+            with app.app_context():
+                try:
+                    renormalize(user_id)
+                except Exception:
+                    app.logger.exception('failed to renormalize media ranks of user {}'.format(user_id))
+                finally:
+                    db.session.remove()
+
+        with self._lock:
+            if user_id in self._pending:
+                return
+            timer = self._pending[user_id] = threading.Timer(self.delay, run)
+            timer.daemon = True
+            timer.start()
+
+    def pending(self):
+        """
+        pending returns the ids of the users waiting to be renormalized
+        """
+        with self._lock:
+            return set(self._pending)
+
+    def clear(self):
+        """
+        clear cancels every renormalization that hasn't started yet
+        """
+        with self._lock:
+            for timer in self._pending.values():
+                timer.cancel()
+            self._pending.clear()
+
+
+rank_renormalizer = RankRenormalizer()
@@ -0,0 +1,162 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class TokenCache:
+    """
+    TokenCache is a bounded LRU cache of auth tokens whose signature has already been verified, mapping each token to
+    the (user id, token generation) claims it was issued with. This lets login_required skip decoding tokens it has
+    recently seen. Whether the token's generation is still the user's is checked on every request (see
+    TokenGenerationCache), so caching a token never keeps it working after a logout.
+    An entry lives for at most ttl seconds, and never past the token's own expiry. Each gunicorn worker has its own
+    cache.
+    """
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_size, ttl):
+        """
+        configure changes the size and ttl of this cache, dropping every entry
+        """
+        with self._lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, auth_token):
+        """
+        get returns the (user id, token generation) cached for this auth token, or None if it isn't cached (or the entry
+        has expired)
+        """
+        with self._lock:
+            entry = self._entries.get(auth_token)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[auth_token]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(auth_token)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, auth_token, claims, expires_at):
+        """
+        set caches a verified auth token
+        @param claims: the ('sub', 'gen') claims of the auth token
+        @param expires_at: the 'exp' claim of the auth token, as a unix timestamp
+        """
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[auth_token] = (claims, min(expires_at, time.time() + self.ttl))
+            self._entries.move_to_end(auth_token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, auth_token):
+        """
+        invalidate removes an auth token from the cache
+        """
+        with self._lock:
+            self._entries.pop(auth_token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        stats returns the hit and miss counters and the current size of the cache
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries)
+            }
+
+
+class TokenGenerationCache:
+    """
+    TokenGenerationCache is a bounded LRU cache of each user's current token generation, so checking an auth token's
+    'gen' claim doesn't need a query for users seen in the last ttl seconds. A logout updates the entry of the worker it
+    was made through right away, other workers keep accepting the logged out tokens until their entry expires, so ttl
+    is how long a logout takes to reach every worker.
+    """
+    def __init__(self, max_size=100000, ttl=5):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_size, ttl):
+        """
+        configure changes the size and ttl of this cache, dropping every entry
+        """
+        with self._lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, user_id):
+        """
+        get returns the token generation cached for this user, or None if it isn't cached (or the entry has expired)
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[user_id]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, user_id, token_generation):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[user_id] = (token_generation, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        stats returns the hit and miss counters and the current size of the cache
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries)
+            }
+
+
+token_cache = TokenCache()
+token_generations = TokenGenerationCache()
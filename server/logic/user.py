@@ -1,6 +1,11 @@
+from sqlalchemy import select
+
 from database import db
-from models.user import User
-import bcrypt
+from async_database import async_db
+from models.user import User, UserRecord
+from password_hashing import password_hasher
+
+from logic.token_cache import token_generations
 
 
 def add_user(username, password):
@@ -29,3 +34,83 @@ def get_user_by_id(user_id):
     get_user_by_id queries the database for a user with the given user id, returning the user instance
     """
     return User.query.filter_by(id=user_id).first()
+
+
+def revoke_auth_tokens(user_id):
+    """
+    revoke_auth_tokens increments the user's token generation, so every auth token issued to them so far stops being
+    accepted. This worker sees the new generation right away, other workers within AUTH_TOKEN_GENERATION_TTL seconds
+    @return: the user's new token generation, or None if there is no user with this id
+    """
+    token_generation = db.session.execute(User.__table__.update()
+                                          .where(User.id == user_id)
+                                          .values(token_generation=User.token_generation + 1)
+                                          .returning(User.token_generation)).scalar()
+    db.session.commit()
+
+    if token_generation is not None:
+        token_generations.set(user_id, token_generation)
+
+    return token_generation
+
+
+async def add_user_async(username, password):
+    """
+    add_user_async is the same as add_user, for the async endpoints
+    @return: a UserRecord of the newly created user
+    """
+    passhash = await password_hasher.hash_password_async(password)
+    user_id = await async_db.fetchval(User.__table__.insert()
+                                      .values(username=username, passhash=passhash, media_version=0,
+                                              token_generation=0, pruned_tombstone_seq=0)
+                                      .returning(User.id))
+
+    return UserRecord(user_id, username, passhash, 0, 0)
+
+
+async def get_user_async(username):
+    """
+    get_user_async is the same as get_user, for the async endpoints
+    @return: a UserRecord, or None if there is no user with this username
+    """
+    row = await async_db.fetchrow(select([User.id, User.username, User.passhash, User.media_version,
+                                          User.token_generation])
+                                  .where(User.username == username))
+
+    return UserRecord(*row) if row is not None else None
+
+
+def get_token_generation(user_id):
+    """
+    get_token_generation returns the user's current token generation, from token_generations if it was looked up in the
+    last AUTH_TOKEN_GENERATION_TTL seconds
+    @return: the token generation, or None if there is no user with this id
+    """
+    token_generation = token_generations.get(user_id)
+    if token_generation is None:
+        token_generation = db.session.query(User.token_generation).filter(User.id == user_id).scalar()
+        if token_generation is not None:
+            token_generations.set(user_id, token_generation)
+
+    return token_generation
+
+
+async def get_token_generation_async(user_id):
+    """
+    get_token_generation_async is the same as get_token_generation, for the async endpoints
+    """
+    token_generation = token_generations.get(user_id)
+    if token_generation is None:
+        token_generation = await async_db.fetchval(select([User.token_generation]).where(User.id == user_id))
+        if token_generation is not None:
+            token_generations.set(user_id, token_generation)
+
+    return token_generation
+
+
+async def get_media_version_async(user_id):
+    """
+    get_media_version_async returns the user's current media_version, straight from the database
+    @return: the media_version, or None if there is no user with this id
+    """
+    return await async_db.fetchval(select([User.media_version]).where(User.id == user_id))
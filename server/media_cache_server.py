@@ -0,0 +1,24 @@
+"""
+media_cache_server runs the shared media list response cache used when MEDIA_CACHE is 'shared'. Every gunicorn worker
+connects to it at MEDIA_CACHE_ADDRESS, so they all share one cache. It reads the same MEDIA_CACHE_* environment
+variables as app.py (it doesn't import app.py, so it never connects to the database). MEDIA_CACHE_AUTHKEY has no
+default, since whoever knows it can send the cache process pickles
+
+usage: python media_cache_server.py
+"""
+import os
+import sys
+
+from logic.media_cache import serve_media_cache, parse_media_cache_address
+
+MEDIA_CACHE_ADDRESS = os.environ.get('MEDIA_CACHE_ADDRESS', '127.0.0.1:11311')
+MEDIA_CACHE_AUTHKEY = os.environ.get('MEDIA_CACHE_AUTHKEY')
+MEDIA_CACHE_MAX_BYTES = int(os.environ.get('MEDIA_CACHE_MAX_BYTES', 64 * 2 ** 20))
+
+if __name__ == '__main__':
+    if not MEDIA_CACHE_AUTHKEY:
+        sys.exit('MEDIA_CACHE_AUTHKEY has to be set')
+
+    print('serving media cache at {}'.format(MEDIA_CACHE_ADDRESS))
+    serve_media_cache(parse_media_cache_address(MEDIA_CACHE_ADDRESS), MEDIA_CACHE_AUTHKEY.encode('utf-8'),
+                      MEDIA_CACHE_MAX_BYTES)
@@ -0,0 +1,108 @@
+import os
+import time
+
+from flask import g, request
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST,
+                               generate_latest, multiprocess)
+
+from database import db
+
+# when PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py) every gunicorn worker writes its metrics to files in that
+# directory, and /metrics adds up the metrics of all the workers
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+REQUEST_LATENCY = Histogram('gogomedia_request_duration_seconds', 'Request latency', ['route', 'method'])
+REQUESTS_IN_FLIGHT = Gauge('gogomedia_requests_in_flight', 'Requests currently being handled',
+                           multiprocess_mode='livesum')
+DB_POOL_CHECKED_OUT = Gauge('gogomedia_db_pool_checked_out', 'Database connections checked out of the pool',
+                            multiprocess_mode='livesum')
+DB_POOL_OVERFLOW = Gauge('gogomedia_db_pool_overflow', 'Database connections opened past the pool size',
+                         multiprocess_mode='livesum')
+DB_POOL_TIMEOUTS = Counter('gogomedia_db_pool_timeouts_total',
+                           'Requests that gave up waiting for a database connection')
+PASSWORD_HASHING_LATENCY = Histogram('gogomedia_password_hashing_duration_seconds',
+                                     'Time spent hashing or checking a password with bcrypt, including waiting '
+                                     'for the pool', ['operation'])
+AUTH_TOKEN_CACHE_REQUESTS = Counter('gogomedia_auth_token_cache_requests_total',
+                                    'Auth token cache lookups, by hit or miss', ['result'])
+MEDIA_CACHE_REQUESTS = Counter('gogomedia_media_cache_requests_total',
+                               'Media list response cache lookups, by hit, stale hit or miss', ['result'])
+MEDIA_CACHE_EVICTIONS = Counter('gogomedia_media_cache_evictions_total',
+                                'Users evicted from the media list response cache')
+MEDIA_EVENT_STREAMS = Gauge('gogomedia_media_event_streams', 'Media event streams currently open',
+                            multiprocess_mode='livesum')
+AUTOCOMPLETE_CACHE_REQUESTS = Counter('gogomedia_autocomplete_cache_requests_total',
+                                      'Autocomplete suggestion cache lookups, by hit or miss', ['result'])
+
+
+def observe_request(route, method, start_time):
+    REQUEST_LATENCY.labels(route, method).observe(time.perf_counter() - start_time)
+
+
+def observe_password_hashing(operation, start_time):
+    PASSWORD_HASHING_LATENCY.labels(operation).observe(time.perf_counter() - start_time)
+
+
+def observe_auth_token_cache(hit):
+    AUTH_TOKEN_CACHE_REQUESTS.labels('hit' if hit else 'miss').inc()
+
+
+def observe_db_pool_timeout():
+    DB_POOL_TIMEOUTS.inc()
+
+
+def observe_media_cache(result):
+    MEDIA_CACHE_REQUESTS.labels(result).inc()
+
+
+def observe_media_cache_evictions(count):
+    MEDIA_CACHE_EVICTIONS.inc(count)
+
+
+def observe_autocomplete_cache(result):
+    AUTOCOMPLETE_CACHE_REQUESTS.labels(result).inc()
+
+
+def update_db_pool_gauges():
+    pool = db.engine.pool
+    # only QueuePool keeps track of checked out and overflow connections
+    if hasattr(pool, 'checkedout') and hasattr(pool, 'overflow'):
+        DB_POOL_CHECKED_OUT.set(pool.checkedout())
+        DB_POOL_OVERFLOW.set(max(0, pool.overflow()))
+
+
+def generate_metrics():
+    """
+    generate_metrics returns the current metrics in the prometheus text format, and its content type
+    """
+    update_db_pool_gauges()
+
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def init_metrics(app):
+    """
+    init_metrics records the latency of every request of app, and the number of requests in flight
+    """
+    @app.before_request
+    def start_request_timer():
+        g.metrics_start_time = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        update_db_pool_gauges()
+
+    @app.teardown_request
+    def stop_request_timer(exception=None):
+        start_time = g.pop('metrics_start_time', None)
+        if start_time is None:
+            return
+
+        REQUESTS_IN_FLIGHT.dec()
+        # label by url rule rather than path, so there is one time series per endpoint
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        observe_request(route, request.method, start_time)
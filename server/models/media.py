@@ -1,4 +1,8 @@
+from sqlalchemy import text, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
 from database import db
+from fractional_rank import rank_for_order
 
 mediums = {'film', 'audio', 'literature', 'other'}
 medium_type = db.Enum(*mediums, name='medium_type', validate_strings=True)
@@ -6,9 +10,35 @@ medium_type = db.Enum(*mediums, name='medium_type', validate_strings=True)
 consumed_states = {'not started', 'started', 'finished'}
 consumed_state_type = db.Enum(*consumed_states, name='consumed_state_type', validate_strings=True)
 
+# the text search configuration media are searched with, search_vector has to be rebuilt if this changes
+SEARCH_CONFIG = 'english'
+
+# backs autocomplete, see logic.media.autocomplete_media. It's a gist index on ("user", medianame) so a lookup only
+# walks the user's own names, and it needs the pg_trgm and btree_gist (for the "user" key) extensions, so it isn't
+# declared in Media.__table_args__ (create_all would fail on a postgres without them). The migration adds it, and
+# create_trigram_index adds it to a schema made with create_all
+MEDIANAME_TRIGRAM_INDEX = 'ix_media_user_medianame_trgm'
+TRIGRAM_INDEX_EXTENSIONS = ['pg_trgm', 'btree_gist']
+
+# every insert or update of a media element gives it the next value of this sequence as its seq, and every delete gives
+# its tombstone one (see models.media_tombstone), so a client can ask for everything that changed after the largest seq
+# it has seen. Changes to a user's media are made one transaction at a time (see logic.media._bump_media_version), so
+# within one user's media, seqs are committed in increasing order
+media_seq = db.Sequence('media_seq', metadata=db.Model.metadata)
+
 
 class Media(db.Model):
     __tablename__ = 'media'
+    __table_args__ = (
+        # backs the filtered media list query in logic.media.get_media
+        db.Index('ix_media_user_medium_consumed_state_rank', 'user', 'medium', 'consumed_state', 'rank'),
+        # backs keyset pagination over a user's unfiltered media list, and finding a media element's neighbours
+        db.Index('ix_media_user_rank_id', 'user', 'rank', 'id'),
+        # backs full text search, see logic.media.search_media
+        db.Index('ix_media_search_vector', 'search_vector', postgresql_using='gin'),
+        # backs delta sync, see logic.media.get_media_changes
+        db.Index('ix_media_user_seq', 'user', 'seq'),
+    )
     id = db.Column('id', db.Integer, primary_key=True)
     medianame = db.Column('medianame', db.String(80))
     user = db.Column('user', db.Integer, db.ForeignKey('users.id'))
@@ -16,8 +46,23 @@ class Media(db.Model):
     consumed_state = db.Column('consumed_state', consumed_state_type, default='not started')
     description = db.Column('description', db.String(500))
     order = db.Column('order', db.Integer, default=0)
+    # media lists are sorted by rank (see fractional_rank). order is kept for clients that still set it: setting it
+    # sets rank to rank_for_order(order), and logic.media.renormalize_media_ranks sets it to each element's position
+    rank = db.Column('rank', db.String(collation='C'), nullable=False)
+    # kept up to date by postgres, and weighted so matches in the name rank above matches in the description. Deferred,
+    # since only searches use it
+    search_vector = db.deferred(db.Column('search_vector', TSVECTOR, db.Computed(
+        "setweight(to_tsvector('{0}', coalesce(medianame, '')), 'A') || "
+        "setweight(to_tsvector('{0}', coalesce(description, '')), 'B')".format(SEARCH_CONFIG), persisted=True)))
+    # set by postgres on every insert, and by SQLAlchemy on every update. Statements written as text (like the
+    # UPDATE ... FROM VALUES in logic.media) set them themselves
+    seq = db.Column('seq', db.BigInteger, server_default=media_seq.next_value(), onupdate=media_seq.next_value(),
+                    nullable=False)
+    updated_at = db.Column('updated_at', db.DateTime(timezone=True), server_default=func.now(), onupdate=func.now(),
+                           nullable=False)
 
-    def __init__(self, medianame, userid, medium='other', consumed_state='not started', description='', order=0):
+    def __init__(self, medianame, userid, medium='other', consumed_state='not started', description='', order=0,
+                 rank=None):
         if medium not in mediums:
             raise ValueError('medium must be one of these values: {}'.format(mediums))
         if consumed_state not in consumed_states:
@@ -29,10 +74,11 @@ class Media(db.Model):
         self.consumed_state = consumed_state
         self.description = description
         self.order = order
+        self.rank = rank if rank is not None else rank_for_order(order)
 
     def __repr__(self):
-        return '<Media(id={}, medianame={}, user={}, medium={}, consumed_state={}, order={})>'.format(
-            self.medianame, self.user, self.medium, self.consumed_state, self.order)
+        return '<Media(id={}, medianame={}, user={}, medium={}, consumed_state={}, order={}, rank={})>'.format(
+            self.id, self.medianame, self.user, self.medium, self.consumed_state, self.order, self.rank)
 
     def as_dict(self):
         """
@@ -46,3 +92,70 @@ class Media(db.Model):
             'description': self.description,
             'order': self.order
         }
+
+    @staticmethod
+    def row_as_dict(row):
+        """
+        returns the same dict as as_dict, but for a row selected from the media table instead of a Media instance
+        """
+        return {
+            'id': row.id,
+            'name': row.medianame,
+            'medium': row.medium,
+            'consumed_state': row.consumed_state,
+            'description': row.description,
+            'order': row.order
+        }
+
+
+class MediaRecord:
+    """
+    MediaRecord is a read only media element made straight from a selected row, without the identity map and change
+    tracking bookkeeping of a Media instance. Used to serialize media lists
+    """
+    __slots__ = ('id', 'medianame', 'medium', 'consumed_state', 'description', 'order', 'rank')
+
+    def __init__(self, id, medianame, medium, consumed_state, description, order, rank):
+        self.id = id
+        self.medianame = medianame
+        self.medium = medium
+        self.consumed_state = consumed_state
+        self.description = description
+        self.order = order
+        self.rank = rank
+
+    def __repr__(self):
+        return '<MediaRecord(id={}, medianame={}, medium={}, consumed_state={}, order={})>'.format(
+            self.id, self.medianame, self.medium, self.consumed_state, self.order)
+
+    def as_dict(self):
+        """
+        returns the same dict as Media.as_dict
+        """
+        return {
+            'id': self.id,
+            'name': self.medianame,
+            'medium': self.medium,
+            'consumed_state': self.consumed_state,
+            'description': self.description,
+            'order': self.order
+        }
+
+
+def create_trigram_index(bind):
+    """
+    create_trigram_index installs the pg_trgm and btree_gist extensions (if they aren't already) and adds the trigram
+    index on media ("user", medianame) used by autocomplete
+    @param bind: an engine or connection to a database the media table was created in
+    @return: False if either extension isn't available on this postgres server, so nothing was added, otherwise True
+    """
+    available = bind.execute(text('SELECT count(*) FROM pg_available_extensions WHERE name = ANY(:names)'),
+                             names=TRIGRAM_INDEX_EXTENSIONS).scalar()
+    if available < len(TRIGRAM_INDEX_EXTENSIONS):
+        return False
+
+    for extension in TRIGRAM_INDEX_EXTENSIONS:
+        bind.execute(text('CREATE EXTENSION IF NOT EXISTS {}'.format(extension)))
+    bind.execute(text('CREATE INDEX IF NOT EXISTS {} ON media USING gist ("user", medianame gist_trgm_ops)'.format(
+        MEDIANAME_TRIGRAM_INDEX)))
+    return True
@@ -0,0 +1,21 @@
+from database import db
+
+from models.media import medium_type, consumed_state_type
+
+
+class MediaCount(db.Model):
+    """
+    MediaCount is how many of a user's media have a medium and consumed_state. The counts are kept up to date by
+    logic.media in the same transaction as every change to the media table, so a user's stats are read from at most
+    len(mediums) * len(consumed_states) rows instead of counting their media. logic.media_count.check_media_counts
+    finds counts that drifted from the media table, and rebuild_media_counts fixes them
+    """
+    __tablename__ = 'media_counts'
+    user = db.Column('user', db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    medium = db.Column('medium', medium_type, primary_key=True)
+    consumed_state = db.Column('consumed_state', consumed_state_type, primary_key=True)
+    count = db.Column('count', db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<MediaCount(user={}, medium={}, consumed_state={}, count={})>'.format(
+            self.user, self.medium, self.consumed_state, self.count)
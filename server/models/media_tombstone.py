@@ -0,0 +1,23 @@
+from database import db
+
+
+class MediaTombstone(db.Model):
+    """
+    MediaTombstone records that a media element was deleted, so delta syncs (see logic.media.get_media_changes) can tell
+    clients to drop it. Its seq comes from the same sequence as Media.seq. Tombstones are kept for
+    MEDIA_TOMBSTONE_RETENTION_DAYS, see logic.media.prune_media_tombstones
+    """
+    __tablename__ = 'media_tombstones'
+    __table_args__ = (
+        db.Index('ix_media_tombstones_user_seq', 'user', 'seq'),
+        db.Index('ix_media_tombstones_deleted_at', 'deleted_at'),
+    )
+    # the id the media element had
+    id = db.Column('id', db.Integer, primary_key=True, autoincrement=False)
+    user = db.Column('user', db.Integer, db.ForeignKey('users.id'), nullable=False)
+    seq = db.Column('seq', db.BigInteger, nullable=False)
+    deleted_at = db.Column('deleted_at', db.DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return '<MediaTombstone(id={}, user={}, seq={}, deleted_at={})>'.format(
+            self.id, self.user, self.seq, self.deleted_at)
@@ -1,10 +1,12 @@
 from database import db
 from flask import current_app
-import bcrypt
 import jwt
 import datetime
 
-from models.blacklisted_token import BlacklistedToken
+from password_hashing import password_hasher
+
+# how long an auth token is valid for
+AUTH_TOKEN_LIFETIME = datetime.timedelta(hours=5)
 
 
 class User(db.Model):
@@ -12,12 +14,21 @@ class User(db.Model):
     id = db.Column('id', db.Integer, primary_key=True)
     username = db.Column('username', db.String(50), unique=True, nullable=False)
     passhash = db.Column('passhash', db.String(60))
+    # incremented in the same transaction as every change to this user's media, used for media list ETags
+    media_version = db.Column('media_version', db.Integer, nullable=False, default=0, server_default='0')
+    # every auth token carries the generation it was issued in (its 'gen' claim), and only tokens of the current
+    # generation are accepted. Logging out increments it, which logs out every token issued to this user so far
+    token_generation = db.Column('token_generation', db.Integer, nullable=False, default=0, server_default='0')
+    # the largest seq of this user's media tombstones that were pruned (see logic.media.prune_media_tombstones), delta
+    # syncs from before it could miss a delete, so they start over with the whole list
+    pruned_tombstone_seq = db.Column('pruned_tombstone_seq', db.BigInteger, nullable=False, default=0,
+                                     server_default='0')
     media = db.relationship('Media', backref='users', lazy=True)
 
     def __init__(self, username, password):
         self.username = username
-        password = password.encode('utf-8')
-        self.passhash = bcrypt.hashpw(password, bcrypt.gensalt()).decode('utf-8')
+        # raises PasswordHashingBusyError if too many passwords are already being hashed
+        self.passhash = password_hasher.hash_password(password)
 
     def __repr__(self):
         return '<User(id={}, username={}, passhash={})>'.format(
@@ -27,18 +38,27 @@ class User(db.Model):
         """
         authenticate_password takes an unhashed password, and returns True if this mathces the
         hashed password + salt for this user
+        raises PasswordHashingBusyError if too many passwords are already being checked
         """
-        return bcrypt.checkpw(password.encode('utf-8'), self.passhash.encode('utf-8'))
+        return password_hasher.check_password(password, self.passhash)
 
     def encode_auth_token(self):
         """
-        get_auth_token generates a new auth token with this user's id
+        get_auth_token generates a new auth token with this user's id and current token generation
         @return: a string representing the auth token to use
         """
+        return User.encode_auth_token_for(self.id, self.token_generation or 0)
+
+    @staticmethod
+    def encode_auth_token_for(user_id, token_generation):
+        """
+        encode_auth_token_for is the same as encode_auth_token, for a user that isn't loaded as a User instance
+        """
         payload = {
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=5),
+            'exp': datetime.datetime.utcnow() + AUTH_TOKEN_LIFETIME,
             'iat': datetime.datetime.utcnow(),
-            'sub': self.id
+            'sub': user_id,
+            'gen': token_generation
         }
         return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256').decode('utf-8')
 
@@ -50,13 +70,41 @@ class User(db.Model):
         @return: a number representing the user's id that was used when this auth token was encrypted, or a string
             representing an error message if auth token decoding failed.
         """
-        if BlacklistedToken.check_blacklist(auth_token):
-            return 'auth token blacklisted'
+        payload = User.decode_auth_token_payload(auth_token)
+        if isinstance(payload, str):
+            return payload
+
+        return payload['sub']
 
+    @staticmethod
+    def decode_auth_token_payload(auth_token):
+        """
+        decode_auth_token_payload is the same as decode_auth_token, but returns the whole decoded payload. Only the
+        signature and expiry are checked, the token generation is checked by logic.login
+        @return: a dict with the 'sub', 'iat', 'exp' and 'gen' claims of the auth token (tokens issued before there
+            were token generations have no 'gen' claim), or a string representing an error message if auth token
+            decoding failed.
+        """
         try:
-            payload = jwt.decode(auth_token, current_app.config['SECRET_KEY'])
-            return payload['sub']
+            return jwt.decode(auth_token, current_app.config['SECRET_KEY'])
         except jwt.ExpiredSignatureError:
             return 'signature expired'
         except jwt.InvalidTokenError:
             return 'invalid token'
+
+
+class UserRecord:
+    """
+    UserRecord is a read only user made straight from a selected row (the async endpoints can't use the ORM)
+    """
+    __slots__ = ('id', 'username', 'passhash', 'media_version', 'token_generation')
+
+    def __init__(self, id, username, passhash, media_version, token_generation):
+        self.id = id
+        self.username = username
+        self.passhash = passhash
+        self.media_version = media_version
+        self.token_generation = token_generation
+
+    def __repr__(self):
+        return '<UserRecord(id={}, username={}, media_version={})>'.format(self.id, self.username, self.media_version)
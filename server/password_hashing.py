@@ -0,0 +1,160 @@
+import asyncio
+import multiprocessing
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from metrics import observe_password_hashing
+
+
+class PasswordHashingBusyError(Exception):
+    """
+    PasswordHashingBusyError results when too many passwords are already waiting to be hashed/checked
+    usually results in 503 HTTP response
+    """
+    pass
+
+
+# the pool's processes are started by a forkserver rather than forked from the server worker. The worker runs request
+# threads (and the database pool's and logging's locks), and a fork made while another thread holds one of those locks
+# leaves it locked for good in the child
+POOL_CONTEXT = multiprocessing.get_context('forkserver')
+
+
+def _init_worker():
+    # the forkserver is started from a server worker, and would inherit its SIGTERM/SIGINT handlers. Those only set a
+    # flag in the server (which isn't running in these processes), so they'd never exit
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+
+def _hash_password(password):
+    return bcrypt.hashpw(password, bcrypt.gensalt())
+
+
+def _check_password(password, passhash):
+    return bcrypt.checkpw(password, passhash)
+
+
+class PasswordHasher:
+    """
+    PasswordHasher runs bcrypt in a pool of worker processes, so a burst of logins can't keep every request thread
+    busy hashing passwords. At most workers + max_queue hashes can be running or waiting at once, after that
+    PasswordHashingBusyError is raised right away instead of waiting.
+    If workers is 0, bcrypt runs on the calling thread (used for tests).
+    """
+    def __init__(self, workers=0, max_queue=0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def configure(self, workers, max_queue):
+        """
+        configure changes the size of the pool, the pool itself is started by start, or the first time it is used
+        """
+        with self._lock:
+            self.shutdown()
+            self.workers = workers
+            self.max_queue = max_queue
+
+    def start(self):
+        """
+        start creates the pool, unless workers is 0 or it's already created. Called once each server worker has forked
+        (see app.warm_up and asgi.py), so every worker gets its own pool before it takes requests
+        """
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=POOL_CONTEXT,
+                                                 initializer=_init_worker)
+            self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def hash_password(self, password):
+        """
+        hash_password takes an unhashed password string and returns its bcrypt hash string
+        """
+        start_time = time.perf_counter()
+        try:
+            return self._run(_hash_password, password.encode('utf-8')).decode('utf-8')
+        finally:
+            observe_password_hashing('hash', start_time)
+
+    def check_password(self, password, passhash):
+        """
+        check_password returns True if the unhashed password string matches the bcrypt hash string
+        """
+        start_time = time.perf_counter()
+        try:
+            return self._run(_check_password, password.encode('utf-8'), passhash.encode('utf-8'))
+        finally:
+            observe_password_hashing('check', start_time)
+
+    async def hash_password_async(self, password):
+        """
+        hash_password_async is the same as hash_password, but waits for the hash without blocking the event loop
+        """
+        start_time = time.perf_counter()
+        try:
+            return (await self._run_async(_hash_password, password.encode('utf-8'))).decode('utf-8')
+        finally:
+            observe_password_hashing('hash', start_time)
+
+    async def check_password_async(self, password, passhash):
+        """
+        check_password_async is the same as check_password, but waits for the check without blocking the event loop
+        """
+        start_time = time.perf_counter()
+        try:
+            return await self._run_async(_check_password, password.encode('utf-8'), passhash.encode('utf-8'))
+        finally:
+            observe_password_hashing('check', start_time)
+
+    def _run(self, f, *args):
+        if self.workers <= 0:
+            return f(*args)
+
+        return self._submit(f, *args).result()
+
+    async def _run_async(self, f, *args):
+        if self.workers <= 0:
+            # still keep bcrypt off the event loop, on the loop's default thread pool
+            return await asyncio.get_running_loop().run_in_executor(None, f, *args)
+
+        return await asyncio.wrap_future(self._submit(f, *args))
+
+    def _submit(self, f, *args):
+        """
+        _submit starts f in the pool, and returns its concurrent.futures.Future
+        """
+        with self._lock:
+            # a worker that wasn't started through start (like the test server) creates its pool on first use
+            self._start()
+            executor = self._executor
+            slots = self._slots
+
+        if not slots.acquire(blocking=False):
+            raise PasswordHashingBusyError('server busy, try again later')
+
+        try:
+            future = executor.submit(f, *args)
+        except BaseException:
+            slots.release()
+            raise
+
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+
+password_hasher = PasswordHasher()
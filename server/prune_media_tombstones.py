@@ -0,0 +1,31 @@
+"""
+prune_media_tombstones deletes the tombstones of media deleted more than MEDIA_TOMBSTONE_RETENTION_DAYS ago (or --days),
+so the media_tombstones table doesn't grow forever. Delta syncs from before a pruned tombstone get the whole list again
+(with 'reset': true). Run it regularly, e.g. daily from a cron job
+
+usage: python prune_media_tombstones.py [--days DAYS]
+"""
+import argparse
+import datetime
+import sys
+
+from app import app
+
+from logic.media import prune_media_tombstones
+
+
+def main(days):
+    with app.app_context():
+        if days is None:
+            days = app.config['MEDIA_TOMBSTONE_RETENTION_DAYS']
+
+        pruned = prune_media_tombstones(datetime.timedelta(days=days))
+        print('pruned {} media tombstones older than {} days'.format(pruned, days))
+        return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='delete the media tombstones older than the retention window')
+    parser.add_argument('--days', type=int, help='keep this many days of tombstones instead of '
+                                                 'MEDIA_TOMBSTONE_RETENTION_DAYS')
+    sys.exit(main(parser.parse_args().days))
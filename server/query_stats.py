@@ -0,0 +1,113 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = threading.local()
+
+
+class QueryStats:
+    """
+    QueryStats holds the number of queries run, the total time spent running them, and the slowest one
+    """
+    def __init__(self, keep_statements=False):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.statements = [] if keep_statements else None
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        if duration >= self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_statement = statement
+        if self.statements is not None:
+            self.statements.append(statement)
+
+
+def _recorders():
+    if not hasattr(_local, 'recorders'):
+        _local.recorders = []
+    return _local.recorders
+
+
+@contextmanager
+def record_queries(keep_statements=False):
+    """
+    record_queries records every query run on this thread inside the with block
+    @param keep_statements: if True the sql of every query is kept in the statements list
+    @return: the QueryStats being recorded to
+    """
+    stats = QueryStats(keep_statements)
+    _recorders().append(stats)
+    try:
+        yield stats
+    finally:
+        _recorders().remove(stats)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start_time'].pop()
+    for stats in _recorders():
+        stats.record(statement, duration)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # after_cursor_execute isn't called for a failed query, so drop its start time here
+    if exception_context.connection is not None and exception_context.connection.info.get('query_start_time'):
+        exception_context.connection.info['query_start_time'].pop()
+
+
+def server_timing_header(stats, request_time):
+    """
+    server_timing_header formats the query stats of a request as a Server-Timing header value, with durations in
+    milliseconds
+    """
+    metrics = [
+        'app;dur={:.2f}'.format(request_time * 1000),
+        'db;desc="{} queries";dur={:.2f}'.format(stats.count, stats.total_time * 1000)
+    ]
+    if stats.slowest_statement is not None:
+        # the description has to be a quoted string, so squash the statement onto one line without quotes
+        description = re.sub(r'\s+', ' ', stats.slowest_statement).replace('"', '').replace('\\', '').strip()[:100]
+        metrics.append('db-slowest;desc="{}";dur={:.2f}'.format(description, stats.slowest_time * 1000))
+
+    return ', '.join(metrics)
+
+
+def init_query_stats(app):
+    """
+    init_query_stats records the queries run by each request of app. If app.config['SERVER_TIMING'] is set, the
+    stats are sent back in a Server-Timing header
+    """
+    @app.before_request
+    def start_recording_queries():
+        g.request_start_time = time.perf_counter()
+        g.query_stats = QueryStats()
+        _recorders().append(g.query_stats)
+
+    @app.after_request
+    def add_server_timing_header(response):
+        if app.config.get('SERVER_TIMING') and 'query_stats' in g:
+            response.headers['Server-Timing'] = server_timing_header(
+                g.query_stats, time.perf_counter() - g.request_start_time)
+        return response
+
+    @app.teardown_request
+    def stop_recording_queries(exception=None):
+        query_stats = g.pop('query_stats', None)
+        if query_stats is not None and query_stats in _recorders():
+            _recorders().remove(query_stats)
@@ -0,0 +1,35 @@
+"""
+repair_media_counts checks the media counts behind /user/<username>/media/stats against the media table, prints every
+count that drifted, and then rebuilds all of them from the media table. The media table can't be changed while the
+counts are rebuilt (a few seconds for millions of media). With --check it only checks, and exits with status 1 if any
+count drifted, so it can be run from a cron job or health check
+
+usage: python repair_media_counts.py [--check]
+"""
+import argparse
+import sys
+
+from app import app
+
+from logic.media_count import check_media_counts, rebuild_media_counts
+
+
+def main(check):
+    with app.app_context():
+        drifted = check_media_counts()
+        for user, medium, consumed_state, stored, actual in drifted:
+            print('user {} {} {}: counted {}, actually {}'.format(user, medium, consumed_state, stored, actual))
+        print('{} media counts drifted'.format(len(drifted)))
+
+        if check:
+            return 1 if drifted else 0
+
+        written = rebuild_media_counts()
+        print('rebuilt {} media counts'.format(written))
+        return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='check and rebuild the per user media counts')
+    parser.add_argument('--check', action='store_true', help='only check the media counts, don\'t rebuild them')
+    sys.exit(main(parser.parse_args().check))
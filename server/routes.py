@@ -1,9 +1,22 @@
 from views.index import index
-from views.user import register, login, logout
-from views.media import media
+from views.user import register, login, logout, register_async, login_async
+from views.media import (media, media_async, media_move, media_search, media_autocomplete, media_stats, media_events,
+                         media_events_async)
+from views.metrics import metrics
+from views.errors import database_busy
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
 from models.user import User
 
+# async versions of some of the views below, by endpoint, served by the ASGI app (see asgi.py)
+ASYNC_VIEWS = {
+    'register': register_async,
+    'login': login_async,
+    'media': media_async,
+    'media_events': media_events_async
+}
+
 
 def add_routes(app):
     app.add_url_rule('/', 'index', index)
@@ -14,3 +27,13 @@ def add_routes(app):
     app.add_url_rule('/logout', 'logout', logout, methods=['GET'])
 
     app.add_url_rule('/user/<username>/media', 'media', media, methods=['PUT', 'GET', 'DELETE'])
+    app.add_url_rule('/user/<username>/media/move', 'media_move', media_move, methods=['POST'])
+    app.add_url_rule('/user/<username>/media/search', 'media_search', media_search, methods=['GET'])
+    app.add_url_rule('/user/<username>/media/autocomplete', 'media_autocomplete', media_autocomplete,
+                     methods=['GET'])
+    app.add_url_rule('/user/<username>/media/stats', 'media_stats', media_stats, methods=['GET'])
+    app.add_url_rule('/user/<username>/media/events', 'media_events', media_events, methods=['GET'])
+
+    app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
+
+    app.register_error_handler(PoolTimeoutError, database_busy)
@@ -1,8 +1,11 @@
 import unittest
 import sys
 
-suite = unittest.TestLoader().discover(start_dir='./tests', pattern='test*.py')
-if len(sys.argv) > 1:
-    unittest.TextTestRunner(verbosity=int(sys.argv[1])).run(suite)
-else:
-    unittest.TextTestRunner(verbosity=1).run(suite)
+# the password hashing pool's processes are started by a forkserver, which imports this module again, so the suite
+# may only run when this is the main script
+if __name__ == '__main__':
+    suite = unittest.TestLoader().discover(start_dir='./tests', pattern='test*.py')
+    if len(sys.argv) > 1:
+        unittest.TextTestRunner(verbosity=int(sys.argv[1])).run(suite)
+    else:
+        unittest.TextTestRunner(verbosity=1).run(suite)
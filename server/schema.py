@@ -0,0 +1,89 @@
+"""
+schema validates JSON request bodies against a declarative description of the object they should be. A Schema is
+built once (at import time) from a list of Fields, which it flattens into plain tuples, so validating an object is one
+loop over them that costs about the same as a hand written chain of if checks. Every error is reported, not just the
+first one, and a list of objects is validated in one loop with each error tagged with the index of its object.
+"""
+
+# the value of a field that isn't in the object, None can't be used since null is a (wrong) value
+MISSING = object()
+
+
+class Field:
+    """
+    Field describes an optional key of a JSON object
+    @param name: the key
+    @param types: the type, or tuple of types, the value has to be an instance of
+    @param message: the error message when the value isn't one of types (or isn't one of choices)
+    @param choices: if set, the value has to be one of these
+    @param bounds: if set, a (minimum, maximum) pair the value has to be between, inclusive
+    @param bounds_message: the error message when the value isn't between bounds
+    """
+    def __init__(self, name, types, message, choices=None, bounds=None, bounds_message=None):
+        self.name = name
+        self.types = types
+        self.message = message
+        self.choices = frozenset(choices) if choices is not None else None
+        self.bounds = bounds
+        self.bounds_message = bounds_message
+
+
+class Schema:
+    """
+    Schema validates JSON objects against a list of Fields. Keys that aren't fields are ignored
+    @param fields: the Fields of the object, errors are reported in this order
+    @param required_any: names of fields at least one of which has to be in the object
+    @param required_message: the error message when none of required_any are
+    @param object_message: the error message when the value isn't an object at all
+    """
+    def __init__(self, fields, required_any=(), required_message=None, object_message='body must be a JSON object'):
+        self.fields = fields
+        self.required_any = tuple(required_any)
+        self.required_message = required_message
+        self.object_message = object_message
+        # (name, types, message, choices, bounds, bounds_message) of each field, unpacked on every check
+        self._checks = tuple((field.name, field.types, field.message, field.choices, field.bounds,
+                              field.bounds_message) for field in fields)
+
+    def errors(self, body):
+        """
+        errors validates a single object
+        @return: a list of {'field', 'message'} dicts, in the order of the schema's fields (a missing required field,
+            or the body not being an object, has a field of None and comes first). Empty if the object is valid
+        """
+        return [{'field': error['field'], 'message': error['message']} for error in self.batch_errors([body])]
+
+    def batch_errors(self, bodies):
+        """
+        batch_errors validates every object of a list in one pass
+        @return: a list of {'index', 'field', 'message'} dicts, ordered by index and then like errors. Empty if every
+            object is valid
+        """
+        checks = self._checks
+        required_any = self.required_any
+
+        errors = []
+        for index, body in enumerate(bodies):
+            if not isinstance(body, dict):
+                errors.append({'index': index, 'field': None, 'message': self.object_message})
+                continue
+
+            if required_any:
+                for name in required_any:
+                    if name in body:
+                        break
+                else:
+                    errors.append({'index': index, 'field': None, 'message': self.required_message})
+
+            for name, types, message, choices, bounds, bounds_message in checks:
+                value = body.get(name, MISSING)
+                if value is MISSING:
+                    continue
+
+                # checking the type first means an unhashable value (like a list) never reaches the choices lookup
+                if not isinstance(value, types) or (choices is not None and value not in choices):
+                    errors.append({'index': index, 'field': name, 'message': message})
+                elif bounds is not None and not bounds[0] <= value <= bounds[1]:
+                    errors.append({'index': index, 'field': name, 'message': bounds_message})
+
+        return errors
@@ -1,8 +1,13 @@
+from contextlib import contextmanager
 from flask_testing import TestCase
 from flask import current_app
 
 from app import create_app
 from database import db
+from models.media import create_trigram_index
+
+from logic.token_cache import token_cache, token_generations
+from query_stats import record_queries
 
 
 class GoGoMediaBaseTestCase(TestCase):
@@ -12,7 +17,29 @@ class GoGoMediaBaseTestCase(TestCase):
 
     def setUp(self):
         db.create_all()
+        # auth tokens made in different tests can be identical, so don't let them leak between tests
+        token_cache.clear()
+        token_generations.clear()
 
     def tearDown(self):
         db.session.remove()
         db.drop_all()
+
+    @contextmanager
+    def assertMaxQueries(self, max_queries):
+        """
+        assertMaxQueries fails the test if more than max_queries queries are run inside the with block
+        """
+        with record_queries(keep_statements=True) as stats:
+            yield stats
+
+        self.assertLessEqual(stats.count, max_queries, 'expected at most {} queries, but ran {}:\n{}'.format(
+            max_queries, stats.count, '\n'.join(stats.statements)))
+
+    def require_pg_trgm(self):
+        """
+        require_pg_trgm adds the autocomplete trigram index to the test schema, or skips the test if the test database's
+        postgres doesn't have the pg_trgm and btree_gist extensions
+        """
+        if not create_trigram_index(db.engine):
+            self.skipTest('pg_trgm or btree_gist is not available on the test database')
@@ -0,0 +1,308 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from flask import current_app
+from base_test_case import GoGoMediaBaseTestCase
+
+from asgi import GoGoMediaASGI
+from async_database import async_db, compile_statement
+from database import db
+
+from models.user import User
+from models.media import Media
+
+from logic.media import _media_select, add_media, remove_media
+from logic.media_events import media_event_broker
+
+
+class GoGoMediaASGITestCase(GoGoMediaBaseTestCase):
+    """
+    These tests send requests to the ASGI app, and check that it answers them the same way the Flask app does
+    """
+    def setUp(self):
+        super().setUp()
+        self.asgi_app = GoGoMediaASGI(self.app)
+
+    def tearDown(self):
+        self.asgi_app.executor.shutdown()
+        super().tearDown()
+
+    def run_requests(self, requests):
+        """
+        run_requests runs the coroutine requests on a new event loop, and closes the async pool afterwards
+        """
+        async def run():
+            try:
+                return await requests
+            finally:
+                await media_event_broker.close()
+                await async_db.close()
+
+        return asyncio.run(run())
+
+    async def request(self, method, path, body=None, headers=None):
+        """
+        request sends one request to the ASGI app
+        @return: a (status code, headers dict, body bytes) tuple
+        """
+        headers = dict(headers or {})
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        scope = self.scope(method, path, headers)
+        messages = [{'type': 'http.request', 'body': body or b'', 'more_body': False}]
+        sent = []
+
+        async def receive():
+            if not messages:
+                # the client stays connected until the response ends
+                await asyncio.Event().wait()
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await self.asgi_app(scope, receive, send)
+
+        response_headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in sent[0]['headers']}
+        return sent[0]['status'], response_headers, b''.join(message.get('body', b'') for message in sent[1:])
+
+    def stream(self, path, disconnect, headers=None):
+        """
+        stream starts a GET request to the ASGI app, whose client disconnects once the asyncio.Event disconnect is set
+        @return: (the task running the request, an asyncio.Queue of the messages the app sends as it sends them)
+        """
+        requested = []
+        sent = asyncio.Queue()
+
+        async def receive():
+            if not requested:
+                requested.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            await sent.put(message)
+
+        return asyncio.ensure_future(self.asgi_app(self.scope('GET', path, headers or {}), receive, send)), sent
+
+    def scope(self, method, path, headers):
+        path, _, query_string = path.partition('?')
+        return {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'query_string': query_string.encode('latin-1'),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+        }
+
+    def test_register_and_login(self):
+        async def requests():
+            return [
+                await self.request('POST', '/register', {'username': 'testname', 'password': 'P@ssw0rd'}),
+                await self.request('POST', '/register', {'username': 'testname', 'password': 'P@ssw0rd'}),
+                await self.request('POST', '/register', {'password': 'P@ssw0rd'}),
+                await self.request('POST', '/login', {'username': 'testname', 'password': 'P@ssw0rd'}),
+                await self.request('POST', '/login', {'username': 'testname', 'password': 'pass123'}),
+                await self.request('POST', '/login', {'username': 'othername', 'password': 'P@ssw0rd'})
+            ]
+
+        responses = self.run_requests(requests())
+        bodies = [json.loads(body) for _, _, body in responses]
+
+        self.assertEqual([status for status, _, _ in responses], [201, 422, 422, 200, 401, 422])
+        self.assertEqual([body['message'] for body in bodies], [
+            'user successfully registered',
+            'username taken',
+            'missing parameter \'username\'',
+            'user successfully logged in',
+            'incorrect password',
+            'user doesn\'t exist'
+        ])
+
+        user = User.query.filter_by(username='testname').first()
+        self.assertEqual(User.decode_auth_token(bodies[0]['auth_token']), user.id)
+        self.assertEqual(User.decode_auth_token(bodies[3]['auth_token']), user.id)
+        self.assertTrue(user.authenticate_password('P@ssw0rd'))
+        self.assertEqual(user.media_version, 0)
+
+    def test_get_media_same_as_flask(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i, medium in enumerate(['film', 'audio', 'film']):
+            db.session.add(Media('testmedianame{}'.format(i), user.id, medium=medium, order=i))
+        db.session.commit()
+
+        paths = [
+            '/user/testname/media',
+            '/user/testname/media?medium=film',
+            '/user/testname/media?consumed-state=not-started',
+            '/user/testname/media?limit=2',
+            '/user/testname/media?limit=0',
+            '/user/testname/media?medium=cassette',
+            '/user/othername/media'
+        ]
+        paths.append('/user/testname/media?after=' + json.loads(self.client.get(paths[3]).get_data())['next_cursor'])
+
+        async def requests():
+            return [await self.request('GET', path) for path in paths]
+
+        for path, (status, headers, body) in zip(paths, self.run_requests(requests())):
+            flask_response = self.client.get(path)
+
+            self.assertEqual(status, flask_response.status_code, path)
+            self.assertEqual(json.loads(body), json.loads(flask_response.get_data()), path)
+            self.assertEqual(headers.get('etag'), flask_response.headers.get('ETag'), path)
+
+    def test_get_media_not_modified(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        etag = self.client.get('/user/testname/media').headers['ETag']
+
+        status, headers, body = self.run_requests(self.request('GET', '/user/testname/media',
+                                                               headers={'If-None-Match': etag}))
+
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+        self.assertEqual(headers['etag'], etag)
+
+    def test_login_required(self):
+        current_app.config['LOGIN_DISABLED'] = False
+
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        auth_token = user.encode_auth_token()
+        blacklisted_auth_token = User.encode_auth_token_for(user.id, 1)
+
+        async def requests():
+            return [
+                await self.request('GET', '/user/testname/media'),
+                await self.request('GET', '/user/testname/media', headers={'Authorization': auth_token}),
+                await self.request('GET', '/user/testname/media', headers={'Authorization': 'JWT ' + auth_token}),
+                await self.request('GET', '/user/testname/media',
+                                   headers={'Authorization': 'JWT ' + blacklisted_auth_token})
+            ]
+
+        responses = self.run_requests(requests())
+
+        self.assertEqual([status for status, _, _ in responses], [401, 422, 200, 401])
+        self.assertEqual([json.loads(body)['message'] for _, _, body in responses], [
+            'no authorization header',
+            'authorization header malformed',
+            'successfully got media for the logged in user',
+            'auth token blacklisted'
+        ])
+
+    def test_other_requests_go_to_flask(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        async def requests():
+            return [
+                await self.request('PUT', '/user/testname/media', {'name': 'testmedianame'}),
+                await self.request('GET', '/user/testname/media?stream=true'),
+                await self.request('GET', '/user/testname/media?since=0'),
+                await self.request('GET', '/'),
+                await self.request('GET', '/nothing')
+            ]
+
+        responses = self.run_requests(requests())
+
+        self.assertEqual([status for status, _, _ in responses], [200, 200, 200, 200, 404])
+        self.assertEqual(json.loads(responses[0][2])['message'], 'successfully added/updated media element')
+        self.assertEqual(json.loads(responses[1][2])['data'][0]['name'], 'testmedianame')
+        self.assertEqual(json.loads(responses[2][2])['message'],
+                         'successfully got media changes for the logged in user')
+        self.assertEqual(responses[3][2], b'Hello World')
+
+    def test_media_events(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        async def requests():
+            disconnect = asyncio.Event()
+            task, sent = self.stream('/user/testname/media/events', disconnect)
+            messages = [await asyncio.wait_for(sent.get(), 5), await asyncio.wait_for(sent.get(), 5)]
+
+            media = add_media(user_id, 'testmedianame')
+            messages.append(await asyncio.wait_for(sent.get(), 5))
+            remove_media(media.id)
+            messages.append(await asyncio.wait_for(sent.get(), 5))
+            subscribers = media_event_broker.subscribers(user_id)
+
+            disconnect.set()
+            await asyncio.wait_for(task, 5)
+            return messages, subscribers
+
+        messages, subscribers = self.run_requests(requests())
+        headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in messages[0]['headers']}
+
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertEqual(headers['content-type'], 'text/event-stream; charset=utf-8')
+        self.assertEqual(headers['cache-control'], 'no-cache')
+        self.assertEqual([message['body'] for message in messages[1:]], [
+            b'id: 0\nevent: media\ndata: {"media_version": 0}\n\n',
+            b'id: 1\nevent: media\ndata: {"media_version": 1}\n\n',
+            b'id: 2\nevent: media\ndata: {"media_version": 2}\n\n'
+        ])
+        self.assertEqual(subscribers, 1)
+        self.assertEqual(media_event_broker.subscribers(user_id), 0)
+
+    def test_media_events_reconnect(self):
+        current_app.config['MEDIA_EVENTS_KEEPALIVE'] = 0.05
+        current_app.config['MEDIA_EVENTS_MAX_AGE'] = 0.12
+
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        add_media(user_id, 'testmedianame')
+
+        async def requests():
+            return [
+                # the client already saw media_version 1, so it only gets keepalives until the stream ends
+                await self.request('GET', '/user/testname/media/events', headers={'Last-Event-ID': '1'}),
+                await self.request('GET', '/user/othername/media/events')
+            ]
+
+        responses = self.run_requests(requests())
+
+        self.assertEqual([status for status, _, _ in responses], [200, 422])
+        self.assertRegex(responses[0][2], b'^(: keepalive\n\n)+$')
+        self.assertEqual(json.loads(responses[1][2])['message'], 'user doesn\'t exist')
+        self.assertEqual(media_event_broker.subscribers(user_id), 0)
+
+    def test_database_busy(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        with mock.patch('views.media.get_user_async', side_effect=asyncio.TimeoutError):
+            status, _, body = self.run_requests(self.request('GET', '/user/testname/media'))
+
+        self.assertEqual(status, 503)
+        self.assertEqual(json.loads(body)['message'], 'server busy, try again later')
+
+    def test_compile_statement(self):
+        sql, params = compile_statement(_media_select('testname', medium='film', after=('2LKcb1V', 2)).limit(5))
+
+        self.assertIn('users.username = $1 AND media.medium = $2 AND (media.rank, media.id) > ($3, $4)', sql)
+        self.assertIn('LIMIT $5', sql)
+        self.assertEqual(params, ['testname', 'film', '2LKcb1V', 2, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+from logic.autocomplete_cache import AutocompleteCache
+
+
+class GoGoMediaAutocompleteCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.builds = []
+
+    def build(self, suggestions):
+        def build(limit):
+            self.builds.append(limit)
+            return suggestions[:limit]
+        return build
+
+    def test_get_or_build(self):
+        cache = AutocompleteCache()
+
+        self.assertListEqual(cache.get_or_build(1, 0, 'st', 2, self.build(['a', 'b', 'c'])), ['a', 'b'])
+        self.assertListEqual(cache.get_or_build(1, 0, 'st', 2, self.build(['a', 'b', 'c'])), ['a', 'b'])
+
+        self.assertListEqual(self.builds, [2])
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'users': 1, 'prefixes': 1})
+
+    def test_smaller_limit_is_served_from_cache(self):
+        cache = AutocompleteCache()
+
+        cache.get_or_build(1, 0, 'st', 3, self.build(['a', 'b', 'c', 'd']))
+
+        self.assertListEqual(cache.get_or_build(1, 0, 'st', 1, self.build(['a', 'b', 'c', 'd'])), ['a'])
+        self.assertListEqual(cache.get_or_build(1, 0, 'st', 4, self.build(['a', 'b', 'c', 'd'])), ['a', 'b', 'c', 'd'])
+        self.assertListEqual(self.builds, [3, 4])
+
+    def test_every_suggestion_is_served_from_cache(self):
+        cache = AutocompleteCache()
+
+        # fewer suggestions than the limit means there are no more, whatever the next limit is
+        cache.get_or_build(1, 0, 'st', 3, self.build(['a']))
+
+        self.assertListEqual(cache.get_or_build(1, 0, 'st', 10, self.build(['a'])), ['a'])
+        self.assertListEqual(self.builds, [3])
+
+    def test_new_version_drops_every_prefix(self):
+        cache = AutocompleteCache()
+
+        cache.get_or_build(1, 0, 'st', 2, self.build(['a']))
+        cache.get_or_build(1, 0, 'sta', 2, self.build(['a']))
+        cache.get_or_build(1, 1, 'st', 2, self.build(['b']))
+
+        self.assertListEqual(cache.get_or_build(1, 1, 'st', 2, self.build(['c'])), ['b'])
+        self.assertEqual(cache.stats()['prefixes'], 1)
+
+    def test_least_recently_used_prefix_and_user_are_evicted(self):
+        cache = AutocompleteCache(max_users=2, max_prefixes=2)
+
+        cache.get_or_build(1, 0, 'st', 2, self.build(['a']))
+        cache.get_or_build(1, 0, 'sta', 2, self.build(['a']))
+        cache.get_or_build(1, 0, 'st', 2, self.build(['a']))
+        cache.get_or_build(1, 0, 'star', 2, self.build(['a']))
+        cache.get_or_build(2, 0, 'du', 2, self.build(['b']))
+        cache.get_or_build(1, 0, 'st', 2, self.build(['a']))
+        cache.get_or_build(3, 0, 'ma', 2, self.build(['c']))
+
+        self.assertEqual(cache.stats()['users'], 2)
+        self.assertEqual(len(self.builds), 5)
+
+        # 'sta' and user 2 were the least recently used
+        cache.get_or_build(1, 0, 'sta', 2, self.build(['a']))
+        cache.get_or_build(2, 0, 'du', 2, self.build(['b']))
+        self.assertEqual(len(self.builds), 7)
+
+    def test_invalidate(self):
+        cache = AutocompleteCache()
+
+        cache.get_or_build(1, 0, 'st', 2, self.build(['a']))
+        cache.invalidate(1)
+        cache.get_or_build(1, 0, 'st', 2, self.build(['a']))
+
+        self.assertListEqual(self.builds, [2, 2])
+
+    def test_disabled(self):
+        cache = AutocompleteCache(max_users=0)
+
+        cache.get_or_build(1, 0, 'st', 2, self.build(['a']))
+        cache.get_or_build(1, 0, 'st', 2, self.build(['a']))
+
+        self.assertListEqual(self.builds, [2, 2])
+        self.assertEqual(cache.stats()['users'], 0)
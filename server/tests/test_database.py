@@ -0,0 +1,89 @@
+import json
+import unittest
+from unittest import mock
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+from base_test_case import GoGoMediaBaseTestCase
+
+from app import create_app
+from database import db, engine_options, warm_pool
+from query_stats import record_queries
+
+from models.user import User
+
+CONFIG = {
+    'DB_POOL_SIZE': 8,
+    'DB_MAX_OVERFLOW': 2,
+    'DB_POOL_TIMEOUT': 5,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_POOL_PRE_PING': True,
+    'DB_STATEMENT_TIMEOUT': 30000,
+    'DB_IDLE_IN_TRANSACTION_TIMEOUT': 0,
+    'DB_TRANSACTION_POOLING': False
+}
+
+
+class GoGoMediaEngineOptionsTestCase(unittest.TestCase):
+    def test_engine_options(self):
+        options = engine_options(CONFIG)
+
+        self.assertEqual(options['pool_size'], 8)
+        self.assertEqual(options['max_overflow'], 2)
+        self.assertEqual(options['pool_timeout'], 5)
+        self.assertEqual(options['pool_recycle'], 1800)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=30000'})
+
+    def test_engine_options_without_timeouts(self):
+        options = engine_options(dict(CONFIG, DB_STATEMENT_TIMEOUT=0))
+
+        self.assertEqual(options['connect_args'], {})
+
+    def test_engine_options_transaction_pooling(self):
+        self.assertEqual(engine_options(dict(CONFIG, DB_TRANSACTION_POOLING=True)), {'poolclass': NullPool})
+
+
+class GoGoMediaDatabaseTestCase(GoGoMediaBaseTestCase):
+    def test_pool_is_configured(self):
+        self.assertEqual(db.engine.pool.size(), self.app.config['DB_POOL_SIZE'])
+
+    def test_create_app_runs_no_queries(self):
+        with record_queries() as stats:
+            create_app(test=True)
+
+        self.assertEqual(stats.count, 0)
+
+    def test_warm_pool(self):
+        db.session.remove()
+        db.engine.dispose()
+
+        warm_pool(db.engine, 3)
+
+        self.assertEqual(db.engine.pool.checkedin(), 3)
+
+    def test_session_timeouts(self):
+        settings = dict(db.session.execute(
+            'SELECT name, setting FROM pg_settings '
+            'WHERE name IN (\'statement_timeout\', \'idle_in_transaction_session_timeout\')').fetchall())
+
+        self.assertEqual(int(settings['statement_timeout']), self.app.config['DB_STATEMENT_TIMEOUT'])
+        self.assertEqual(int(settings['idle_in_transaction_session_timeout']),
+                         self.app.config['DB_IDLE_IN_TRANSACTION_TIMEOUT'])
+
+    def test_pool_timeout_is_503(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        with mock.patch('views.media.get_user', side_effect=PoolTimeoutError('QueuePool limit reached')):
+            response = self.client.get('/user/testname/media')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(body['success'])
+        self.assertEqual(body['message'], 'server busy, try again later')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import random
+import unittest
+
+from fractional_rank import rank_for_order, rank_between, is_rank, MIN_ORDER, MAX_ORDER
+
+
+class GoGoMediaFractionalRankTestCase(unittest.TestCase):
+    def test_rank_for_order_sorts_like_order(self):
+        orders = [MIN_ORDER, -100, -1, 0, 1, 2, 61, 62, 100, MAX_ORDER]
+        ranks = [rank_for_order(order) for order in orders]
+
+        self.assertListEqual(sorted(ranks), ranks)
+        self.assertEqual(len(set(ranks)), len(ranks))
+
+    def test_rank_for_order_out_of_range(self):
+        with self.assertRaises(ValueError):
+            rank_for_order(MAX_ORDER + 1)
+        with self.assertRaises(ValueError):
+            rank_for_order(MIN_ORDER - 1)
+
+    def test_rank_between(self):
+        ranks = {rank_for_order(order) for order in range(-5, 5)}
+        rng = random.Random(0)
+
+        for _ in range(2000):
+            before, after = sorted(rng.sample(sorted(ranks), 2))
+            rank = rank_between(before, after)
+
+            self.assertLess(before, rank)
+            self.assertLess(rank, after)
+            self.assertTrue(is_rank(rank))
+            ranks.add(rank)
+
+    def test_rank_between_open_bounds(self):
+        rank = rank_for_order(0)
+
+        self.assertLess(rank_between(None, rank), rank)
+        self.assertGreater(rank_between(rank, None), rank)
+        self.assertTrue(is_rank(rank_between(None, None)))
+
+    def test_rank_between_stays_short(self):
+        before = rank_for_order(0)
+        after = rank_for_order(1)
+
+        # moving media elements to the same place over and over grows the rank by about one digit every 6 moves
+        for _ in range(60):
+            after = rank_between(before, after)
+
+        self.assertLessEqual(len(after), len(before) + 12)
+
+    def test_rank_between_invalid_bounds(self):
+        with self.assertRaises(ValueError):
+            rank_between(rank_for_order(1), rank_for_order(0))
+        with self.assertRaises(ValueError):
+            rank_between(rank_for_order(0), rank_for_order(0))
+        with self.assertRaises(ValueError):
+            rank_between('A', 'A0')
+
+    def test_is_rank(self):
+        self.assertTrue(is_rank(rank_for_order(0)))
+        self.assertFalse(is_rank(''))
+        self.assertFalse(is_rank('abc-'))
+        self.assertFalse(is_rank(12))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,9 @@ from flask import current_app
 from database import db
 
 from models.user import User
-from models.blacklisted_token import BlacklistedToken
+
+from logic.token_cache import token_cache, token_generations
+from logic.user import revoke_auth_tokens
 
 from logic.media import get_media
 
@@ -18,7 +20,7 @@ class GoGoMediaLoginRequiredTestCase(GoGoMediaBaseTestCase):
     and not the specific endpoint itself. For testing purposes it uses /user/<username>/media.
     """
     def setUp(self):
-        super()
+        super().setUp()
         # login should be enabled for all these tests
         current_app.config['LOGIN_DISABLED'] = False
 
@@ -134,9 +136,7 @@ class GoGoMediaLoginRequiredTestCase(GoGoMediaBaseTestCase):
         body = json.loads(response.get_data(as_text=True))
         auth_token = body['auth_token']
 
-        blacklisted_token = BlacklistedToken(auth_token)
-        db.session.add(blacklisted_token)
-        db.session.commit()
+        revoke_auth_tokens(user.id)
 
         response = self.client.put('/user/testname/media',
                                    headers={'Authorization': 'JWT ' + auth_token},
@@ -148,6 +148,69 @@ class GoGoMediaLoginRequiredTestCase(GoGoMediaBaseTestCase):
         self.assertFalse(body['success'])
         self.assertEqual(body['message'], 'auth token blacklisted')
 
+    def test_login_auth_token_revoked_by_another_worker(self):
+        """
+        This test applies to all the media functions that use the /user/<username>/media endpoint
+        """
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        auth_token = user.encode_auth_token()
+
+        response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        self.assertEqual(response.status_code, 200)
+
+        # another worker logged the user out, so this worker's cached generation is stale until it expires
+        user.token_generation = 1
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        self.assertEqual(response.status_code, 200)
+
+        token_generations.clear()
+
+        response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(body['message'], 'auth token blacklisted')
+
+    def test_login_legacy_auth_token(self):
+        """
+        Auth tokens issued before there were token generations have no 'gen' claim, and count as generation 0
+        """
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        payload = {
+            'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+            'iat': datetime.datetime.utcnow(),
+            'sub': user.id
+        }
+        auth_token = jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256').decode('utf-8')
+
+        response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        self.assertEqual(response.status_code, 200)
+
+        revoke_auth_tokens(user.id)
+
+        response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        self.assertEqual(response.status_code, 401)
+
+    def test_login_deleted_user_auth_token(self):
+        """
+        This test applies to all the media functions that use the /user/<username>/media endpoint
+        """
+        auth_token = User.encode_auth_token_for(1, 0)
+
+        response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(body['message'], 'auth token blacklisted')
+
     def test_login_invalid_auth_token(self):
         """
         This test applies to all the media functions that use the /user/<username>/media endpoint
@@ -199,3 +262,70 @@ class GoGoMediaLoginRequiredTestCase(GoGoMediaBaseTestCase):
         self.assertEqual(response.status_code, 401)
         self.assertFalse(body['success'])
         self.assertEqual(body['message'], 'signature expired')
+
+    def test_login_cached_auth_token(self):
+        """
+        This test applies to all the media functions that use the /user/<username>/media endpoint
+        """
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.post('/login',
+                                    data=json.dumps({'username': 'testname', 'password': 'P@ssw0rd'}),
+                                    content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+        auth_token = body['auth_token']
+
+        token_cache.clear()
+
+        response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(token_cache.stats(), {'hits': 0, 'misses': 1, 'size': 1})
+
+        response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(token_cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_login_cached_auth_token_queries(self):
+        """
+        A token whose user's generation is cached is checked without any queries
+        """
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        auth_token = user.encode_auth_token()
+        self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+
+        # the view's own user and media queries
+        with self.assertMaxQueries(2):
+            response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_cached_auth_token_after_logout(self):
+        """
+        This test applies to all the media functions that use the /user/<username>/media endpoint
+        """
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.post('/login',
+                                    data=json.dumps({'username': 'testname', 'password': 'P@ssw0rd'}),
+                                    content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+        auth_token = body['auth_token']
+
+        response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/logout', headers={'Authorization': 'JWT ' + auth_token})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(body['success'])
+        self.assertEqual(body['message'], 'auth token blacklisted')
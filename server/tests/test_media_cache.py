@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+from multiprocessing.managers import BaseManager
+
+from flask import Flask
+
+from app import create_media_cache_backend
+from logic.media_cache import (LRUCacheBackend, SharedCacheBackend, MediaCache, MediaCacheManager,
+                               parse_media_cache_address)
+
+
+class GoGoMediaLRUCacheBackendTestCase(unittest.TestCase):
+    def test_get_and_set(self):
+        backend = LRUCacheBackend()
+
+        self.assertIsNone(backend.get(1, (None, None)))
+
+        backend.set(1, (None, None), (0, b'body'))
+
+        self.assertEqual(backend.get(1, (None, None)), (0, b'body'))
+        self.assertIsNone(backend.get(1, ('film', None)))
+        self.assertEqual(backend.stats(), {'evictions': 0, 'users': 1, 'bytes': 4})
+
+    def test_invalidate_drops_every_variant(self):
+        backend = LRUCacheBackend()
+
+        backend.set(1, (None, None), (0, b'body'))
+        backend.set(1, ('film', None), (0, b'body'))
+        backend.set(2, (None, None), (0, b'body'))
+        backend.invalidate(1)
+
+        self.assertIsNone(backend.get(1, (None, None)))
+        self.assertIsNone(backend.get(1, ('film', None)))
+        self.assertEqual(backend.get(2, (None, None)), (0, b'body'))
+        self.assertEqual(backend.stats()['bytes'], 4)
+
+    def test_least_recently_used_user_is_evicted(self):
+        backend = LRUCacheBackend(max_bytes=8)
+
+        backend.set(1, (None, None), (0, b'body'))
+        backend.set(2, (None, None), (0, b'body'))
+        backend.get(1, (None, None))
+
+        self.assertEqual(backend.set(3, (None, None), (0, b'body')), 1)
+        self.assertIsNone(backend.get(2, (None, None)))
+        self.assertEqual(backend.get(1, (None, None)), (0, b'body'))
+        self.assertEqual(backend.stats(), {'evictions': 1, 'users': 2, 'bytes': 8})
+
+
+class GoGoMediaMediaCacheTestCase(unittest.TestCase):
+    def test_entry_is_rebuilt_at_new_version(self):
+        cache = MediaCache(LRUCacheBackend())
+        builds = []
+
+        def build():
+            builds.append(1)
+            return 'body{}'.format(len(builds)).encode()
+
+        self.assertEqual(cache.get_or_build(1, (None, None), 0, build), (0, b'body1'))
+        self.assertEqual(cache.get_or_build(1, (None, None), 0, build), (0, b'body1'))
+        self.assertEqual(cache.get_or_build(1, (None, None), 1, build), (1, b'body2'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_no_backend_always_builds(self):
+        cache = MediaCache()
+
+        self.assertEqual(cache.get_or_build(1, (None, None), 0, lambda: b'body'), (0, b'body'))
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 0, 'stale_hits': 0})
+
+    def test_stale_while_revalidate(self):
+        cache = MediaCache(LRUCacheBackend(), stale_while_revalidate=True)
+        cache.get_or_build(1, (None, None), 0, lambda: b'old')
+
+        with Flask(__name__).app_context():
+            # the old body is served, with its version, while the new one is built in the background
+            self.assertEqual(cache.get_or_build(1, (None, None), 1, lambda: b'new'), (0, b'old'))
+
+        for _ in range(100):
+            if cache.backend.get(1, (None, None)) == (1, b'new'):
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(cache.get_or_build(1, (None, None), 1, lambda: b'newer'), (1, b'new'))
+        self.assertEqual(cache.stats()['stale_hits'], 1)
+
+
+class GoGoMediaSharedCacheBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        # serve a backend in this process the same way serve_media_cache does, on a port picked by the OS
+        backend = LRUCacheBackend()
+
+        class TestManager(BaseManager):
+            pass
+
+        TestManager.register('get_backend', callable=lambda: backend)
+        self.server = TestManager(address=('127.0.0.1', 0), authkey=b'test').get_server()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.stop_event.set()
+        MediaCacheManager._registry.pop('get_backend', None)
+
+    def test_workers_share_entries(self):
+        worker1 = SharedCacheBackend(self.server.address, b'test')
+        worker2 = SharedCacheBackend(self.server.address, b'test')
+
+        worker1.set(1, (None, None), (0, b'body'))
+
+        self.assertEqual(worker2.get(1, (None, None)), (0, b'body'))
+
+        worker2.invalidate(1)
+
+        self.assertIsNone(worker1.get(1, (None, None)))
+        self.assertEqual(worker1.stats()['users'], 0)
+
+    def test_cache_process_down(self):
+        # nothing listens at this address any more
+        self.server.listener.close()
+        cache = MediaCache(SharedCacheBackend(self.server.address, b'test'))
+
+        # the request goes on as if nothing was cached
+        self.assertEqual(cache.get_or_build(1, (None, None), 0, lambda: b'built'), (0, b'built'))
+        cache.invalidate(1)
+        self.assertEqual(cache.backend.stats(), {})
+
+    def test_connection_lost(self):
+        worker = SharedCacheBackend(self.server.address, b'test', retry_interval=0)
+        worker.set(1, (None, None), (0, b'body'))
+        # the cache process closed the connection in the middle of a call
+        worker._backend = mock.Mock(**{'get.side_effect': EOFError})
+
+        self.assertIsNone(worker.get(1, (None, None)))
+        self.assertIsNone(worker._backend)
+        # the next call reconnects
+        self.assertEqual(worker.get(1, (None, None)), (0, b'body'))
+
+    def test_async_calls_leave_the_event_loop(self):
+        cache = MediaCache(SharedCacheBackend(self.server.address, b'test'))
+        backend_get = cache.backend.get
+        threads = []
+
+        def get(user_id, variant):
+            threads.append(threading.current_thread())
+            return backend_get(user_id, variant)
+
+        async def run():
+            await cache.set_async(1, (None, None), 0, b'body')
+            with mock.patch.object(cache.backend, 'get', get):
+                return await cache.get_async(1, (None, None), 0)
+
+        self.assertEqual(asyncio.run(run()), b'body')
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_wrong_authkey(self):
+        worker = SharedCacheBackend(self.server.address, b'wrong')
+
+        self.assertIsNone(worker.get(1, (None, None)))
+        self.assertEqual(worker.set(1, (None, None), (0, b'body')), 0)
+
+    def test_authkey_required(self):
+        with self.assertRaises(ValueError):
+            create_media_cache_backend({'MEDIA_CACHE': 'shared', 'MEDIA_CACHE_ADDRESS': '127.0.0.1:11311',
+                                        'MEDIA_CACHE_AUTHKEY': None})
+
+    def test_parse_media_cache_address(self):
+        self.assertEqual(parse_media_cache_address('127.0.0.1:11311'), ('127.0.0.1', 11311))
+        self.assertEqual(parse_media_cache_address('/tmp/media_cache.sock'), '/tmp/media_cache.sock')
+
+
+if __name__ == '__main__':
+    unittest.main()
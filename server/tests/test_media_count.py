@@ -0,0 +1,138 @@
+import threading
+
+from base_test_case import GoGoMediaBaseTestCase
+
+from database import db
+
+from models.user import User
+from models.media import Media
+
+from logic.media import (add_media, update_media, remove_media, remove_media_list, upsert_media_list, move_media,
+                         renormalize_media_ranks)
+from logic.media_count import get_media_counts, check_media_counts, rebuild_media_counts
+
+
+class GoGoMediaMediaCountTestCase(GoGoMediaBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User('testname', 'P@ssw0rd')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def assertCounts(self, expected):
+        """
+        assertCounts checks the user's media counts against expected, a dict of the nonzero {(medium, consumed_state):
+        count}, and that no count drifted from the media table
+        """
+        counts = get_media_counts(self.user.id)
+        self.assertEqual({(medium, consumed_state): count
+                          for medium, medium_counts in counts.items()
+                          for consumed_state, count in medium_counts.items() if count != 0}, expected)
+        self.assertListEqual(check_media_counts(), [])
+
+    def test_get_media_counts_no_media(self):
+        counts = get_media_counts(self.user.id)
+
+        self.assertEqual(set(counts), {'film', 'audio', 'literature', 'other'})
+        for medium_counts in counts.values():
+            self.assertEqual(medium_counts, {'not started': 0, 'started': 0, 'finished': 0})
+
+    def test_add_and_update_media(self):
+        media = add_media(self.user.id, 'testmedianame1', medium='film')
+        add_media(self.user.id, 'testmedianame2', medium='film')
+        self.assertCounts({('film', 'not started'): 2})
+
+        update_media(media.id, consumed_state='finished')
+        self.assertCounts({('film', 'not started'): 1, ('film', 'finished'): 1})
+
+        # changes that don't touch medium or consumed_state leave the counts alone
+        update_media(media.id, medianame='renamed', order=3)
+        self.assertCounts({('film', 'not started'): 1, ('film', 'finished'): 1})
+
+    def test_update_media_changed_concurrently(self):
+        media = add_media(self.user.id, 'testmedianame1', medium='film')
+
+        def update_in_other_session():
+            with self.app.app_context():
+                update_media(media.id, consumed_state='started')
+                db.session.remove()
+
+        # this session still has the media element loaded as not started
+        thread = threading.Thread(target=update_in_other_session)
+        thread.start()
+        thread.join()
+
+        update_media(media.id, consumed_state='finished')
+        self.assertCounts({('film', 'finished'): 1})
+
+    def test_upsert_media_list(self):
+        upsert_media_list(self.user.id, [
+            {'name': 'testmedianame1', 'medium': 'audio'},
+            {'name': 'testmedianame2', 'medium': 'audio'},
+            {'name': 'testmedianame3'}
+        ])
+        self.assertCounts({('audio', 'not started'): 2, ('other', 'not started'): 1})
+
+        upsert_media_list(self.user.id, [
+            {'id': 1, 'consumed_state': 'started'},
+            {'id': 1, 'medium': 'literature'},
+            {'id': 2, 'name': 'renamed'},
+            {'id': 3, 'medium': 'film', 'consumed_state': 'finished'},
+            {'name': 'testmedianame4', 'medium': 'film', 'consumed_state': 'finished'}
+        ])
+        self.assertCounts({('literature', 'started'): 1, ('audio', 'not started'): 1, ('film', 'finished'): 2})
+
+    def test_move_and_renormalize_media(self):
+        for i in range(3):
+            add_media(self.user.id, 'testmedianame{}'.format(i), order=i)
+
+        move_media(self.user.id, 1, after=3)
+        renormalize_media_ranks(self.user.id)
+
+        self.assertCounts({('other', 'not started'): 3})
+
+    def test_remove_media(self):
+        add_media(self.user.id, 'testmedianame1', medium='film')
+        add_media(self.user.id, 'testmedianame2', medium='film', consumed_state='started')
+        add_media(self.user.id, 'testmedianame3', medium='audio')
+        add_media(self.user.id, 'testmedianame4')
+
+        remove_media(1)
+        self.assertCounts({('film', 'started'): 1, ('audio', 'not started'): 1, ('other', 'not started'): 1})
+
+        remove_media(1)
+        self.assertEqual(remove_media_list(self.user.id, medium='film'), 1)
+        self.assertCounts({('audio', 'not started'): 1, ('other', 'not started'): 1})
+
+        self.assertEqual(remove_media_list(self.user.id, ids=[3, 4]), 2)
+        self.assertCounts({})
+
+    def test_counts_are_per_user(self):
+        other_user = User('othername', 'P@ssw0rd')
+        db.session.add(other_user)
+        db.session.commit()
+
+        add_media(self.user.id, 'testmedianame', medium='film')
+        add_media(other_user.id, 'testmedianame', medium='audio')
+        remove_media_list(other_user.id)
+
+        self.assertCounts({('film', 'not started'): 1})
+
+    def test_check_and_rebuild_media_counts(self):
+        add_media(self.user.id, 'testmedianame1', medium='film')
+        add_media(self.user.id, 'testmedianame2', medium='film')
+
+        # media changed without going through logic.media aren't counted
+        db.session.add(Media('testmedianame3', self.user.id, 'audio'))
+        Media.query.filter_by(id=1).update({'consumed_state': 'finished'})
+        db.session.commit()
+
+        # ordered by the enums' order, which is the (random) order of models.media.mediums and consumed_states
+        self.assertCountEqual(check_media_counts(), [
+            (self.user.id, 'audio', 'not started', 0, 1),
+            (self.user.id, 'film', 'not started', 2, 1),
+            (self.user.id, 'film', 'finished', 0, 1)
+        ])
+
+        self.assertEqual(rebuild_media_counts(), 3)
+        self.assertCounts({('audio', 'not started'): 1, ('film', 'not started'): 1, ('film', 'finished'): 1})
@@ -0,0 +1,95 @@
+import asyncio
+
+import asyncpg
+from base_test_case import GoGoMediaBaseTestCase
+
+from database import db
+
+from models.user import User
+
+from logic.media import add_media, move_media
+from logic.media_events import MediaEventBroker, MEDIA_EVENTS_CHANNEL
+
+
+class GoGoMediaMediaEventsTestCase(GoGoMediaBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.broker = MediaEventBroker()
+        self.broker.configure(self.app.config['MEDIA_EVENTS_DATABASE_URI'])
+
+        self.user = User('testname', 'P@ssw0rd')
+        self.other_user = User('othername', 'P@ssw0rd')
+        db.session.add_all([self.user, self.other_user])
+        db.session.commit()
+
+    def run_broker(self, coroutine):
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                await self.broker.close()
+
+        return asyncio.run(run())
+
+    def test_subscription_keeps_newest_version(self):
+        async def run():
+            subscription = await self.broker.subscribe(self.user.id)
+            for version in [3, 5, 4]:
+                subscription.notify(version)
+
+            return [await subscription.wait(1), await subscription.wait(0.01)]
+
+        self.assertEqual(self.run_broker(run()), [5, None])
+
+    def test_committed_changes_are_fanned_out(self):
+        async def run():
+            subscriptions = [await self.broker.subscribe(self.user.id), await self.broker.subscribe(self.user.id)]
+            other_subscription = await self.broker.subscribe(self.other_user.id)
+
+            media = [add_media(self.user.id, 'testmedianame1'), add_media(self.user.id, 'testmedianame2')]
+            # rolled back, so it's never delivered
+            with self.assertRaises(ValueError):
+                move_media(self.user.id, media[0].id, after=media[1].id, before=media[0].id)
+
+            versions = [await subscription.wait(5) for subscription in subscriptions]
+            return versions, await other_subscription.wait(0.1)
+
+        versions, other_version = self.run_broker(run())
+
+        self.assertEqual(versions, [2, 2])
+        self.assertIsNone(other_version)
+        self.assertEqual(User.query.get(self.user.id).media_version, 2)
+
+    def test_unsubscribe(self):
+        async def run():
+            subscription = await self.broker.subscribe(self.user.id)
+            await self.broker.subscribe(self.user.id)
+            subscribers = self.broker.subscribers(self.user.id)
+
+            subscription.close()
+            subscription.close()
+
+            return subscribers, self.broker.subscribers(self.user.id), await subscription.wait(1)
+
+        self.assertEqual(self.run_broker(run()), (2, 1, None))
+
+    def test_connection_lost_closes_subscriptions(self):
+        async def run():
+            subscription = await self.broker.subscribe(self.user.id)
+
+            connection = await asyncpg.connect(self.broker.dsn)
+            try:
+                await connection.execute('SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+                                         'WHERE pid != pg_backend_pid() AND query LIKE $1',
+                                         'LISTEN "{}"'.format(MEDIA_EVENTS_CHANNEL))
+                await asyncio.wait_for(subscription.wait(5), 5)
+                closed = subscription.closed
+
+                # the next subscription listens on a new connection
+                new_subscription = await self.broker.subscribe(self.user.id)
+                await connection.execute('SELECT pg_notify($1, $2)', MEDIA_EVENTS_CHANNEL, '{}:7'.format(self.user.id))
+                return closed, await new_subscription.wait(5)
+            finally:
+                await connection.close()
+
+        self.assertEqual(self.run_broker(run()), (True, 7))
@@ -1,11 +1,21 @@
+import datetime
+import threading
+
+from sqlalchemy import event, func
+
 from base_test_case import GoGoMediaBaseTestCase
 
 from database import db
 
 from models.user import User
-from models.media import Media
+from models.media import Media, MEDIANAME_TRIGRAM_INDEX
+from models.media_tombstone import MediaTombstone
 
-from logic.media import add_media, update_media, remove_media, get_media, get_media_by_id
+from logic.media import (add_media, update_media, remove_media, remove_media_list, get_media, get_media_by_id,
+                         get_owned_media_ids, upsert_media_list, get_media_records, iter_media_records, move_media,
+                         renormalize_media_ranks, search_media, autocomplete_media, get_media_changes,
+                         prune_media_tombstones)
+from logic.media_rank import rank_renormalizer
 
 
 class GoGoMediaMediaLogicTestCase(GoGoMediaBaseTestCase):
@@ -216,6 +226,31 @@ class GoGoMediaMediaLogicTestCase(GoGoMediaBaseTestCase):
 
         self.assertFalse(media in db.session)
 
+    def test_remove_media_list(self):
+        user1 = User('testname1', 'P@ssw0rd')
+        user2 = User('testname2', 'P@ssw0rd')
+        db.session.add(user1)
+        db.session.add(user2)
+        db.session.commit()
+
+        media1 = add_media(user1.id, 'testmedianame1', medium='film', consumed_state='finished')
+        media2 = add_media(user1.id, 'testmedianame2', medium='audio', consumed_state='finished')
+        add_media(user1.id, 'testmedianame3', medium='film')
+        media4 = add_media(user2.id, 'testmedianame4', medium='film', consumed_state='finished')
+        media1_id = media1.id
+
+        self.assertEqual(remove_media_list(user1.id, consumed_state='finished', medium='film'), 1)
+        self.assertEqual(remove_media_list(user1.id, ids=[media2.id, media4.id]), 1)
+        self.assertEqual(remove_media_list(user1.id, ids=[]), 0)
+
+        self.assertListEqual([media.medianame for media in Media.query.order_by(Media.id)],
+                             ['testmedianame3', 'testmedianame4'])
+        self.assertEqual(user1.media_version, 5)
+
+        # removing nothing doesn't change the media version
+        self.assertEqual(remove_media_list(user1.id, ids=[media1_id]), 0)
+        self.assertEqual(user1.media_version, 5)
+
     def test_get_media(self):
         user = User('testname', 'P@ssw0rd')
         db.session.add(user)
@@ -338,6 +373,65 @@ class GoGoMediaMediaLogicTestCase(GoGoMediaBaseTestCase):
         self.assertListEqual(audio_media_list, [media4, media7])
         self.assertListEqual(literature_media_list, [media3])
 
+    def test_get_media_ordered_by_order(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media1 = Media('testmedianame1', user.id, medium='film', order=2)
+        media2 = Media('testmedianame2', user.id, medium='film', order=0)
+        media3 = Media('testmedianame3', user.id, medium='audio', order=1)
+        media4 = Media('testmedianame4', user.id, medium='film', order=0)
+        db.session.add(media1)
+        db.session.add(media2)
+        db.session.add(media3)
+        db.session.add(media4)
+        db.session.commit()
+
+        self.assertListEqual(get_media('testname'), [media2, media4, media3, media1])
+        self.assertListEqual(get_media('testname', medium='film'), [media2, media4, media1])
+
+    def test_get_media_records(self):
+        user1 = User('testname1', 'P@ssw0rd')
+        user2 = User('testname2', 'P@ssw0rd')
+        db.session.add(user1)
+        db.session.add(user2)
+        db.session.commit()
+
+        media1 = Media('testmedianame1', user1.id, medium='film', consumed_state='started', order=2)
+        media2 = Media('testmedianame2', user1.id, description='some description', order=1)
+        media3 = Media('testmedianame3', user2.id, medium='film')
+        media4 = Media('testmedianame4', user1.id, medium='film', order=3)
+        db.session.add(media1)
+        db.session.add(media2)
+        db.session.add(media3)
+        db.session.add(media4)
+        db.session.commit()
+
+        media_records = get_media_records('testname1')
+
+        self.assertListEqual([media.as_dict() for media in media_records],
+                             [media.as_dict() for media in get_media('testname1')])
+        self.assertListEqual([media.as_dict() for media in get_media_records('testname1', medium='film', limit=1)],
+                             [media1.as_dict()])
+        after_media1 = get_media_records('testname1', after=(media1.rank, media1.id))
+        self.assertListEqual([media.as_dict() for media in after_media1], [media4.as_dict()])
+
+    def test_iter_media_records(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i in range(25):
+            db.session.add(Media('testmedianame{}'.format(i), user.id, order=i))
+        db.session.commit()
+
+        self.assertListEqual([media.as_dict() for media in iter_media_records('testname', batch_size=10)],
+                             [media.as_dict() for media in get_media('testname')])
+
+    def test_get_media_nonexistent_user(self):
+        self.assertListEqual(get_media('testname'), [])
+
     def test_get_media_empty_list(self):
         user = User('testname', 'P@ssw0rd')
         db.session.add(user)
@@ -367,3 +461,428 @@ class GoGoMediaMediaLogicTestCase(GoGoMediaBaseTestCase):
         self.assertEqual(returned_media, media)
         self.assertEqual(returned_media.id, media.id)
         self.assertEqual(returned_media.medianame, media.medianame)
+
+    def test_get_owned_media_ids(self):
+        user1 = User('testname1', 'P@ssw0rd')
+        user2 = User('testname2', 'P@ssw0rd')
+        db.session.add(user1)
+        db.session.add(user2)
+        db.session.commit()
+
+        media1 = Media('testmedianame1', user1.id)
+        media2 = Media('testmedianame2', user2.id)
+        media3 = Media('testmedianame3', user1.id)
+        db.session.add(media1)
+        db.session.add(media2)
+        db.session.add(media3)
+        db.session.commit()
+
+        self.assertSetEqual(get_owned_media_ids(user1.id, [media1.id, media2.id, media3.id, 1000]),
+                            {media1.id, media3.id})
+        self.assertSetEqual(get_owned_media_ids(user1.id, []), set())
+
+    def test_upsert_media_list(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media1 = Media('testmedianame1', user.id, medium='film', description='some description')
+        media2 = Media('testmedianame2', user.id)
+        db.session.add(media1)
+        db.session.add(media2)
+        db.session.commit()
+
+        media_list = upsert_media_list(user.id, [
+            {'id': media2.id, 'order': 1, 'consumed_state': 'started'},
+            {'name': 'testmedianame3', 'medium': 'audio', 'order': 2},
+            {'id': media1.id, 'name': 'testchangedmedianame1'},
+            {'name': 'testmedianame4'}
+        ])
+
+        self.assertListEqual(media_list, [
+            {'id': 2, 'name': 'testmedianame2', 'medium': 'other', 'consumed_state': 'started',
+             'description': '', 'order': 1},
+            {'id': 3, 'name': 'testmedianame3', 'medium': 'audio', 'consumed_state': 'not started',
+             'description': '', 'order': 2},
+            {'id': 1, 'name': 'testchangedmedianame1', 'medium': 'film', 'consumed_state': 'not started',
+             'description': 'some description', 'order': 0},
+            {'id': 4, 'name': 'testmedianame4', 'medium': 'other', 'consumed_state': 'not started',
+             'description': '', 'order': 0}
+        ])
+        self.assertListEqual([media.as_dict() for media in get_media('testname')],
+                             sorted(media_list, key=lambda media: (media['order'], media['id'])))
+
+    def test_upsert_media_list_same_id_twice(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media = Media('testmedianame', user.id)
+        db.session.add(media)
+        db.session.commit()
+
+        media_list = upsert_media_list(user.id, [
+            {'id': media.id, 'order': 1, 'medium': 'film'},
+            {'id': media.id, 'order': 5}
+        ])
+
+        self.assertEqual(media_list[0], media_list[1])
+        self.assertEqual(media.order, 5)
+        self.assertEqual(media.medium, 'film')
+
+    def test_media_version(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        self.assertEqual(user.media_version, 0)
+
+        media = add_media(user.id, 'testmedianame')
+        self.assertEqual(user.media_version, 1)
+
+        update_media(media.id, order=2)
+        self.assertEqual(user.media_version, 2)
+
+        upsert_media_list(user.id, [{'id': media.id, 'order': 3}, {'name': 'testmedianame2'}])
+        self.assertEqual(user.media_version, 3)
+
+        remove_media(media.id)
+        self.assertEqual(user.media_version, 4)
+
+    def test_move_media(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media_list = [add_media(user.id, 'testmedianame{}'.format(i), order=i * 10) for i in range(4)]
+        ranks = [media.rank for media in media_list]
+
+        with self.assertMaxQueries(5) as stats:
+            media = move_media(user.id, media_list[3].id, after=media_list[0].id, before=media_list[1].id)
+
+        # only the moved media element is updated, and its order stays between its neighbours'
+        self.assertEqual(sum(statement.startswith('UPDATE media') for statement in stats.statements), 1)
+        self.assertEqual(media.order, 5)
+        self.assertListEqual([media.medianame for media in get_media('testname')],
+                             ['testmedianame0', 'testmedianame3', 'testmedianame1', 'testmedianame2'])
+        self.assertListEqual([media.rank for media in media_list[:3]], ranks[:3])
+        self.assertEqual(user.media_version, 5)
+
+    def test_move_media_after_or_before_only(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media_list = [add_media(user.id, 'testmedianame{}'.format(i), order=i * 10) for i in range(3)]
+
+        move_media(user.id, media_list[2].id, after=media_list[0].id)
+        self.assertListEqual([media.medianame for media in get_media('testname')],
+                             ['testmedianame0', 'testmedianame2', 'testmedianame1'])
+
+        move_media(user.id, media_list[1].id, before=media_list[0].id)
+        self.assertListEqual([media.medianame for media in get_media('testname')],
+                             ['testmedianame1', 'testmedianame0', 'testmedianame2'])
+
+        move_media(user.id, media_list[1].id, after=media_list[2].id)
+        self.assertListEqual([media.medianame for media in get_media('testname')],
+                             ['testmedianame0', 'testmedianame2', 'testmedianame1'])
+
+    def test_move_media_after_must_come_before_before(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media_list = [add_media(user.id, 'testmedianame{}'.format(i), order=i) for i in range(3)]
+
+        with self.assertRaises(ValueError):
+            move_media(user.id, media_list[0].id, after=media_list[2].id, before=media_list[1].id)
+
+        self.assertListEqual([media.medianame for media in get_media('testname')],
+                             ['testmedianame0', 'testmedianame1', 'testmedianame2'])
+
+    def test_move_media_renormalizes_tied_orders(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media_list = [add_media(user.id, 'testmedianame{}'.format(i), order=i) for i in range(3)]
+
+        # there is no order between 0 and 1, so the list is renormalized (right away in tests)
+        move_media(user.id, media_list[2].id, after=media_list[0].id, before=media_list[1].id)
+
+        self.assertListEqual([(media.medianame, media.order) for media in get_media('testname')],
+                             [('testmedianame0', 0), ('testmedianame2', 1), ('testmedianame1', 2)])
+
+    def test_move_media_between_tied_ranks(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        # legacy order writes can give media elements the same rank
+        media_list = [add_media(user.id, 'testmedianame{}'.format(i), order=0) for i in range(3)]
+
+        move_media(user.id, media_list[2].id, after=media_list[0].id, before=media_list[1].id)
+
+        self.assertListEqual([media.medianame for media in get_media('testname')],
+                             ['testmedianame0', 'testmedianame2', 'testmedianame1'])
+
+    def test_move_media_schedules_renormalization(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media_list = [add_media(user.id, 'testmedianame{}'.format(i), order=i) for i in range(3)]
+
+        rank_renormalizer.configure(60)
+        self.addCleanup(rank_renormalizer.configure, 0)
+        self.addCleanup(rank_renormalizer.clear)
+
+        media = move_media(user.id, media_list[2].id, after=media_list[0].id, before=media_list[1].id)
+
+        self.assertEqual(media.order, 0)
+        self.assertIn(user.id, rank_renormalizer.pending())
+
+    def test_renormalize_media_ranks(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i in range(5):
+            db.session.add(Media('testmedianame{}'.format(i), user.id, order=100 - i))
+        db.session.commit()
+        media_names = [media.medianame for media in get_media('testname')]
+
+        renormalize_media_ranks(user.id)
+
+        media_list = get_media('testname')
+        self.assertListEqual([media.medianame for media in media_list], media_names)
+        self.assertListEqual([media.order for media in media_list], list(range(5)))
+
+    def test_update_media_order_sets_rank(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media1 = add_media(user.id, 'testmedianame1', order=1)
+        media2 = add_media(user.id, 'testmedianame2', order=2)
+
+        update_media(media1.id, order=3)
+        self.assertListEqual([media.medianame for media in get_media('testname')],
+                             ['testmedianame2', 'testmedianame1'])
+
+        upsert_media_list(user.id, [{'id': media2.id, 'order': 4}])
+        self.assertListEqual([media.medianame for media in get_media('testname')],
+                             ['testmedianame1', 'testmedianame2'])
+
+    def test_search_media(self):
+        user1 = User('testname1', 'P@ssw0rd')
+        user2 = User('testname2', 'P@ssw0rd')
+        db.session.add(user1)
+        db.session.add(user2)
+        db.session.commit()
+
+        db.session.add(Media('Star Wars', user1.id, medium='film'))
+        db.session.add(Media('Inception', user1.id, medium='film', description='a heist among the stars'))
+        db.session.add(Media('Stars', user1.id, medium='audio'))
+        db.session.add(Media('The Matrix', user1.id, medium='film'))
+        db.session.add(Media('Star Trek', user2.id, medium='film'))
+        db.session.commit()
+
+        matches = search_media('testname1', 'star')
+
+        # matches in the name rank above matches in the description
+        self.assertListEqual([media.medianame for media, _ in matches], ['Stars', 'Star Wars', 'Inception'])
+        self.assertListEqual([search_rank for _, search_rank in matches],
+                             sorted([search_rank for _, search_rank in matches], reverse=True))
+
+        self.assertListEqual([media.medianame for media, _ in search_media('testname1', 'star', medium='film')],
+                             ['Star Wars', 'Inception'])
+        self.assertListEqual([media.medianame for media, _ in search_media('testname1', 'star -wars')],
+                             ['Stars', 'Inception'])
+        self.assertListEqual(search_media('testname1', 'trek'), [])
+
+    def test_search_media_pages(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i in range(5):
+            db.session.add(Media('star {}'.format(i), user.id))
+        db.session.commit()
+
+        pages = []
+        after = None
+        while True:
+            page = search_media('testname', 'star', limit=2, after=after)
+            if not page:
+                break
+            pages.append([media.medianame for media, _ in page])
+            after = (page[-1][1], page[-1][0].id)
+
+        # every match has the same search rank, so they are in order of id from highest to lowest
+        self.assertListEqual(pages, [['star 4', 'star 3'], ['star 2', 'star 1'], ['star 0']])
+
+    def test_autocomplete_media(self):
+        self.require_pg_trgm()
+
+        user1 = User('testname1', 'P@ssw0rd')
+        user2 = User('testname2', 'P@ssw0rd')
+        db.session.add(user1)
+        db.session.add(user2)
+        db.session.commit()
+
+        db.session.add(Media('Star Wars', user1.id))
+        db.session.add(Media('Stargate', user1.id))
+        db.session.add(Media('Starship Troopers', user1.id))
+        db.session.add(Media('Dune', user1.id))
+        db.session.add(Media('Star Trek', user2.id))
+        db.session.commit()
+
+        suggestions = autocomplete_media(user1.id, 'star', 10)
+
+        # a whole word match comes before names that only start with the prefix
+        self.assertEqual(suggestions[0]['name'], 'Star Wars')
+        self.assertCountEqual([suggestion['name'] for suggestion in suggestions],
+                              ['Star Wars', 'Stargate', 'Starship Troopers'])
+        self.assertListEqual([suggestion['name'] for suggestion in autocomplete_media(user1.id, 'star', 1)],
+                             ['Star Wars'])
+        self.assertListEqual(autocomplete_media(user1.id, 'trek', 10), [])
+
+    def test_autocomplete_media_plan(self):
+        self.require_pg_trgm()
+
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        # too few rows for the planner to pick the index on its own
+        db.session.execute('SET LOCAL enable_seqscan = off')
+        plan = '\n'.join(row[0] for row in db.session.execute(
+            'EXPLAIN SELECT id, medianame FROM media WHERE "user" = :user AND medianame %> :prefix '
+            'ORDER BY medianame <->> :prefix LIMIT 10', {'user': user.id, 'prefix': 'star'}))
+
+        # the index scan filters by user and hands the matches over in order, nothing is sorted afterwards
+        self.assertIn(MEDIANAME_TRIGRAM_INDEX, plan)
+        self.assertIn('Order By', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_get_media_changes(self):
+        user1 = User('testname1', 'P@ssw0rd')
+        user2 = User('testname2', 'P@ssw0rd')
+        db.session.add(user1)
+        db.session.add(user2)
+        db.session.commit()
+
+        for i in range(4):
+            add_media(user1.id, 'testmedianame{}'.format(i), order=i)
+        add_media(user2.id, 'othermedianame')
+
+        changed, deleted, seq, reset = get_media_changes(user1.id, 0)
+        self.assertListEqual([media.id for media, _ in changed], [1, 2, 3, 4])
+        self.assertListEqual(deleted, [])
+        self.assertFalse(reset)
+
+        # nothing changed
+        self.assertEqual(get_media_changes(user1.id, seq), ([], [], seq, False))
+
+        update_media(2, consumed_state='finished')
+        upsert_media_list(user1.id, [{'id': 3, 'name': 'renamed'}, {'name': 'newmedianame'}])
+        remove_media(4)
+        remove_media_list(user1.id, ids=[1])
+
+        changed, deleted, new_seq, _ = get_media_changes(user1.id, seq)
+        self.assertListEqual([(media.id, media.medianame, media.consumed_state) for media, _ in changed],
+                             [(2, 'testmedianame1', 'finished'), (6, 'newmedianame', 'not started'),
+                              (3, 'renamed', 'not started')])
+        self.assertIsNotNone(changed[0][1])
+        self.assertCountEqual(deleted, [1, 4])
+        self.assertGreater(new_seq, seq)
+
+        # moves and renormalizations change rank and order
+        move_media(user1.id, 2, before=6)
+        changed, _, seq, _ = get_media_changes(user1.id, new_seq)
+        self.assertListEqual([media.id for media, _ in changed], [2])
+
+        renormalize_media_ranks(user1.id)
+        changed, deleted, _, _ = get_media_changes(user1.id, seq)
+        # only the rows whose rank or order changed
+        self.assertCountEqual([(media.id, media.order) for media, _ in changed], [(2, 0), (6, 1)])
+        self.assertListEqual(deleted, [])
+
+    def test_get_media_changes_concurrent_writes(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i in range(2):
+            add_media(user.id, 'testmedianame{}'.format(i))
+        _, _, seq, _ = get_media_changes(user.id, 0)
+
+        def write_in_other_session():
+            with self.app.app_context():
+                update_media(1, consumed_state='finished')
+                remove_media(2)
+                db.session.remove()
+
+        # an update and then a delete commit right after get_media_changes' first statement
+        written = []
+
+        def after_first_statement(*args):
+            if not written:
+                written.append(True)
+                thread = threading.Thread(target=write_in_other_session)
+                thread.start()
+                thread.join()
+
+        event.listen(db.engine, 'after_cursor_execute', after_first_statement)
+        try:
+            changed, deleted, seq, _ = get_media_changes(user.id, seq)
+        finally:
+            event.remove(db.engine, 'after_cursor_execute', after_first_statement)
+        changed_later, deleted_later, _, _ = get_media_changes(user.id, seq)
+
+        # neither write may be skipped, whichever sync they show up in
+        self.assertIn((1, 'finished'), [(media.id, media.consumed_state) for media, _ in changed + changed_later])
+        self.assertIn(2, deleted + deleted_later)
+
+    def test_prune_media_tombstones(self):
+        user1 = User('testname1', 'P@ssw0rd')
+        user2 = User('testname2', 'P@ssw0rd')
+        db.session.add(user1)
+        db.session.add(user2)
+        db.session.commit()
+
+        for i in range(3):
+            add_media(user1.id, 'testmedianame{}'.format(i))
+        add_media(user2.id, 'othermedianame')
+        _, _, seq, _ = get_media_changes(user1.id, 0)
+
+        remove_media(1)
+        _, _, old_seq, _ = get_media_changes(user1.id, seq)
+        remove_media(2)
+        remove_media(4)
+        db.session.execute(MediaTombstone.__table__.update()
+                           .where(MediaTombstone.id.in_([1, 4]))
+                           .values(deleted_at=func.now() - datetime.timedelta(days=31)))
+        db.session.commit()
+
+        self.assertEqual(prune_media_tombstones(datetime.timedelta(days=30)), 2)
+        self.assertListEqual([tombstone.id for tombstone in MediaTombstone.query.all()], [2])
+        self.assertEqual(prune_media_tombstones(datetime.timedelta(days=30)), 0)
+
+        # syncing from before the pruned tombstone starts over with the whole list
+        changed, deleted, new_seq, reset = get_media_changes(user1.id, seq)
+        self.assertTrue(reset)
+        self.assertListEqual([media.id for media, _ in changed], [3])
+        self.assertListEqual(deleted, [])
+        self.assertGreater(new_seq, old_seq)
+
+        # but not from after it
+        changed, deleted, _, reset = get_media_changes(user1.id, old_seq)
+        self.assertFalse(reset)
+        self.assertListEqual(changed, [])
+        self.assertListEqual(deleted, [2])
+
+        self.assertFalse(get_media_changes(user1.id, new_seq)[3])
+        self.assertEqual(User.query.get(user1.id).pruned_tombstone_seq, old_seq)
+        self.assertGreater(User.query.get(user2.id).pruned_tombstone_seq, old_seq)
@@ -263,3 +263,16 @@ class GoGoMediaMediaModelTestCase(GoGoMediaBaseTestCase):
             'description': 'some description',
             'order': 5
         })
+
+    def test_repr(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media = Media('testmedianame', user.id, medium='film', order=5)
+        db.session.add(media)
+        db.session.commit()
+
+        self.assertEqual(repr(media), '<Media(id={}, medianame=testmedianame, user={}, medium=film, '
+                                      'consumed_state=not started, order=5, rank={})>'.format(media.id, user.id,
+                                                                                             media.rank))
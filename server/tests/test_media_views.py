@@ -1,11 +1,20 @@
+import datetime
 import json
+import time
 import unittest
+
+from sqlalchemy import func
+
 from base_test_case import GoGoMediaBaseTestCase
 
 from database import db
 
 from models.user import User
 from models.media import Media
+from models.media_tombstone import MediaTombstone
+
+from logic.media import prune_media_tombstones
+from logic.media_cache import media_cache, LRUCacheBackend
 
 
 class GoGoMediaMediaViewsTestCase(GoGoMediaBaseTestCase):
@@ -434,6 +443,34 @@ class GoGoMediaMediaViewsTestCase(GoGoMediaBaseTestCase):
 
         self.assertListEqual(media_list, [])
 
+    def test_add_multiple_media_reports_every_error(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.put('/user/testname/media',
+                                   data=json.dumps([
+                                       {'name': 'testmedianame1', 'medium': 'book', 'order': 2 ** 31},
+                                       {'name': 'testmedianame2'},
+                                       {'description': 'no name'},
+                                       'testmedianame4'
+                                   ]),
+                                   content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(body['success'])
+        self.assertEqual(body['message'], 'medium parameter must be \'film\', \'audio\', \'literature\', or \'other\'')
+        self.assertListEqual(body['errors'], [
+            {'index': 0, 'field': 'medium',
+             'message': 'medium parameter must be \'film\', \'audio\', \'literature\', or \'other\''},
+            {'index': 0, 'field': 'order', 'message': 'order parameter must be a 32 bit integer'},
+            {'index': 2, 'field': None, 'message': 'missing parameter \'name\' or parameter \'id\''},
+            {'index': 3, 'field': None, 'message': 'media element must be a JSON object'}
+        ])
+
+        self.assertListEqual(Media.query.all(), [])
+
     def test_update_media_consumed_state(self):
         user = User('testname', 'P@ssw0rd')
         db.session.add(user)
@@ -996,6 +1033,143 @@ class GoGoMediaMediaViewsTestCase(GoGoMediaBaseTestCase):
         self.assertEqual(body['message'],
                          'medium url parameter must be \'film\', \'audio\', \'literature\', or \'other\'')
 
+    def test_get_media_paginated(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media_list = [Media('testmedianame{}'.format(i), user.id, order=i // 2) for i in range(5)]
+        for media in media_list:
+            db.session.add(media)
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media?limit=2')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body['success'])
+        self.assertListEqual(body['data'], [media_list[0].as_dict(), media_list[1].as_dict()])
+        self.assertIsNotNone(body['next_cursor'])
+
+        response = self.client.get('/user/testname/media?limit=2&after=' + body['next_cursor'])
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(body['data'], [media_list[2].as_dict(), media_list[3].as_dict()])
+        self.assertIsNotNone(body['next_cursor'])
+
+        response = self.client.get('/user/testname/media?limit=2&after=' + body['next_cursor'])
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(body['data'], [media_list[4].as_dict()])
+        self.assertIsNone(body['next_cursor'])
+
+    def test_get_media_paginated_with_specific_medium(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media1 = Media('testmedianame1', user.id, medium='film', order=0)
+        media2 = Media('testmedianame2', user.id, medium='other', order=1)
+        media3 = Media('testmedianame3', user.id, medium='film', order=2)
+        db.session.add(media1)
+        db.session.add(media2)
+        db.session.add(media3)
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media?medium=film&limit=1')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertListEqual(body['data'], [media1.as_dict()])
+
+        response = self.client.get('/user/testname/media?medium=film&limit=1&after=' + body['next_cursor'])
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(body['data'], [media3.as_dict()])
+        self.assertIsNone(body['next_cursor'])
+
+    def test_get_media_streamed(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i in range(50):
+            db.session.add(Media('testmedianame{}'.format(i), user.id, medium='film' if i % 2 else 'audio', order=i))
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media?medium=film')
+        body = json.loads(response.get_data(as_text=True))
+
+        response = self.client.get('/user/testname/media?medium=film&stream=true')
+        streamed_body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertEqual(streamed_body, body)
+        self.assertEqual(len(streamed_body['data']), 25)
+
+    def test_get_media_streamed_empty_list(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media?stream=true')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body['success'])
+        self.assertEqual(body['data'], [])
+
+    def test_get_media_with_malformed_stream_url_parameter(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media?stream=yes')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(body['success'])
+        self.assertEqual(body['message'], 'stream url parameter must be \'true\' or \'false\'')
+
+    def test_get_media_unpaginated_has_no_next_cursor(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('next_cursor', body)
+
+    def test_get_media_with_malformed_limit_url_parameter(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for limit in ['0', '-1', 'asdf']:
+            response = self.client.get('/user/testname/media?limit=' + limit)
+            body = json.loads(response.get_data(as_text=True))
+
+            self.assertEqual(response.status_code, 422)
+            self.assertFalse(body['success'])
+            self.assertEqual(body['message'], 'limit url parameter must be a positive integer')
+
+    def test_get_media_with_malformed_after_url_parameter(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media?limit=2&after=asdf')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(body['success'])
+        self.assertEqual(body['message'], 'after url parameter must be a cursor returned as next_cursor')
+
     def test_delete_media(self):
         user = User('testname', 'P@ssw0rd')
         db.session.add(user)
@@ -1029,7 +1203,7 @@ class GoGoMediaMediaViewsTestCase(GoGoMediaBaseTestCase):
 
         self.assertEqual(response.status_code, 422)
         self.assertFalse(body['success'])
-        self.assertEqual(body['message'], 'missing parameter \'id\'')
+        self.assertEqual(body['message'], 'missing parameter \'id\', \'medium\' or \'consumed_state\'')
 
     def test_delete_media_mistyped_request_body_param(self):
         user = User('testname', 'P@ssw0rd')
@@ -1057,3 +1231,722 @@ class GoGoMediaMediaViewsTestCase(GoGoMediaBaseTestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertTrue(body['success'])
+        self.assertEqual(body['data'], {'deleted': 0})
+
+    def test_delete_other_users_media(self):
+        user1 = User('testname1', 'P@ssw0rd')
+        user2 = User('testname2', 'pass123')
+        db.session.add(user1)
+        db.session.add(user2)
+        db.session.commit()
+
+        media = Media('testmedianame', user1.id)
+        db.session.add(media)
+        db.session.commit()
+
+        response = self.client.delete('/user/testname2/media',
+                                      data=json.dumps({'id': media.id}),
+                                      content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body['data'], {'deleted': 0})
+        self.assertEqual(Media.query.count(), 1)
+
+    def test_delete_multiple_media(self):
+        user1 = User('testname1', 'P@ssw0rd')
+        user2 = User('testname2', 'pass123')
+        db.session.add(user1)
+        db.session.add(user2)
+        db.session.commit()
+
+        for i in range(4):
+            db.session.add(Media('testmedianame{}'.format(i), user1.id))
+        db.session.add(Media('othermedianame', user2.id))
+        db.session.commit()
+
+        # the other user's media element isn't deleted
+        response = self.client.delete('/user/testname1/media',
+                                      data=json.dumps({'id': [1, 3, 5]}),
+                                      content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body['success'])
+        self.assertEqual(body['message'], 'successfully deleted media elements')
+        self.assertEqual(body['data'], {'deleted': 2})
+        self.assertListEqual([media.id for media in Media.query.order_by(Media.id)], [2, 4, 5])
+
+    def test_delete_media_by_filter(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        db.session.add(Media('testmedianame1', user.id, medium='film', consumed_state='finished'))
+        db.session.add(Media('testmedianame2', user.id, medium='film', consumed_state='started'))
+        db.session.add(Media('testmedianame3', user.id, medium='audio', consumed_state='finished'))
+        db.session.add(Media('testmedianame4', user.id, medium='film', consumed_state='finished'))
+        db.session.commit()
+
+        # get_user, media_version bump, DELETE and media counts
+        with self.assertMaxQueries(4):
+            response = self.client.delete('/user/testname/media',
+                                          data=json.dumps({'medium': 'film', 'consumed_state': 'finished'}),
+                                          content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body['data'], {'deleted': 2})
+        self.assertListEqual([media.medianame for media in Media.query.order_by(Media.id)],
+                             ['testmedianame2', 'testmedianame3'])
+
+    def test_delete_media_mistyped_filters(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.delete('/user/testname/media',
+                                      data=json.dumps({'id': [1, '2']}),
+                                      content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(body['message'], 'id parameter must be a list of integers')
+
+        response = self.client.delete('/user/testname/media',
+                                      data=json.dumps({'consumed_state': 'done'}),
+                                      content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(body['message'],
+                         'consumed_state parameter must be \'not started\', \'started\', or \'finished\'')
+
+    def test_delete_media_unhashable_filters(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.delete('/user/testname/media',
+                                      data=json.dumps({'medium': ['film']}),
+                                      content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(body['message'], 'medium parameter must be \'film\', \'audio\', \'literature\', or \'other\'')
+
+        response = self.client.delete('/user/testname/media',
+                                      data=json.dumps({'consumed_state': {'state': 'finished'}}),
+                                      content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(body['message'],
+                         'consumed_state parameter must be \'not started\', \'started\', or \'finished\'')
+
+    def test_get_media_query_count(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i in range(20):
+            db.session.add(Media('testmedianame{}'.format(i), user.id))
+        db.session.commit()
+
+        with self.assertMaxQueries(2):
+            response = self.client.get('/user/testname/media?medium=other&limit=10')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_add_and_update_multiple_media_query_count(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i in range(20):
+            db.session.add(Media('testmedianame{}'.format(i), user.id))
+        db.session.commit()
+
+        body = [{'id': id, 'order': id} for id in range(1, 21)] + [{'name': 'newmedianame'} for _ in range(20)]
+
+        # get_user, ownership check, INSERT, UPDATE, media_version bump and media counts, no matter how many media
+        # elements are in the body
+        with self.assertMaxQueries(6):
+            response = self.client.put('/user/testname/media',
+                                       data=json.dumps(body),
+                                       content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_media_query_count(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        media = Media('testmedianame', user.id)
+        db.session.add(media)
+        db.session.commit()
+        media_id = media.id
+
+        with self.assertMaxQueries(4):
+            response = self.client.delete('/user/testname/media',
+                                          data=json.dumps({'id': media_id}),
+                                          content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_server_timing_header(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media')
+
+        self.assertNotIn('Server-Timing', response.headers)
+
+        self.app.config['SERVER_TIMING'] = True
+        response = self.client.get('/user/testname/media')
+
+        self.assertIn('db;desc="2 queries";dur=', response.headers['Server-Timing'])
+        self.assertIn('db-slowest;desc="SELECT', response.headers['Server-Timing'])
+
+    def test_get_media_etag(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media')
+        etag = response.headers['ETag']
+
+        self.assertEqual(response.status_code, 200)
+
+        # a GET with the same ETag is answered with a 304 using only the get_user query
+        with self.assertMaxQueries(1):
+            response = self.client.get('/user/testname/media', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+        # different url parameters have a different ETag
+        response = self.client.get('/user/testname/media?medium=film', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_get_media_etag_changes_with_media(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        etags = [self.client.get('/user/testname/media').headers['ETag']]
+
+        self.client.put('/user/testname/media',
+                        data=json.dumps({'name': 'testmedianame'}),
+                        content_type='application/json')
+        etags.append(self.client.get('/user/testname/media').headers['ETag'])
+
+        self.client.put('/user/testname/media',
+                        data=json.dumps({'id': 1, 'order': 2}),
+                        content_type='application/json')
+        etags.append(self.client.get('/user/testname/media').headers['ETag'])
+
+        self.client.put('/user/testname/media',
+                        data=json.dumps([{'id': 1, 'order': 3}, {'name': 'testmedianame2'}]),
+                        content_type='application/json')
+        etags.append(self.client.get('/user/testname/media').headers['ETag'])
+
+        self.client.delete('/user/testname/media',
+                           data=json.dumps({'id': 1}),
+                           content_type='application/json')
+        etags.append(self.client.get('/user/testname/media').headers['ETag'])
+
+        self.assertEqual(len(set(etags)), 5)
+
+        response = self.client.get('/user/testname/media', headers={'If-None-Match': etags[0]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.get_data(as_text=True))['data']), 1)
+
+    def test_get_media_cached(self):
+        media_cache.configure(LRUCacheBackend())
+        self.addCleanup(media_cache.configure, None)
+
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        self.client.put('/user/testname/media',
+                        data=json.dumps({'name': 'testmedianame'}),
+                        content_type='application/json')
+
+        response = self.client.get('/user/testname/media')
+
+        # a cached media list only needs the get_user query
+        with self.assertMaxQueries(1):
+            cached_response = self.client.get('/user/testname/media')
+
+        self.assertEqual(cached_response.status_code, 200)
+        self.assertEqual(cached_response.mimetype, 'application/json')
+        self.assertEqual(cached_response.get_data(), response.get_data())
+        self.assertEqual(media_cache.stats()['hits'], 1)
+
+        # each filter is cached separately
+        response = self.client.get('/user/testname/media?medium=film')
+
+        self.assertEqual(json.loads(response.get_data(as_text=True))['data'], [])
+        self.assertEqual(media_cache.stats()['misses'], 2)
+
+        # any change to the media drops the cached lists
+        self.client.put('/user/testname/media',
+                        data=json.dumps({'id': 1, 'medium': 'film'}),
+                        content_type='application/json')
+        response = self.client.get('/user/testname/media?medium=film')
+
+        self.assertEqual(len(json.loads(response.get_data(as_text=True))['data']), 1)
+
+        self.client.delete('/user/testname/media',
+                           data=json.dumps({'id': 1}),
+                           content_type='application/json')
+        response = self.client.get('/user/testname/media')
+
+        self.assertEqual(json.loads(response.get_data(as_text=True))['data'], [])
+
+    def test_get_media_cached_entry_from_old_version(self):
+        media_cache.configure(LRUCacheBackend())
+        self.addCleanup(media_cache.configure, None)
+
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        self.client.get('/user/testname/media')
+
+        # a change made by another worker bumps media_version without invalidating this worker's cache
+        db.session.add(Media('testmedianame', user.id))
+        user.media_version += 1
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media')
+
+        self.assertEqual(len(json.loads(response.get_data(as_text=True))['data']), 1)
+        self.assertEqual(media_cache.stats()['hits'], 0)
+
+    def test_get_media_stale_entry_has_its_own_etag(self):
+        media_cache.configure(LRUCacheBackend(), stale_while_revalidate=True)
+        self.addCleanup(media_cache.configure, None)
+
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        old_etag = self.client.get('/user/testname/media').headers['ETag']
+
+        # a change made by another worker bumps media_version without invalidating this worker's cache
+        db.session.add(Media('testmedianame', user.id))
+        user.media_version += 1
+        db.session.commit()
+
+        response = self.client.get('/user/testname/media')
+
+        self.assertEqual(json.loads(response.get_data(as_text=True))['data'], [])
+        self.assertEqual(response.headers['ETag'], old_etag)
+        self.assertEqual(media_cache.stats()['stale_hits'], 1)
+
+        for _ in range(100):
+            if media_cache.backend.get(user.id, (None, None))[0] == 1:
+                break
+            time.sleep(0.01)
+
+        # the stale body's ETag doesn't match the current version, so it isn't answered with a 304
+        response = self.client.get('/user/testname/media', headers={'If-None-Match': old_etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.get_data(as_text=True))['data']), 1)
+        self.assertNotEqual(response.headers['ETag'], old_etag)
+
+    def test_move_media(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i in range(3):
+            db.session.add(Media('testmedianame{}'.format(i), user.id, order=i * 10))
+        db.session.commit()
+
+        # get_user, ownership check, media_version bump, the moved media element, its neighbours, the UPDATE and
+        # reloading the moved media element for the response
+        with self.assertMaxQueries(7):
+            response = self.client.post('/user/testname/media/move',
+                                        data=json.dumps({'id': 3, 'after': 1, 'before': 2}),
+                                        content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body['success'])
+        self.assertEqual(body['message'], 'successfully moved media element')
+        self.assertEqual(body['data']['id'], 3)
+        self.assertEqual(body['data']['order'], 5)
+
+        response = self.client.get('/user/testname/media')
+        self.assertListEqual([media['id'] for media in json.loads(response.get_data(as_text=True))['data']],
+                             [1, 3, 2])
+
+    def test_move_media_to_start(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i in range(3):
+            db.session.add(Media('testmedianame{}'.format(i), user.id, order=i))
+        db.session.commit()
+
+        response = self.client.post('/user/testname/media/move',
+                                    data=json.dumps({'id': 3, 'before': 1}),
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/user/testname/media')
+        self.assertListEqual([(media['id'], media['order'])
+                              for media in json.loads(response.get_data(as_text=True))['data']],
+                             [(3, -1), (1, 0), (2, 1)])
+
+    def test_move_media_missing_neighbours(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.post('/user/testname/media/move',
+                                    data=json.dumps({'id': 1}),
+                                    content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(body['success'])
+        self.assertEqual(body['message'], 'missing parameter \'after\' or parameter \'before\'')
+
+    def test_move_media_mistyped_params(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.post('/user/testname/media/move',
+                                    data=json.dumps({'id': 1, 'after': '2'}),
+                                    content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(body['message'], 'after parameter must be type integer')
+
+        response = self.client.post('/user/testname/media/move',
+                                    data=json.dumps({'id': 1, 'after': 1}),
+                                    content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(body['message'], 'media can\'t be moved next to itself')
+
+    def test_move_media_wrong_neighbour_order(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i in range(3):
+            db.session.add(Media('testmedianame{}'.format(i), user.id, order=i))
+        db.session.commit()
+
+        response = self.client.post('/user/testname/media/move',
+                                    data=json.dumps({'id': 1, 'after': 3, 'before': 2}),
+                                    content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(body['message'], 'media given as after must come before media given as before')
+
+    def test_move_media_other_users_media_id(self):
+        user1 = User('testname1', 'P@ssw0rd')
+        user2 = User('testname2', 'pass123')
+        db.session.add(user1)
+        db.session.add(user2)
+        db.session.commit()
+
+        db.session.add(Media('testmedianame1', user1.id))
+        db.session.add(Media('testmedianame2', user2.id))
+        db.session.commit()
+
+        response = self.client.post('/user/testname2/media/move',
+                                    data=json.dumps({'id': 2, 'after': 1}),
+                                    content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(body['success'])
+        self.assertEqual(body['message'], 'logged in user doesn\'t have media with given id')
+
+    def test_update_media_order_out_of_range(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.put('/user/testname/media',
+                                   data=json.dumps({'name': 'testmedianame', 'order': 2 ** 31}),
+                                   content_type='application/json')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(body['message'], 'order parameter must be a 32 bit integer')
+
+    def test_search_media(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        db.session.add(Media('Star Wars', user.id, medium='film'))
+        db.session.add(Media('The Matrix', user.id, medium='film', description='not about stars'))
+        db.session.add(Media('Dune', user.id, medium='literature'))
+        db.session.commit()
+
+        with self.assertMaxQueries(2):
+            response = self.client.get('/user/testname/media/search?q=star')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body['success'])
+        self.assertEqual(body['message'], 'successfully searched media for the logged in user')
+        self.assertListEqual([media['name'] for media in body['data']], ['Star Wars', 'The Matrix'])
+        self.assertIsNone(body['next_cursor'])
+
+        response = self.client.get('/user/testname/media/search?q=star&medium=literature')
+        self.assertListEqual(json.loads(response.get_data(as_text=True))['data'], [])
+
+    def test_search_media_pages(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for i in range(5):
+            db.session.add(Media('star {}'.format(i), user.id))
+        db.session.commit()
+
+        names = []
+        path = '/user/testname/media/search?q=star&limit=2'
+        while path is not None:
+            body = json.loads(self.client.get(path).get_data(as_text=True))
+            names += [media['name'] for media in body['data']]
+            path = '/user/testname/media/search?q=star&limit=2&after=' + body['next_cursor'] \
+                if body['next_cursor'] else None
+
+        self.assertListEqual(names, ['star 4', 'star 3', 'star 2', 'star 1', 'star 0'])
+
+    def test_search_media_bad_url_params(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for path, message in [('/user/testname/media/search', 'missing url parameter \'q\''),
+                              ('/user/testname/media/search?q=%20', 'missing url parameter \'q\''),
+                              ('/user/testname/media/search?q=' + 'a' * 201,
+                               'q url parameter must be at most 200 characters'),
+                              ('/user/testname/media/search?q=star&after=asdf',
+                               'after url parameter must be a cursor returned as next_cursor'),
+                              ('/user/testname/media/search?q=star&limit=0',
+                               'limit url parameter must be a positive integer')]:
+            response = self.client.get(path)
+            body = json.loads(response.get_data(as_text=True))
+
+            self.assertEqual(response.status_code, 422)
+            self.assertFalse(body['success'])
+            self.assertEqual(body['message'], message)
+
+    def test_autocomplete_media(self):
+        self.require_pg_trgm()
+
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        db.session.add(Media('Star Wars', user.id))
+        db.session.add(Media('Stargate', user.id))
+        db.session.add(Media('Dune', user.id))
+        db.session.commit()
+
+        with self.assertMaxQueries(2):
+            response = self.client.get('/user/testname/media/autocomplete?q=STAR&limit=1')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body['success'])
+        self.assertEqual(body['message'], 'successfully got autocomplete suggestions for the logged in user')
+        self.assertListEqual(body['data'], [{'id': 1, 'name': 'Star Wars'}])
+
+    def test_autocomplete_media_short_prefix(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        db.session.add(Media('Star Wars', user.id))
+        db.session.commit()
+
+        # only the user is looked up, a prefix this short isn't worth a query
+        with self.assertMaxQueries(1):
+            response = self.client.get('/user/testname/media/autocomplete?q=s')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(body['data'], [])
+
+    def test_autocomplete_media_bad_url_params(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for path, message in [('/user/testname/media/autocomplete', 'missing url parameter \'q\''),
+                              ('/user/testname/media/autocomplete?q=' + 'a' * 81,
+                               'q url parameter must be at most 80 characters'),
+                              ('/user/testname/media/autocomplete?q=star&limit=0',
+                               'limit url parameter must be a positive integer up to 50'),
+                              ('/user/testname/media/autocomplete?q=star&limit=51',
+                               'limit url parameter must be a positive integer up to 50')]:
+            response = self.client.get(path)
+            body = json.loads(response.get_data(as_text=True))
+
+            self.assertEqual(response.status_code, 422)
+            self.assertFalse(body['success'])
+            self.assertEqual(body['message'], message)
+
+    def test_media_stats(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        self.client.put('/user/testname/media', data=json.dumps([
+            {'name': 'testmedianame1', 'medium': 'film'},
+            {'name': 'testmedianame2', 'medium': 'film'},
+            {'name': 'testmedianame3', 'medium': 'literature', 'consumed_state': 'started'}
+        ]), content_type='application/json')
+        self.client.put('/user/testname/media', data=json.dumps({'id': 1, 'consumed_state': 'finished'}),
+                        content_type='application/json')
+        self.client.delete('/user/testname/media', data=json.dumps({'id': 2}), content_type='application/json')
+
+        # the user, and then their counts
+        with self.assertMaxQueries(2):
+            response = self.client.get('/user/testname/media/stats')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body['success'])
+        self.assertEqual(body['message'], 'successfully got media stats for the logged in user')
+        self.assertEqual(body['data']['total'], 2)
+        self.assertDictEqual(body['data']['counts'], {
+            'film': {'not started': 0, 'started': 0, 'finished': 1},
+            'audio': {'not started': 0, 'started': 0, 'finished': 0},
+            'literature': {'not started': 0, 'started': 1, 'finished': 0},
+            'other': {'not started': 0, 'started': 0, 'finished': 0}
+        })
+
+    def test_media_stats_nonexistent_user(self):
+        response = self.client.get('/user/testname/media/stats')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(body['success'])
+        self.assertEqual(body['message'], 'user doesn\'t exist')
+
+    def test_media_events_not_served(self):
+        response = self.client.get('/user/testname/media/events')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(body['success'])
+        self.assertEqual(body['message'], 'media events are only served by the async server')
+
+    def test_get_media_since(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        self.client.put('/user/testname/media', data=json.dumps([{'name': 'testmedianame{}'.format(i)}
+                                                                 for i in range(3)]),
+                        content_type='application/json')
+
+        response = self.client.get('/user/testname/media?since=0')
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body['success'])
+        self.assertEqual(body['message'], 'successfully got media changes for the logged in user')
+        self.assertListEqual([media['name'] for media in body['data']],
+                             ['testmedianame0', 'testmedianame1', 'testmedianame2'])
+        self.assertIn('updated_at', body['data'][0])
+        self.assertListEqual(body['deleted'], [])
+        seq = body['seq']
+
+        self.client.put('/user/testname/media', data=json.dumps({'id': 2, 'consumed_state': 'started'}),
+                        content_type='application/json')
+        self.client.delete('/user/testname/media', data=json.dumps({'id': 3}), content_type='application/json')
+
+        # the user, and the changed media with the tombstones, no matter how long the list is
+        with self.assertMaxQueries(2):
+            response = self.client.get('/user/testname/media?since={}'.format(seq))
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([(media['id'], media['consumed_state']) for media in body['data']], [(2, 'started')])
+        self.assertListEqual(body['deleted'], [3])
+        self.assertGreater(body['seq'], seq)
+        self.assertFalse(body['reset'])
+
+        response = self.client.get('/user/testname/media?since={}'.format(body['seq']))
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertListEqual(body['data'], [])
+        self.assertListEqual(body['deleted'], [])
+
+    def test_get_media_since_pruned(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        self.client.put('/user/testname/media', data=json.dumps([{'name': 'testmedianame{}'.format(i)}
+                                                                 for i in range(3)]),
+                        content_type='application/json')
+        seq = json.loads(self.client.get('/user/testname/media?since=0').get_data(as_text=True))['seq']
+
+        self.client.delete('/user/testname/media', data=json.dumps({'id': 1}), content_type='application/json')
+        db.session.execute(MediaTombstone.__table__.update()
+                           .values(deleted_at=func.now() - datetime.timedelta(days=31)))
+        db.session.commit()
+        prune_media_tombstones(datetime.timedelta(days=30))
+
+        response = self.client.get('/user/testname/media?since={}'.format(seq))
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body['reset'])
+        self.assertListEqual([media['name'] for media in body['data']], ['testmedianame1', 'testmedianame2'])
+        self.assertListEqual(body['deleted'], [])
+
+        response = self.client.get('/user/testname/media?since={}'.format(body['seq']))
+        body = json.loads(response.get_data(as_text=True))
+
+        self.assertFalse(body['reset'])
+        self.assertListEqual(body['data'], [])
+
+    def test_get_media_since_bad_url_params(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        for path, message in [('/user/testname/media?since=-1', 'since url parameter must be a non-negative integer'),
+                              ('/user/testname/media?since=a', 'since url parameter must be a non-negative integer'),
+                              ('/user/testname/media?since=0&medium=film',
+                               'since url parameter can\'t be combined with other url parameters'),
+                              ('/user/testname/media?since=0&limit=10',
+                               'since url parameter can\'t be combined with other url parameters')]:
+            response = self.client.get(path)
+            body = json.loads(response.get_data(as_text=True))
+
+            self.assertEqual(response.status_code, 422)
+            self.assertFalse(body['success'])
+            self.assertEqual(body['message'], message)
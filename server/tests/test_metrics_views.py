@@ -0,0 +1,44 @@
+import json
+from base_test_case import GoGoMediaBaseTestCase
+
+from database import db
+
+from models.user import User
+
+
+class GoGoMediaMetricsViewsTestCase(GoGoMediaBaseTestCase):
+    def test_metrics(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        self.client.get('/user/testname/media')
+
+        response = self.client.get('/metrics')
+        body = response.get_data(as_text=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertIn('gogomedia_request_duration_seconds_count{method="GET",route="/user/<username>/media"}', body)
+        self.assertIn('gogomedia_requests_in_flight', body)
+        self.assertIn('gogomedia_db_pool_checked_out', body)
+        self.assertIn('gogomedia_password_hashing_duration_seconds_count{operation="hash"}', body)
+
+    def test_metrics_auth_token_cache(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        self.app.config['LOGIN_DISABLED'] = False
+        response = self.client.post('/login',
+                                    data=json.dumps({'username': 'testname', 'password': 'P@ssw0rd'}),
+                                    content_type='application/json')
+        auth_token = json.loads(response.get_data(as_text=True))['auth_token']
+
+        self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+
+        body = self.client.get('/metrics').get_data(as_text=True)
+
+        self.assertIn('gogomedia_auth_token_cache_requests_total{result="hit"}', body)
+        self.assertIn('gogomedia_auth_token_cache_requests_total{result="miss"}', body)
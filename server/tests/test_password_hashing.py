@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+from password_hashing import PasswordHasher, PasswordHashingBusyError
+
+
+class GoGoMediaPasswordHashingTestCase(unittest.TestCase):
+    def test_hash_and_check_password_inline(self):
+        hasher = PasswordHasher(workers=0)
+
+        passhash = hasher.hash_password('P@ssw0rd')
+
+        self.assertIsInstance(passhash, str)
+        self.assertTrue(hasher.check_password('P@ssw0rd', passhash))
+        self.assertFalse(hasher.check_password('pass123', passhash))
+
+    def test_hash_and_check_password_in_pool(self):
+        hasher = PasswordHasher(workers=1, max_queue=1)
+
+        try:
+            passhash = hasher.hash_password('P@ssw0rd')
+
+            self.assertIsInstance(passhash, str)
+            self.assertTrue(hasher.check_password('P@ssw0rd', passhash))
+            self.assertFalse(hasher.check_password('pass123', passhash))
+        finally:
+            hasher.shutdown()
+
+    def test_start(self):
+        hasher = PasswordHasher(workers=1, max_queue=0)
+
+        try:
+            hasher.start()
+            executor = hasher._executor
+            hasher.start()
+
+            self.assertIs(hasher._executor, executor)
+            # the pool's processes aren't forked from this (multi-threaded) process
+            self.assertEqual(executor._mp_context.get_start_method(), 'forkserver')
+            self.assertTrue(hasher.check_password('P@ssw0rd', hasher.hash_password('P@ssw0rd')))
+        finally:
+            hasher.shutdown()
+
+        hasher = PasswordHasher(workers=0)
+        hasher.start()
+        self.assertIsNone(hasher._executor)
+
+    def test_pool_full(self):
+        hasher = PasswordHasher(workers=1, max_queue=0)
+
+        try:
+            passhash = hasher.hash_password('P@ssw0rd')
+
+            # take the only slot, like a hash that is still running would
+            hasher._slots.acquire()
+
+            with self.assertRaises(PasswordHashingBusyError):
+                hasher.check_password('P@ssw0rd', passhash)
+
+            hasher._slots.release()
+
+            self.assertTrue(hasher.check_password('P@ssw0rd', passhash))
+        finally:
+            hasher.shutdown()
+
+    def test_hash_and_check_password_async(self):
+        for hasher in [PasswordHasher(workers=0), PasswordHasher(workers=1, max_queue=1)]:
+            async def hash_and_check():
+                passhash = await hasher.hash_password_async('P@ssw0rd')
+                return (await hasher.check_password_async('P@ssw0rd', passhash),
+                        await hasher.check_password_async('pass123', passhash))
+
+            try:
+                self.assertEqual(asyncio.run(hash_and_check()), (True, False))
+            finally:
+                hasher.shutdown()
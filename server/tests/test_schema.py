@@ -0,0 +1,46 @@
+import unittest
+
+from schema import Schema, Field
+
+
+class GoGoMediaSchemaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.schema = Schema([
+            Field('id', int, 'id must be an integer'),
+            Field('color', str, 'color must be red or blue', choices={'red', 'blue'}),
+            Field('size', int, 'size must be an integer', bounds=(1, 10), bounds_message='size must be 1 to 10')
+        ], required_any=('id', 'color'), required_message='missing id or color', object_message='not an object')
+
+    def test_valid_object(self):
+        self.assertListEqual(self.schema.errors({'id': 1, 'color': 'red', 'size': 10, 'other': None}), [])
+
+    def test_every_error_in_field_order(self):
+        self.assertListEqual(self.schema.errors({'size': 0, 'color': 'green', 'id': '1'}), [
+            {'field': 'id', 'message': 'id must be an integer'},
+            {'field': 'color', 'message': 'color must be red or blue'},
+            {'field': 'size', 'message': 'size must be 1 to 10'}
+        ])
+
+    def test_missing_required_field_comes_first(self):
+        self.assertListEqual(self.schema.errors({'size': 'big'}), [
+            {'field': None, 'message': 'missing id or color'},
+            {'field': 'size', 'message': 'size must be an integer'}
+        ])
+
+    def test_not_an_object(self):
+        for body in [None, [], 'id', 1]:
+            self.assertListEqual(self.schema.errors(body), [{'field': None, 'message': 'not an object'}])
+
+    def test_unhashable_choice(self):
+        self.assertListEqual(self.schema.errors({'color': ['red']}),
+                             [{'field': 'color', 'message': 'color must be red or blue'}])
+
+    def test_batch_errors(self):
+        errors = self.schema.batch_errors([{'id': 1}, {'id': 'a', 'size': 11}, 3, {'color': 'blue'}])
+
+        self.assertListEqual(errors, [
+            {'index': 1, 'field': 'id', 'message': 'id must be an integer'},
+            {'index': 1, 'field': 'size', 'message': 'size must be 1 to 10'},
+            {'index': 2, 'field': None, 'message': 'not an object'}
+        ])
+        self.assertListEqual(self.schema.batch_errors([{'id': 1}, {'color': 'red'}]), [])
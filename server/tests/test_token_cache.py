@@ -0,0 +1,92 @@
+import time
+import unittest
+
+from logic.token_cache import TokenCache, TokenGenerationCache
+
+
+class GoGoMediaTokenCacheTestCase(unittest.TestCase):
+    def test_get_and_set(self):
+        cache = TokenCache()
+
+        self.assertIsNone(cache.get('token1'))
+
+        cache.set('token1', 1, time.time() + 60)
+
+        self.assertEqual(cache.get('token1'), 1)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_entry_ends_at_token_expiry(self):
+        cache = TokenCache(ttl=60)
+
+        cache.set('token1', 1, time.time() - 1)
+
+        self.assertIsNone(cache.get('token1'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_entry_ends_at_ttl(self):
+        cache = TokenCache(ttl=0)
+
+        cache.set('token1', 1, time.time() + 60)
+
+        self.assertIsNone(cache.get('token1'))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TokenCache(max_size=2)
+
+        cache.set('token1', 1, time.time() + 60)
+        cache.set('token2', 2, time.time() + 60)
+        cache.get('token1')
+        cache.set('token3', 3, time.time() + 60)
+
+        self.assertEqual(cache.get('token1'), 1)
+        self.assertIsNone(cache.get('token2'))
+        self.assertEqual(cache.get('token3'), 3)
+
+    def test_invalidate(self):
+        cache = TokenCache()
+
+        cache.set('token1', 1, time.time() + 60)
+        cache.invalidate('token1')
+
+        self.assertIsNone(cache.get('token1'))
+
+
+class GoGoMediaTokenGenerationCacheTestCase(unittest.TestCase):
+    def test_get_and_set(self):
+        cache = TokenGenerationCache()
+
+        self.assertIsNone(cache.get(1))
+
+        cache.set(1, 0)
+        self.assertEqual(cache.get(1), 0)
+
+        cache.set(1, 1)
+        self.assertEqual(cache.get(1), 1)
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'size': 1})
+
+    def test_entry_ends_at_ttl(self):
+        cache = TokenGenerationCache(ttl=0)
+
+        cache.set(1, 0)
+
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_evicts_least_recently_used(self):
+        cache = TokenGenerationCache(max_size=2)
+
+        cache.set(1, 0)
+        cache.set(2, 0)
+        cache.get(1)
+        cache.set(3, 0)
+
+        self.assertEqual(cache.get(1), 0)
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(3), 0)
+
+    def test_disabled(self):
+        cache = TokenGenerationCache(max_size=0)
+
+        cache.set(1, 0)
+
+        self.assertIsNone(cache.get(1))
@@ -1,11 +1,13 @@
 import json
 import unittest
 from base_test_case import GoGoMediaBaseTestCase
+from flask import current_app
 
 from database import db
 
 from models.user import User
-from models.blacklisted_token import BlacklistedToken
+
+from password_hashing import password_hasher
 
 
 class GoGoMediaUserViewsTestCase(GoGoMediaBaseTestCase):
@@ -71,6 +73,39 @@ class GoGoMediaUserViewsTestCase(GoGoMediaBaseTestCase):
         self.assertTrue(body['success'])
         self.assertIsInstance(body['auth_token'], str)
 
+    def test_login_password_hashing_busy(self):
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        password_hasher.configure(1, 0)
+        self.assertTrue(user.authenticate_password('P@ssw0rd'))
+        # take the only slot, like a login that is still being checked would
+        password_hasher._slots.acquire()
+
+        try:
+            response = self.client.post('/login',
+                                        data=json.dumps({'username': 'testname', 'password': 'P@ssw0rd'}),
+                                        content_type='application/json')
+            body = json.loads(response.get_data(as_text=True))
+
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(body['success'])
+            self.assertEqual(body['message'], 'server busy, try again later')
+            self.assertNotIn('auth_token', body)
+
+            response = self.client.post('/register',
+                                        data=json.dumps({'username': 'testname2', 'password': 'P@ssw0rd'}),
+                                        content_type='application/json')
+            body = json.loads(response.get_data(as_text=True))
+
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(body['success'])
+            self.assertIsNone(User.query.filter(User.username == 'testname2').first())
+        finally:
+            password_hasher._slots.release()
+            password_hasher.configure(0, 0)
+
     def test_login_missing_request_body_params(self):
         response = self.client.post('/login',
                                     data=json.dumps({'password': 'P@ssw0rd'}),
@@ -116,6 +151,9 @@ class GoGoMediaUserViewsTestCase(GoGoMediaBaseTestCase):
         self.assertEqual(body['message'], 'user doesn\'t exist')
 
     def test_logout(self):
+        # logout needs the logged in user's id
+        current_app.config['LOGIN_DISABLED'] = False
+
         user = User('testname', 'P@ssw0rd')
         db.session.add(user)
         db.session.commit()
@@ -132,7 +170,34 @@ class GoGoMediaUserViewsTestCase(GoGoMediaBaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(body['success'])
 
-        blacklisted_token = BlacklistedToken.query.filter_by(token=auth_token).first()
+        self.assertEqual(User.query.filter_by(username='testname').first().token_generation, 1)
+
+    def test_logout_every_session(self):
+        current_app.config['LOGIN_DISABLED'] = False
 
-        self.assertIsNotNone(blacklisted_token)
-        self.assertEqual(blacklisted_token.token, auth_token)
+        user = User('testname', 'P@ssw0rd')
+        db.session.add(user)
+        db.session.commit()
+
+        auth_tokens = []
+        for _ in range(2):
+            response = self.client.post('/login',
+                                        data=json.dumps({'username': 'testname', 'password': 'P@ssw0rd'}),
+                                        content_type='application/json')
+            auth_tokens.append(json.loads(response.get_data(as_text=True))['auth_token'])
+
+        response = self.client.get('/logout', headers={'Authorization': 'JWT ' + auth_tokens[0]})
+        self.assertEqual(response.status_code, 200)
+
+        for auth_token in auth_tokens:
+            response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+            self.assertEqual(response.status_code, 401)
+
+        # logging back in gets a token of the new generation
+        response = self.client.post('/login',
+                                    data=json.dumps({'username': 'testname', 'password': 'P@ssw0rd'}),
+                                    content_type='application/json')
+        auth_token = json.loads(response.get_data(as_text=True))['auth_token']
+
+        response = self.client.get('/user/testname/media', headers={'Authorization': 'JWT ' + auth_token})
+        self.assertEqual(response.status_code, 200)
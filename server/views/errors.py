@@ -0,0 +1,17 @@
+from flask import jsonify
+
+from database import db
+from metrics import observe_db_pool_timeout
+
+
+def database_busy(error):
+    """
+    database_busy handles a request that waited DB_POOL_TIMEOUT seconds for a database connection without getting one
+    """
+    db.session.remove()
+    observe_db_pool_timeout()
+
+    return jsonify({
+        'success': False,
+        'message': 'server busy, try again later'
+    }), 503
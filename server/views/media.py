@@ -1,13 +1,28 @@
-from flask import request, jsonify, current_app
+import base64
+import binascii
+import hashlib
+import json
+import math
+import time
 
-from models.media import mediums, consumed_states
+from flask import request, jsonify, current_app, Response, stream_with_context
 
-from logic.media import get_media, add_media, update_media, remove_media, get_media_by_id
-from logic.user import get_user
-from logic.login import login_required
+from fractional_rank import is_rank, MIN_ORDER, MAX_ORDER
+from models.media import mediums, consumed_states
+from schema import Schema, Field
+
+from logic.media import (get_media_records, get_media_records_async, iter_media_records, add_media, update_media,
+                         remove_media_list, get_media_by_id, get_owned_media_ids, upsert_media_list, move_media,
+                         search_media, autocomplete_media, get_media_changes)
+from logic.user import get_user, get_user_async, get_media_version_async
+from logic.login import login_required, login_required_async
+from logic.media_cache import media_cache
+from logic.media_count import get_media_counts
+from logic.media_events import media_event_broker
+from logic.autocomplete_cache import autocomplete_cache
 
 # Note: It may seem like pluggable view with method based dispatching would make sense here. But because of how
-# I implement login_required, and add a parameter logged_in_user, it would not work. The ViewMethod class would
+# I implement login_required, and add a parameter logged_in_user_id, it would not work. The ViewMethod class would
 # have methods that need to accept self as the first argument, which would screw up the login_required implementation
 
 
@@ -19,8 +34,23 @@ class UnauthorizedError(Exception):
     pass
 
 
+# a media element in the body of a PUT, compiled once and used for single media elements and arrays of them
+MEDIA_PUT_SCHEMA = Schema([
+    Field('id', int, 'id parameter must be type integer'),
+    Field('name', str, 'name parameter must be type string'),
+    Field('medium', str, 'medium parameter must be \'film\', \'audio\', \'literature\', or \'other\'',
+          choices=mediums),
+    Field('consumed_state', str, 'consumed_state parameter must be \'not started\', \'started\', or \'finished\'',
+          choices=consumed_states),
+    Field('description', str, 'description parameter must be type string'),
+    Field('order', int, 'order parameter must be type integer',
+          bounds=(MIN_ORDER, MAX_ORDER), bounds_message='order parameter must be a 32 bit integer')
+], required_any=('id', 'name'), required_message='missing parameter \'name\' or parameter \'id\'',
+    object_message='media element must be a JSON object')
+
+
 @login_required
-def media(logged_in_user, username):
+def media(logged_in_user_id, username):
     """
     media accepts a PUT request with JSON that matches
         {
@@ -31,7 +61,8 @@ def media(logged_in_user, username):
             'consumed_state': a string indicating the current consumed state of this media
                 represents an Enum of possible values ('not started', 'started', 'finished')
             'description': a string indicating some details about this media type (maximum 500 characters)
-            'order': an integer indicating the order this media should be displayed on the frontend
+            'order': an integer indicating the order this media should be displayed on the frontend (media_move is the
+                way to reorder media, order is kept for older clients)
         }
     or an array of JSON objects that matches the above (to update multiple items in one request)
 
@@ -41,66 +72,60 @@ def media(logged_in_user, username):
         a request arg 'medium' can be set to 'film', 'audio', 'literature', or 'other' and only media with the same
             medium will be returned
         if no request arg is present, all media will be returned
-
-    media accepts a DELETE request with formdata that matches
+        a request arg 'limit' can be set to a positive integer, and at most that many media will be returned along with
+            a 'next_cursor' to request the next page with (None when there are no more pages)
+        a request arg 'after' can be set to a 'next_cursor' value, and only media after that cursor will be returned
+        a request arg 'stream' can be set to 'true' (when 'limit' isn't set), and the media are read from the database
+            and written out in chunks, so the whole list is never in memory at once
+        a request arg 'since' can be set to the 'seq' of an earlier response (or 0), and only the media added, updated
+            or deleted since then are returned (see media_changes_response). It can't be combined with the other args
+
+    media accepts a DELETE request with JSON that matches
         {
-            'id': a number representing the id of the media to delete
+            'id': a number representing the id of the media to delete, or an array of ids of media to delete
+            'medium': a string, only media with this medium are deleted
+            'consumed_state': a string, only media with this consumed state are deleted
         }
+    at least one of them has to be given, and only media matching all of them are deleted (so {'consumed_state':
+    'finished'} deletes every finished media element). The media are deleted with a single statement, and the response
+    data has the number of media elements deleted
     """
     body = request.get_json()
 
     # This user is the one specified in url parameters, must match the auth token user
     user = get_user(username)
-    validation_result = validate_url_username(logged_in_user, user)
+    validation_result = validate_url_username(logged_in_user_id, user)
     if validation_result is not None:
         return validation_result
 
     if request.method == 'GET':
-        validation_result = validate_get_url_parameters()
+        validation_result = validate_get_url_parameters(request.args)
         if validation_result is not None:
             return validation_result
 
-        medium = request.args.get('medium')
+        not_modified = not_modified_response(user, request.args, request.if_none_match)
+        if not_modified is not None:
+            return not_modified
 
-        consumed_state = request.args.get('consumed-state')
-        # 'not-started' is easier to put into url parameters than 'not started'
-        if consumed_state == 'not-started':
-            consumed_state = 'not started'
-
-        media_list = get_media(username, medium, consumed_state)
-
-        return jsonify({
-            'success': True,
-            'message': 'successfully got media for the logged in user',
-            'data': [media.as_dict() for media in media_list]
-        })
+        return media_list_response(user)
     elif request.method == 'PUT':
         if isinstance(body, list):
-            # validate each media element in list before adding any of them
-            for body_segment in body:
-                validation_result = validate_put_body_parameters(body_segment)
-                if validation_result is not None:
-                    return jsonify({
-                        'success': False,
-                        'message': validation_result
-                    }), 422
-
-                if 'id' in body_segment:
-                    media = get_media_by_id(body_segment['id'])
-                    if media is None or media.user != user.id:
-                        # If there is no media with this id, or it belongs to another user
-                        return jsonify({
-                            'success': False,
-                            'message': 'logged in user doesn\'t have media with given id'
-                        }), 401
-
-            media_list = []
-
-            for body_segment in body:
-                # the validation in upsert_media_from_body is done above, so it can't throw an error
-                media = upsert_media_from_body(body_segment, user)
-
-                media_list.append(media.as_dict())
+            # validate every media element in the list before adding any of them
+            validation_result = validate_put_body(body)
+            if validation_result is not None:
+                return validation_result
+
+            # check ownership of every media element being updated with a single query
+            owned_media_ids = get_owned_media_ids(user.id, [body_segment['id'] for body_segment in body
+                                                            if 'id' in body_segment])
+            if any('id' in body_segment and body_segment['id'] not in owned_media_ids for body_segment in body):
+                # If there is no media with this id, or it belongs to another user
+                return jsonify({
+                    'success': False,
+                    'message': 'logged in user doesn\'t have media with given id'
+                }), 401
+
+            media_list = upsert_media_list(user.id, body)
 
             return jsonify({
                 'success': True,
@@ -108,13 +133,12 @@ def media(logged_in_user, username):
                 'data': media_list
             })
         else:
+            validation_result = validate_put_body(body)
+            if validation_result is not None:
+                return validation_result
+
             try:
                 media = upsert_media_from_body(body, user)
-            except ValueError as e:
-                return jsonify({
-                    'success': False,
-                    'message': str(e)
-                }), 422
             except UnauthorizedError as e:
                 return jsonify({
                     'success': False,
@@ -131,26 +155,454 @@ def media(logged_in_user, username):
         if validation_result is not None:
             return validation_result
 
-        media = remove_media(body['id'])
+        ids = body.get('id')
+        if isinstance(ids, int):
+            ids = [ids]
+
+        deleted = remove_media_list(user.id, ids, body.get('medium'), body.get('consumed_state'))
         return jsonify({
             'success': True,
-            'message': 'successfully deleted media element'
+            'message': 'successfully deleted media element' if isinstance(body.get('id'), int) else
+                       'successfully deleted media elements',
+            'data': {'deleted': deleted}
         })
 
 
+@login_required
+def media_move(logged_in_user_id, username):
+    """
+    media_move accepts a POST request with JSON that matches
+        {
+            'id': a number representing the id of the media element to move
+            'after': a number representing the id of the media element to place it after
+            'before': a number representing the id of the media element to place it before
+        }
+    one of 'after' and 'before' can be missing (or null), then the media element is placed right before/after the
+    other one. Only the moved media element is changed
+    """
+    body = request.get_json()
+
+    user = get_user(username)
+    validation_result = validate_url_username(logged_in_user_id, user)
+    if validation_result is not None:
+        return validation_result
+
+    validation_result = validate_move_body_parameters(body)
+    if validation_result is not None:
+        return jsonify({
+            'success': False,
+            'message': validation_result
+        }), 422
+
+    ids = [body[key] for key in ('id', 'after', 'before') if body.get(key) is not None]
+    if len(get_owned_media_ids(user.id, ids)) != len(set(ids)):
+        # If there is no media with one of these ids, or it belongs to another user
+        return jsonify({
+            'success': False,
+            'message': 'logged in user doesn\'t have media with given id'
+        }), 401
+
+    try:
+        media = move_media(user.id, body['id'], body.get('after'), body.get('before'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 422
+
+    return jsonify({
+        'success': True,
+        'message': 'successfully moved media element',
+        'data': media.as_dict()
+    })
+
+
+@login_required
+def media_search(logged_in_user_id, username):
+    """
+    media_search accepts a GET request and returns the media of the user specified by username whose name or
+    description match a full text search, best match first
+        a request arg 'q' is the search, words (all of which have to match), "quoted phrases", 'or' and -excluded words
+        request args 'medium' and 'consumed-state' filter the matches the same way they filter the media list
+        a request arg 'limit' can be set to a positive integer, at most that many media are returned (default
+            MEDIA_SEARCH_LIMIT) along with a 'next_cursor' to request the next page with (None when there are no more)
+        a request arg 'after' can be set to a 'next_cursor' value, and only matches after that cursor will be returned
+    """
+    user = get_user(username)
+    validation_result = validate_url_username(logged_in_user_id, user) or \
+        validate_search_url_parameters(request.args)
+    if validation_result is not None:
+        return validation_result
+
+    medium, consumed_state, _ = get_url_filters(request.args, decode_after=False)
+    limit = int(request.args.get('limit', current_app.config['MEDIA_SEARCH_LIMIT']))
+    after = decode_search_cursor(request.args['after']) if 'after' in request.args else None
+
+    # get one extra match to find out if there is another page after this one
+    matches = search_media(username, request.args['q'], medium, consumed_state, limit + 1, after)
+
+    next_cursor = None
+    if len(matches) > limit:
+        matches = matches[:limit]
+        next_cursor = encode_search_cursor(*matches[-1])
+
+    return jsonify({
+        'success': True,
+        'message': 'successfully searched media for the logged in user',
+        'data': [media.as_dict() for media, _ in matches],
+        'next_cursor': next_cursor
+    })
+
+
+@login_required
+def media_autocomplete(logged_in_user_id, username):
+    """
+    media_autocomplete accepts a GET request and returns suggestions from the names of the user specified by
+    username's media, for completing what they are typing
+        a request arg 'q' is what has been typed so far, there are no suggestions until it's at least
+            AUTOCOMPLETE_MIN_LENGTH characters long
+        a request arg 'limit' can be set to a positive integer up to AUTOCOMPLETE_MAX_LIMIT, at most that many
+            suggestions are returned (default AUTOCOMPLETE_LIMIT)
+    """
+    user = get_user(username)
+    validation_result = validate_url_username(logged_in_user_id, user) or \
+        validate_autocomplete_url_parameters(request.args)
+    if validation_result is not None:
+        return validation_result
+
+    # pg_trgm ignores case and everything but letters and digits, so these prefixes share their suggestions
+    prefix = ' '.join(request.args['q'].lower().split())
+    limit = int(request.args.get('limit', current_app.config['AUTOCOMPLETE_LIMIT']))
+
+    suggestions = []
+    if len(prefix) >= current_app.config['AUTOCOMPLETE_MIN_LENGTH']:
+        userid = user.id
+        suggestions = autocomplete_cache.get_or_build(
+            userid, user.media_version, prefix, limit, lambda limit: autocomplete_media(userid, prefix, limit))
+
+    return jsonify({
+        'success': True,
+        'message': 'successfully got autocomplete suggestions for the logged in user',
+        'data': suggestions
+    })
+
+
+@login_required
+def media_stats(logged_in_user_id, username):
+    """
+    media_stats accepts a GET request and returns how many media the user specified by username has, in total and for
+    each medium and consumed_state. The counts are kept up to date as media change (see models.media_count), so this
+    doesn't count the user's media
+    """
+    user = get_user(username)
+    validation_result = validate_url_username(logged_in_user_id, user)
+    if validation_result is not None:
+        return validation_result
+
+    counts = get_media_counts(user.id)
+
+    return jsonify({
+        'success': True,
+        'message': 'successfully got media stats for the logged in user',
+        'data': {
+            'total': sum(sum(medium_counts.values()) for medium_counts in counts.values()),
+            'counts': counts
+        }
+    })
+
+
+def media_list_response(user):
+    """
+    media_list_response gets the media list for a validated GET request, and returns the response for it, with its
+    ETag. Whole (not paged or streamed) media lists are served from media_cache, with the ETag of the media_version
+    they were built at
+    """
+    if 'since' in request.args:
+        response = media_changes_response(user)
+        response.set_etag(media_list_etag(user, request.args))
+        return response
+
+    username = user.username
+    medium, consumed_state, after = get_url_filters(request.args)
+    limit = get_url_limit(request.args)
+
+    if limit is None and request.args.get('stream') == 'true':
+        media_list = iter_media_records(username, medium, consumed_state, after=after)
+
+        response = Response(stream_with_context(stream_media_list_json(
+            'successfully got media for the logged in user', media_list)), mimetype='application/json')
+        response.set_etag(media_list_etag(user, request.args))
+        return response
+
+    if limit is None and after is None:
+        def build():
+            return media_list_body(get_media_records(username, medium, consumed_state))
+
+        media_version, body = media_cache.get_or_build(user.id, (medium, consumed_state), user.media_version, build)
+        return cached_media_list_response(user, request.args, media_version, body)
+
+    media_list = get_media_records(username, medium, consumed_state, page_fetch_limit(limit), after)
+
+    return media_page_response(user, request.args, media_list, limit)
+
+
+def media_changes_response(user):
+    """
+    media_changes_response returns the response for a validated delta sync GET request: the media added or updated
+    since the 'since' url parameter (with when they were last updated) in 'data', the ids of the media deleted since
+    then in 'deleted', and the 'seq' to send as 'since' next time. If deletes after 'since' were pruned 'reset' is true,
+    and 'data' is the whole list instead
+    """
+    changed, deleted, seq, reset = get_media_changes(user.id, int(request.args['since']))
+
+    return jsonify({
+        'success': True,
+        'message': 'successfully got media changes for the logged in user',
+        'data': [dict(media.as_dict(), updated_at=updated_at.isoformat()) for media, updated_at in changed],
+        'deleted': deleted,
+        'seq': seq,
+        'reset': reset
+    })
+
+
+async def media_async(request, username):
+    """
+    media_async is the async version of media, used by the ASGI app (see asgi.py). It serves the same GET requests with
+    the same responses, except streamed ones and delta syncs.
+    @return: a response, or None for requests it doesn't serve, which the ASGI app hands to media instead
+    """
+    if request.method != 'GET' or request.args.get('stream') == 'true' or 'since' in request.args:
+        return None
+
+    return await media_get_async(request, username)
+
+
+@login_required_async
+async def media_get_async(logged_in_user_id, request, username):
+    """
+    media_get_async is the async version of a GET request to media
+    """
+    user = await get_user_async(username)
+
+    with request.app.app_context():
+        validation_result = validate_url_username(logged_in_user_id, user) or \
+            validate_get_url_parameters(request.args)
+        if validation_result is not None:
+            return validation_result
+
+        not_modified = not_modified_response(user, request.args, request.if_none_match)
+        if not_modified is not None:
+            return not_modified
+
+    return await media_list_response_async(request, user)
+
+
+async def media_list_response_async(request, user):
+    """
+    media_list_response_async is the async version of media_list_response, for the requests media_async serves.
+    Unlike media_list_response it never serves an out of date cached body
+    """
+    medium, consumed_state, after = get_url_filters(request.args)
+    limit = get_url_limit(request.args)
+
+    if limit is None and after is None:
+        variant = (medium, consumed_state)
+        body = await media_cache.get_async(user.id, variant, user.media_version)
+        if body is None:
+            media_list = await get_media_records_async(user.username, medium, consumed_state)
+            with request.app.app_context():
+                body = media_list_body(media_list)
+            await media_cache.set_async(user.id, variant, user.media_version, body)
+
+        with request.app.app_context():
+            return cached_media_list_response(user, request.args, user.media_version, body)
+
+    media_list = await get_media_records_async(user.username, medium, consumed_state, page_fetch_limit(limit), after)
+
+    with request.app.app_context():
+        return media_page_response(user, request.args, media_list, limit)
+
+
+# The helpers below build the media list GET responses of both media and media_async, so only the database calls
+# differ between the two
+
+
+def not_modified_response(user, args, if_none_match):
+    """
+    not_modified_response returns an empty 304 response if the client already has this version of the media list
+    (its ETag is in if_none_match), so no media have to be loaded. The ETag changes whenever this user's media or the
+    url parameters change
+    @return: the 304 response, or None if the media list has to be sent
+    """
+    etag = media_list_etag(user, args)
+    if not if_none_match.contains_weak(etag):
+        return None
+
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def media_list_body(media_list):
+    """
+    media_list_body returns the JSON body (bytes) of a whole media list response, as it's cached in media_cache
+    """
+    return jsonify({
+        'success': True,
+        'message': 'successfully got media for the logged in user',
+        'data': [media.as_dict() for media in media_list]
+    }).get_data()
+
+
+def cached_media_list_response(user, args, media_version, body):
+    """
+    cached_media_list_response returns the response for a media_list_body built at media_version
+    """
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(media_list_etag(user, args, media_version))
+    return response
+
+
+def media_page_response(user, args, media_list, limit):
+    """
+    media_page_response returns the response for a page of the media list (or the rest of it, after a cursor, if
+    limit is None)
+    @param media_list: the media of the page, plus the first media element of the next page if there is one (see
+        page_fetch_limit)
+    """
+    next_cursor = None
+    if limit is not None and len(media_list) > limit:
+        media_list = media_list[:limit]
+        next_cursor = encode_cursor(media_list[-1])
+
+    body = {
+        'success': True,
+        'message': 'successfully got media for the logged in user',
+        'data': [media.as_dict() for media in media_list]
+    }
+    if limit is not None:
+        body['next_cursor'] = next_cursor
+
+    response = jsonify(body)
+    response.set_etag(media_list_etag(user, args))
+    return response
+
+
+def page_fetch_limit(limit):
+    # get one extra media element to find out if there is another page after this one
+    return limit + 1 if limit is not None else None
+
+
+def media_events(username):
+    """
+    media_events is only served by the ASGI app (see media_events_async). Each stream stays open for minutes, and
+    would hold one of a sync server's workers for all that time
+    """
+    return jsonify({
+        'success': False,
+        'message': 'media events are only served by the async server'
+    }), 501
+
+
+@login_required_async
+async def media_events_async(logged_in_user_id, request, username):
+    """
+    media_events_async accepts a GET request and streams a server-sent event to the user specified by username whenever
+    their media change, until the client disconnects or MEDIA_EVENTS_MAX_AGE seconds have passed. Each event's id and
+    data is the user's new media_version. The first event has their current media_version, unless it's the
+    Last-Event-ID the client reconnected with, so a client can tell if it missed changes while it wasn't connected
+    """
+    user = await get_user_async(username)
+
+    with request.app.app_context():
+        validation_result = validate_url_username(logged_in_user_id, user)
+        if validation_result is not None:
+            return validation_result
+
+        keepalive = current_app.config['MEDIA_EVENTS_KEEPALIVE']
+        max_age = current_app.config['MEDIA_EVENTS_MAX_AGE']
+
+    subscription = await media_event_broker.subscribe(user.id)
+    try:
+        # read after subscribing, so a change committed in between is in the stream either way
+        media_version = await get_media_version_async(user.id)
+    except BaseException:
+        subscription.close()
+        raise
+
+    response = Response(media_event_stream(subscription, media_version, request.headers.get('Last-Event-ID'),
+                                           keepalive, max_age),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # tells nginx not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    # the ASGI app closes the response once the stream ends or the client disconnects
+    response.call_on_close(subscription.close)
+    return response
+
+
+async def media_event_stream(subscription, media_version, last_event_id, keepalive, max_age):
+    """
+    media_event_stream yields the server-sent events of a media event stream, with a comment every keepalive seconds
+    without changes, until the subscription is closed or max_age seconds have passed
+    """
+    if last_event_id != str(media_version):
+        yield encode_media_event(media_version)
+
+    deadline = time.monotonic() + max_age
+    while True:
+        timeout = min(keepalive, deadline - time.monotonic())
+        if timeout <= 0:
+            return
+
+        media_version = await subscription.wait(timeout)
+        if subscription.closed:
+            return
+
+        yield encode_media_event(media_version) if media_version is not None else b': keepalive\n\n'
+
+
+def encode_media_event(media_version):
+    return 'id: {}\nevent: media\ndata: {}\n\n'.format(
+        media_version, json.dumps({'media_version': media_version})).encode('utf-8')
+
+
+def get_url_limit(args):
+    """
+    get_url_limit returns the validated 'limit' url parameter as an int, or None if there is none
+    """
+    return int(args['limit']) if 'limit' in args else None
+
+
+def get_url_filters(args, decode_after=True):
+    """
+    get_url_filters reads the filters of a validated media list GET request from its url parameters
+    @param decode_after: if False, after is always None (for requests whose 'after' isn't a media list cursor)
+    @return: a (medium, consumed_state, after) tuple, each None if not set
+    """
+    medium = args.get('medium')
+
+    consumed_state = args.get('consumed-state')
+    # 'not-started' is easier to put into url parameters than 'not started'
+    if consumed_state == 'not-started':
+        consumed_state = 'not started'
+
+    after = None
+    if 'after' in args and decode_after:
+        after = decode_cursor(args.get('after'))
+
+    return medium, consumed_state, after
+
+
 def upsert_media_from_body(body, user):
     """
     upsert_media_from_body takes some dict that represents a media element and the user the media is for, and
     inserts/updates the media
-    @param body: a python dict representing a media element
+    @param body: a python dict representing a media element, already checked with MEDIA_PUT_SCHEMA
     @param user: the currently logged in user
-    @return: The newly inserted/updated media element if there was no error, or a JSON response if there was an issue
-        validating/inserting/updating the media
+    @return: The newly inserted/updated media element
+    @raise UnauthorizedError: if the body has an id of a media element that doesn't belong to the user
     """
-    validation_result = validate_put_body_parameters(body)
-    if validation_result is not None:
-        raise ValueError(validation_result)
-
     medianame = None
     if 'name' in body:
         medianame = body['name']
@@ -188,11 +640,11 @@ def upsert_media_from_body(body, user):
     return media
 
 
-def validate_url_username(logged_in_user, url_user):
+def validate_url_username(logged_in_user_id, url_user):
     """
 
-    validate_url_username checks to see if url_user exists, and if it matches the logged_in_user.
-    @param logged_in_user: a user model representing the currently logged in user
+    validate_url_username checks to see if url_user exists, and if it matches the logged in user.
+    @param logged_in_user_id: the id of the currently logged in user
     @param url_user: a user model representing the user specified in the url
     @return: None if there is no issue, otherwise a JSON response with a detailed message on what was wrong
     """
@@ -203,7 +655,7 @@ def validate_url_username(logged_in_user, url_user):
             'message': 'user doesn\'t exist'
         }), 422
 
-    if logged_in_user != url_user and not current_app.config['LOGIN_DISABLED']:
+    if logged_in_user_id != url_user.id and not current_app.config['LOGIN_DISABLED']:
         # you can't get media for a user you are not logged in as
         return jsonify({
             'success': False,
@@ -211,57 +663,240 @@ def validate_url_username(logged_in_user, url_user):
         }), 401
 
 
-def validate_get_url_parameters():
+def validate_get_url_parameters(args):
     """
     validate_get_url_parameters checks the url parameters specified on a GET request
+    @param args: the request's url parameters
     @return: None if there is no issue, otherwise a JSON response with a detailed message on what was wrong
     """
-    if 'consumed-state' in request.args and request.args.get('consumed-state') not in ['not-started', 'started', 'finished']:
+    if 'consumed-state' in args and args.get('consumed-state') not in ['not-started', 'started', 'finished']:
         return jsonify({
             'success': False,
             'message': 'consumed-state url parameter must be \'not-started\', \'started\',  or \'finished\''
         }), 422
 
-    if 'medium' in request.args and request.args.get('medium') not in mediums:
+    if 'medium' in args and args.get('medium') not in mediums:
         return jsonify({
             'success': False,
             'message': 'medium url parameter must be \'film\', \'audio\', \'literature\', or \'other\''
         }), 422
 
+    if 'limit' in args and (not args.get('limit').isdecimal() or int(args.get('limit')) < 1):
+        return jsonify({
+            'success': False,
+            'message': 'limit url parameter must be a positive integer'
+        }), 422
+
+    if 'stream' in args and args.get('stream') not in ['true', 'false']:
+        return jsonify({
+            'success': False,
+            'message': 'stream url parameter must be \'true\' or \'false\''
+        }), 422
+
+    if 'after' in args and decode_cursor(args.get('after')) is None:
+        return jsonify({
+            'success': False,
+            'message': 'after url parameter must be a cursor returned as next_cursor'
+        }), 422
+
+    if 'since' in args and not args.get('since').isdecimal():
+        return jsonify({
+            'success': False,
+            'message': 'since url parameter must be a non-negative integer'
+        }), 422
+
+    if 'since' in args and len(args) > 1:
+        return jsonify({
+            'success': False,
+            'message': 'since url parameter can\'t be combined with other url parameters'
+        }), 422
+
+
+def validate_search_url_parameters(args):
+    """
+    validate_search_url_parameters checks the url parameters specified on a search GET request
+    @param args: the request's url parameters
+    @return: None if there is no issue, otherwise a JSON response with a detailed message on what was wrong
+    """
+    if not args.get('q', '').strip():
+        return jsonify({
+            'success': False,
+            'message': 'missing url parameter \'q\''
+        }), 422
+
+    if len(args.get('q')) > current_app.config['MEDIA_SEARCH_MAX_LENGTH']:
+        return jsonify({
+            'success': False,
+            'message': 'q url parameter must be at most {} characters'.format(
+                current_app.config['MEDIA_SEARCH_MAX_LENGTH'])
+        }), 422
+
+    if 'after' in args and decode_search_cursor(args.get('after')) is None:
+        return jsonify({
+            'success': False,
+            'message': 'after url parameter must be a cursor returned as next_cursor'
+        }), 422
+
+    # the other parameters are checked the same way as on a media list GET
+    return validate_get_url_parameters({key: value for key, value in args.items()
+                                        if key in ('medium', 'consumed-state', 'limit')})
+
+
+def validate_autocomplete_url_parameters(args):
+    """
+    validate_autocomplete_url_parameters checks the url parameters specified on an autocomplete GET request
+    @param args: the request's url parameters
+    @return: None if there is no issue, otherwise a JSON response with a detailed message on what was wrong
+    """
+    if 'q' not in args:
+        return jsonify({
+            'success': False,
+            'message': 'missing url parameter \'q\''
+        }), 422
+
+    if len(args.get('q')) > current_app.config['AUTOCOMPLETE_MAX_LENGTH']:
+        return jsonify({
+            'success': False,
+            'message': 'q url parameter must be at most {} characters'.format(
+                current_app.config['AUTOCOMPLETE_MAX_LENGTH'])
+        }), 422
+
+    if 'limit' in args and (not args.get('limit').isdecimal() or
+                            not 1 <= int(args.get('limit')) <= current_app.config['AUTOCOMPLETE_MAX_LIMIT']):
+        return jsonify({
+            'success': False,
+            'message': 'limit url parameter must be a positive integer up to {}'.format(
+                current_app.config['AUTOCOMPLETE_MAX_LIMIT'])
+        }), 422
+
+
+def media_list_etag(user, args, media_version=None):
+    """
+    media_list_etag returns the ETag of a media list GET response for this user, made from the user's media_version
+    (or the given older media_version the response was built at) and the url parameters
+    """
+    if media_version is None:
+        media_version = user.media_version
+
+    args = '&'.join('{}={}'.format(key, value) for key, value in sorted(args.items(multi=True)))
+    return '{}-{}-{}'.format(user.id, media_version, hashlib.sha1(args.encode('utf-8')).hexdigest()[:16])
+
+
+def stream_media_list_json(message, media_list, chunk_size=65536):
+    """
+    stream_media_list_json generates the same JSON as a successful media list response, encoding one media element
+    at a time and yielding the JSON in chunks of about chunk_size characters
+    @param media_list: an iterable of media elements
+    """
+    # compact separators, like jsonify
+    encoder = current_app.json_encoder(separators=(',', ':'))
+
+    chunk = ['{"success":true,"message":', encoder.encode(message), ',"data":[']
+    chunk_length = 0
+    separator = ''
+
+    for media in media_list:
+        encoded = encoder.encode(media.as_dict())
+        chunk.append(separator)
+        chunk.append(encoded)
+        separator = ','
+        chunk_length += len(encoded) + 1
+
+        if chunk_length >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            chunk_length = 0
+
+    chunk.append(']}')
+    yield ''.join(chunk)
+
+
+def encode_cursor(media):
+    """
+    encode_cursor returns an opaque pagination cursor pointing just after the given media element
+    """
+    return base64.urlsafe_b64encode('{}:{}'.format(media.rank, media.id).encode('utf-8')).decode('utf-8')
+
 
-def validate_put_body_parameters(body):
+def decode_cursor(cursor):
     """
-    validate_put_body_parameters checks the body JSON, and makes sure the parameters are the correct type
+    decode_cursor takes a cursor made by encode_cursor and returns the (rank, id) pair it points after
+    @return: a (rank, id) tuple, or None if the cursor is malformed
+    """
+    try:
+        rank, id = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8').split(':')
+        if not is_rank(rank):
+            return None
+        return rank, int(id)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+def encode_search_cursor(media, search_rank):
+    """
+    encode_search_cursor returns an opaque pagination cursor pointing just after the given search match
+    """
+    return base64.urlsafe_b64encode('{!r}:{}'.format(search_rank, media.id).encode('utf-8')).decode('utf-8')
+
+
+def decode_search_cursor(cursor):
+    """
+    decode_search_cursor takes a cursor made by encode_search_cursor and returns the (search rank, id) pair it points
+    after
+    @return: a (search rank, id) tuple, or None if the cursor is malformed
+    """
+    try:
+        search_rank, id = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8').split(':')
+        search_rank = float(search_rank)
+        if not math.isfinite(search_rank):
+            return None
+        return search_rank, int(id)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+def validate_put_body(body):
+    """
+    validate_put_body checks a PUT body, a media element or an array of them, against MEDIA_PUT_SCHEMA
+    @return: None if there is no issue, otherwise a JSON response with the first error as its message, and every error
+        in 'errors' (each with the 'index' of its media element if the body is an array)
+    """
+    if isinstance(body, list):
+        errors = MEDIA_PUT_SCHEMA.batch_errors(body)
+    else:
+        errors = MEDIA_PUT_SCHEMA.errors(body)
+
+    if errors:
+        return jsonify({
+            'success': False,
+            'message': errors[0]['message'],
+            'errors': errors
+        }), 422
+
+
+def validate_move_body_parameters(body):
+    """
+    validate_move_body_parameters checks the body JSON of a move, and makes sure the parameters are the correct type
     @return: None if there is no issue, otherwise a string with a detailed message on what was wrong
     """
-    if 'id' not in body and 'name' not in body:
-        # If id isn't in body, then this must be a new media element, and name is required
-        return 'missing parameter \'name\' or parameter \'id\''
+    if not isinstance(body, dict) or 'id' not in body:
+        return 'missing parameter \'id\''
 
-    if 'id' in body and not isinstance(body['id'], int):
-        # return malformed parameters response if 'id' is not of type integer
+    if not isinstance(body['id'], int):
         return 'id parameter must be type integer'
 
-    if 'name' in body and not isinstance(body['name'], str):
-        # return malformed parameters response if 'name' is not of type string
-        return 'name parameter must be type string'
+    if body.get('after') is None and body.get('before') is None:
+        return 'missing parameter \'after\' or parameter \'before\''
 
-    if 'medium' in body and body['medium'] not in mediums:
-        # return malformed parameters response if 'medium' isn't a valid medium type
-        return 'medium parameter must be \'film\', \'audio\', \'literature\', or \'other\''
+    for key in ('after', 'before'):
+        if body.get(key) is not None and not isinstance(body[key], int):
+            return '{} parameter must be type integer'.format(key)
 
-    if 'consumed_state' in body and body['consumed_state'] not in consumed_states:
-        # return malfromed parameters response if 'consumed_state' isn't a valid consumed state
-        return 'consumed_state parameter must be \'not started\', \'started\', or \'finished\''
+    if body['id'] in (body.get('after'), body.get('before')):
+        return 'media can\'t be moved next to itself'
 
-    if 'description' in body and not isinstance(body['description'], str):
-        # return malformed parameters response if 'description' isn't of type string
-        return 'description parameter must be type string'
-
-    if 'order' in body and not isinstance(body['order'], int):
-        # TODO validate the range of this number?
-        # return malformed parameters response if 'order' isn't of type int
-        return 'order parameter must be type integer'
+    if body.get('after') == body.get('before'):
+        return 'after and before parameters must be different media'
 
 
 def validate_delete_body_parameters(body):
@@ -269,15 +904,39 @@ def validate_delete_body_parameters(body):
     validate_delete_body_parameters checks the body JSON, and makes sure the parameters are the correct type
     @return: None if there is no issue, otherwise a JSON response with a detailed message on what was wrong
     """
-    if 'id' not in body:
-        # return malformed parameters response if 'id' isn't present
+    if not isinstance(body, dict) or not any(key in body for key in ('id', 'medium', 'consumed_state')):
+        # return malformed parameters response if there is nothing to say which media to delete
         return jsonify({
             'success': False,
-            'message': 'missing parameter \'id\''
+            'message': 'missing parameter \'id\', \'medium\' or \'consumed_state\''
         }), 422
-    elif not isinstance(body['id'], int):
+
+    if 'id' in body and isinstance(body['id'], list):
+        if not all(isinstance(id, int) for id in body['id']):
+            # return malformed parameters response if 'id' is a list of anything other than integers
+            return jsonify({
+                'success': False,
+                'message': 'id parameter must be a list of integers'
+            }), 422
+    elif 'id' in body and not isinstance(body['id'], int):
         # return malformed parameters response if 'id' isn't of type integer
         return jsonify({
             'success': False,
             'message': 'id parameter must be type integer'
         }), 422
+
+    # checking the type first means an unhashable value (like a list) never reaches the set lookup
+    if 'medium' in body and (not isinstance(body['medium'], str) or body['medium'] not in mediums):
+        # return malformed parameters response if 'medium' isn't a valid medium type
+        return jsonify({
+            'success': False,
+            'message': 'medium parameter must be \'film\', \'audio\', \'literature\', or \'other\''
+        }), 422
+
+    if 'consumed_state' in body and (not isinstance(body['consumed_state'], str) or
+                                     body['consumed_state'] not in consumed_states):
+        # return malformed parameters response if 'consumed_state' isn't a valid consumed state
+        return jsonify({
+            'success': False,
+            'message': 'consumed_state parameter must be \'not started\', \'started\', or \'finished\''
+        }), 422
@@ -0,0 +1,10 @@
+from metrics import generate_metrics
+
+
+def metrics():
+    """
+    metrics returns the server's metrics (aggregated across all gunicorn workers) in the prometheus text format
+    """
+    body, content_type = generate_metrics()
+
+    return body, 200, {'Content-Type': content_type}
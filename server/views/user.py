@@ -1,9 +1,10 @@
 from flask import request, jsonify, session
 from database import db
 
-from models.blacklisted_token import BlacklistedToken
+from models.user import User
+from password_hashing import PasswordHashingBusyError, password_hasher
 
-from logic.user import add_user, get_user
+from logic.user import add_user, get_user, add_user_async, get_user_async, revoke_auth_tokens
 from logic.login import login_required
 
 
@@ -13,36 +14,20 @@ def register():
     """
     body = request.get_json()
 
-    if 'username' not in body:
-        return jsonify({
-            'success': False,
-            'message': 'missing parameter \'username\''
-        }), 422
-    if 'password' not in body:
-        return jsonify({
-            'success': False,
-            'message': 'missing parameter \'password\''
-        }), 422
-
-    username = body['username']
-    password = body['password']
+    validation_result = validate_credentials_body(body)
+    if validation_result is not None:
+        return validation_result
 
     # If this user exists already
-    if get_user(username):
-        return jsonify({
-            'success': False,
-            'message': 'username taken'
-        }), 422
+    if get_user(body['username']):
+        return username_taken_response()
 
-    user = add_user(username, password)
+    try:
+        user = add_user(body['username'], body['password'])
+    except PasswordHashingBusyError as e:
+        return password_hashing_busy_response(e)
 
-    auth_token = user.encode_auth_token()
-
-    return jsonify({
-        'success': True,
-        'message': 'user successfully registered',
-        'auth_token': auth_token
-    }), 201
+    return registered_response(user.id, user.token_generation)
 
 
 def login():
@@ -52,55 +37,157 @@ def login():
     """
     body = request.get_json()
 
+    validation_result = validate_credentials_body(body)
+    if validation_result is not None:
+        return validation_result
+
+    user = get_user(body['username'])
+    if user is None:
+        return user_doesnt_exist_response()
+
+    try:
+        authenticated = user.authenticate_password(body['password'])
+    except PasswordHashingBusyError as e:
+        return password_hashing_busy_response(e)
+
+    if authenticated:
+        user.authenticated = True
+        db.session.commit()
+
+    return login_response(user.id, user.token_generation, authenticated)
+
+
+async def register_async(request):
+    """
+    register_async is the async version of register, used by the ASGI app (see asgi.py)
+    @return: a response, or None if the body isn't a JSON object, which the ASGI app hands to register instead
+    """
+    body = request.get_json()
+    if not isinstance(body, dict):
+        return None
+
+    validation_result = validate_credentials_body(body)
+    if validation_result is not None:
+        return validation_result
+
+    if await get_user_async(body['username']):
+        return username_taken_response()
+
+    try:
+        user = await add_user_async(body['username'], body['password'])
+    except PasswordHashingBusyError as e:
+        return password_hashing_busy_response(e)
+
+    with request.app.app_context():
+        return registered_response(user.id, user.token_generation)
+
+
+async def login_async(request):
+    """
+    login_async is the async version of login, used by the ASGI app (see asgi.py)
+    @return: a response, or None if the body isn't a JSON object, which the ASGI app hands to login instead
+    """
+    body = request.get_json()
+    if not isinstance(body, dict):
+        return None
+
+    validation_result = validate_credentials_body(body)
+    if validation_result is not None:
+        return validation_result
+
+    user = await get_user_async(body['username'])
+    if user is None:
+        return user_doesnt_exist_response()
+
+    try:
+        authenticated = await password_hasher.check_password_async(body['password'], user.passhash)
+    except PasswordHashingBusyError as e:
+        return password_hashing_busy_response(e)
+
+    with request.app.app_context():
+        return login_response(user.id, user.token_generation, authenticated)
+
+
+# The helpers below build the responses shared by the views above and their async versions. They return plain dicts
+# (which Flask and the ASGI app both turn into JSON responses), so only the ones that encode an auth token need an app
+# context
+
+
+def validate_credentials_body(body):
+    """
+    validate_credentials_body checks that a register or login body has a username and a password
+    @return: None if there is no issue, otherwise a response with a detailed message on what was wrong
+    """
     if 'username' not in body:
-        return jsonify({
+        return {
             'success': False,
             'message': 'missing parameter \'username\''
-        }), 422
+        }, 422
     if 'password' not in body:
-        return jsonify({
+        return {
             'success': False,
             'message': 'missing parameter \'password\''
-        }), 422
+        }, 422
 
-    username = body['username']
-    password = body['password']
+    return None
 
-    user = get_user(username)
 
-    if user:
-        if user.authenticate_password(password):
-            user.authenticated = True
-            db.session.commit()
-
-            auth_token = user.encode_auth_token()
+def username_taken_response():
+    return {
+        'success': False,
+        'message': 'username taken'
+    }, 422
 
-            return jsonify({
-                'success': True,
-                'message': 'user successfully logged in',
-                'auth_token': auth_token
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'message': 'incorrect password'
-            }), 401
 
-    return jsonify({
+def user_doesnt_exist_response():
+    return {
         'success': False,
         'message': 'user doesn\'t exist'
-    }), 422
+    }, 422
+
+
+def password_hashing_busy_response(error):
+    return {
+        'success': False,
+        'message': str(error)
+    }, 503
+
+
+def registered_response(user_id, token_generation):
+    """
+    registered_response returns the response for a newly registered user, with an auth token for them
+    """
+    return {
+        'success': True,
+        'message': 'user successfully registered',
+        'auth_token': User.encode_auth_token_for(user_id, token_generation)
+    }, 201
+
+
+def login_response(user_id, token_generation, authenticated):
+    """
+    login_response returns the response for a login with a correct (authenticated) or incorrect password, with an auth
+    token for the user if it was correct
+    """
+    if not authenticated:
+        return {
+            'success': False,
+            'message': 'incorrect password'
+        }, 401
+
+    return {
+        'success': True,
+        'message': 'user successfully logged in',
+        'auth_token': User.encode_auth_token_for(user_id, token_generation)
+    }
 
 
 @login_required
-def logout(logged_in_user):
+def logout(logged_in_user_id):
     """
-    logout logs the current user out
+    logout logs the current user out, of every session they're logged in to (see revoke_auth_tokens)
     """
-    auth_token = request.headers.get('Authorization').split(' ')[1]
-    blacklisted_token = BlacklistedToken(auth_token)
-    db.session.add(blacklisted_token)
-    db.session.commit()
+    revoke_auth_tokens(logged_in_user_id)
 
     return jsonify({
         'success': True,